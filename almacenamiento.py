@@ -0,0 +1,144 @@
+"""
+Almacenamiento de archivos subidos direccionado por contenido.
+
+Cada archivo se guarda bajo su hash SHA-256 (clave "<sha256>.<extensión>"),
+calculado mientras se copia a disco. Así:
+- Subir dos veces el mismo contenido ocupa espacio una sola vez.
+- No hay colisiones de nombres entre subidas simultáneas.
+- Una URL nunca cambia de contenido, por lo que se sirve con caché de un año
+  ("immutable").
+
+Las referencias desde la BD se cuentan en la tabla archivo (ver archivos.py) y
+los archivos sin referencias los borra limpiar_archivos.py.
+
+Backends (ALMACEN_URL):
+- vacía o file:///ruta -> AlmacenLocal, disco local, servido por /media/<clave>.
+- Otro backend (ej: un object store) debe implementar la misma interfaz:
+  guardar, abrir, existe, borrar, listar y url.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+from urllib.parse import urlparse
+
+BLOQUE = 1024 * 1024
+PATRON_CLAVE = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]{1,5}$')
+
+
+def es_clave(texto):
+    return bool(PATRON_CLAVE.match(texto or ''))
+
+
+def copiar_con_hash(origen, destino):
+    """Copia el stream `origen` al archivo abierto `destino` por bloques. Retorna (sha256, bytes)."""
+    sha256 = hashlib.sha256()
+    tamano = 0
+    while True:
+        bloque = origen.read(BLOQUE)
+        if not bloque:
+            break
+        sha256.update(bloque)
+        destino.write(bloque)
+        tamano += len(bloque)
+    destino.flush()
+    os.fsync(destino.fileno())
+    return sha256.hexdigest(), tamano
+
+
+def guardar_con_hash(origen, ruta):
+    """Escribe el stream en `ruta` (de forma atómica) y retorna (sha256, bytes)."""
+    carpeta = os.path.dirname(ruta)
+    fd, temporal = tempfile.mkstemp(dir=carpeta, prefix='.subiendo_')
+    try:
+        with os.fdopen(fd, 'wb') as destino:
+            resultado = copiar_con_hash(origen, destino)
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return resultado
+
+
+class AlmacenLocal:
+
+    def __init__(self, carpeta, url_base='/media'):
+        self.carpeta = carpeta
+        self.url_base = url_base.rstrip('/')
+        os.makedirs(carpeta, exist_ok=True)
+
+    def ruta(self, clave):
+        if not es_clave(clave):
+            raise ValueError(f"Clave de archivo inválida: {clave!r}")
+        # Subcarpetas por los 2 primeros caracteres para no tener 100k archivos en un directorio
+        return os.path.join(self.carpeta, clave[:2], clave)
+
+    def guardar(self, origen, extension):
+        """Guarda el stream `origen` y retorna (clave, bytes). Si ya existía no se duplica."""
+        fd, temporal = tempfile.mkstemp(dir=self.carpeta, prefix='.subiendo_')
+        try:
+            with os.fdopen(fd, 'wb') as destino:
+                sha256, tamano = copiar_con_hash(origen, destino)
+            clave = f"{sha256}.{extension.lower()}"
+            ruta = self.ruta(clave)
+            if os.path.exists(ruta):
+                os.remove(temporal)
+                # Renovamos la fecha para que el recolector no lo borre mientras se registra la referencia
+                os.utime(ruta)
+            else:
+                os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                os.replace(temporal, ruta)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        return clave, tamano
+
+    def abrir(self, clave):
+        return open(self.ruta(clave), 'rb')
+
+    def existe(self, clave):
+        return os.path.exists(self.ruta(clave))
+
+    def borrar(self, clave, sin_modificar_desde=None):
+        """
+        Borra el archivo. Con `sin_modificar_desde` (epoch) solo lo borra si no
+        se volvió a guardar después de esa fecha. Retorna True si lo borró.
+        """
+        ruta = self.ruta(clave)
+        try:
+            if sin_modificar_desde is not None and os.path.getmtime(ruta) > sin_modificar_desde:
+                return False
+            os.remove(ruta)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def listar(self):
+        """Genera (clave, fecha de modificación) de todos los archivos guardados."""
+        for subcarpeta in os.scandir(self.carpeta):
+            if not subcarpeta.is_dir():
+                continue
+            for archivo in os.scandir(subcarpeta.path):
+                if es_clave(archivo.name):
+                    yield archivo.name, archivo.stat().st_mtime
+
+    def limpiar_temporales(self, antes_de=None):
+        """Borra las escrituras interrumpidas (ej: el proceso murió a mitad de una subida)."""
+        antes_de = antes_de if antes_de is not None else time.time() - 3600
+        for archivo in os.scandir(self.carpeta):
+            if archivo.name.startswith('.subiendo_') and archivo.stat().st_mtime < antes_de:
+                os.remove(archivo.path)
+
+    def url(self, clave):
+        return f"{self.url_base}/{clave}"
+
+
+def crear_almacen(url, carpeta_por_defecto):
+    if not url:
+        return AlmacenLocal(carpeta_por_defecto)
+    if url.startswith('file://'):
+        return AlmacenLocal(urlparse(url).path)
+    raise RuntimeError(f"ALMACEN_URL no soportada: {url}")
@@ -1,14 +1,25 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 from flask_socketio import SocketIO
+from cola_socketio import crear_gestor_clientes
+from json_rapido import ProveedorJSONRapido
+from compresion import registrar_compresion
+from metricas import registrar_metricas
+from presupuesto_consultas import registrar_presupuesto_consultas
 
 load_dotenv()
 
 app = Flask(__name__)
+# jsonify() con orjson si está instalado (ver json_rapido.py)
+app.json = ProveedorJSONRapido(app)
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -19,6 +30,22 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 # Límite de tamaño (opcional, ej: 16MB)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
+# Fotos del portafolio (ver imagenes.py y cola_imagenes.py): la original espera
+# en una carpeta privada hasta que se generan las variantes, una por ancho en WebP y JPEG
+app.config['PORTAFOLIO_PENDIENTES_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads_pendientes')
+os.makedirs(app.config['PORTAFOLIO_PENDIENTES_FOLDER'], exist_ok=True)
+app.config['PORTAFOLIO_ANCHOS'] = (320, 640, 1280)
+app.config['PORTAFOLIO_CALIDAD'] = 80
+app.config['PORTAFOLIO_PIXELES_MAX'] = 50_000_000
+app.config['PORTAFOLIO_CONCURRENCIA'] = 2
+
+# Almacén de archivos por contenido (ver almacenamiento.py): vacía = disco local
+# en MEDIA_FOLDER, servido en /media/<sha256>.<ext>. limpiar_archivos.py borra
+# los que llevan ARCHIVOS_GC_GRACIA_HORAS sin referencias
+app.config['MEDIA_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media')
+app.config['ALMACEN_URL'] = os.getenv("ALMACEN_URL")
+app.config['ARCHIVOS_GC_GRACIA_HORAS'] = 24
+
 # --- CONFIGURACIÓN ---
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL or not DATABASE_URL.startswith("postgresql://"):
@@ -27,16 +54,101 @@ if not DATABASE_URL or not DATABASE_URL.startswith("postgresql://"):
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY")
+# Contraseñas (ver contrasenas.py): formato completo de werkzeug, los hashes con
+# otros parámetros se recalculan al iniciar sesión
+app.config['PASSWORD_HASH_METODO'] = os.getenv("PASSWORD_HASH_METODO", "scrypt:32768:8:1")
+app.config['PASSWORD_CONCURRENCIA'] = int(os.getenv("PASSWORD_CONCURRENCIA", 4))
 app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {"pool_pre_ping": True}) 
 
+# Segundos antes de reconstruir el índice espacial de proveedores desde la BD
+app.config['GEO_INDICE_TTL'] = int(os.getenv("GEO_INDICE_TTL", 300))
+
+# Búsqueda de proveedores cercanos: 'sql' (filtra y ordena en Postgres),
+# 'indice' (grilla en memoria) o 'numpy' (distancias vectorizadas en memoria)
+app.config['CERCANOS_BACKEND'] = os.getenv("CERCANOS_BACKEND", "sql")
+# Sin radio_km la búsqueda no tiene tope de distancia; en 'sql' se prueba primero
+# con CERCANOS_RADIO_KM, luego con CERCANOS_RADIO_MAX_KM y por último sin rectángulo
+app.config['CERCANOS_RADIO_KM'] = 50
+app.config['CERCANOS_RADIO_MAX_KM'] = 500
+app.config['CERCANOS_LIMITE_MAX'] = 100
+
+# Máximo de resultados por página en /api/buscar
+app.config['BUSCAR_LIMITE_MAX'] = 50
+
+# Elementos por página del historial de chat (y máximo que se puede pedir)
+app.config['HISTORIAL_PAGINA'] = 50
+app.config['HISTORIAL_LIMITE_MAX'] = 200
+
+# Conversaciones por página en la bandeja de entrada (y máximo que se puede pedir)
+app.config['BANDEJA_PAGINA'] = 30
+app.config['BANDEJA_LIMITE_MAX'] = 100
+
+# Cache de respuestas (perfil público de proveedores). RESPUESTAS_CACHE_URL
+# (ej: redis://...) la comparte entre procesos; sin ella es solo en memoria
+app.config['RESPUESTAS_CACHE_MAX_ITEMS'] = 2000
+app.config['RESPUESTAS_CACHE_TTL'] = 300
+app.config['RESPUESTAS_CACHE_TTL_LOCAL'] = 5
+app.config['RESPUESTAS_CACHE_URL'] = os.getenv("RESPUESTAS_CACHE_URL")
+
+# Segundos antes de reconstruir el trie de /api/autocompletar desde la BD
+app.config['AUTOCOMPLETAR_TTL'] = int(os.getenv("AUTOCOMPLETAR_TTL", 300))
+
+# Cache de geocodificación (segundos de vigencia para resultados encontrados / no encontrados)
+app.config['GEOCACHE_MAX_ITEMS'] = 10000
+app.config['GEOCACHE_TTL'] = 30 * 86400
+app.config['GEOCACHE_TTL_NEGATIVO'] = 86400
+
+# Geocodificación: backend ('nominatim' o 'local' para tests/desarrollo sin red)
+# y si se resuelve en segundo plano (True) o dentro del request (False)
+app.config['GEOCODER'] = os.getenv("GEOCODER", "nominatim")
+app.config['GEOCODING_ASINCRONO'] = os.getenv("GEOCODING_ASINCRONO", "1") == "1"
+app.config['GEOCODING_CONCURRENCIA'] = 2
+app.config['GEOCODING_POR_SEGUNDO'] = 1.0
+
+# Escritura diferida de mensajes de chat (ver buffer_mensajes.py): se emiten al
+# instante y se insertan en lotes cada MENSAJES_FLUSH_MS o cada MENSAJES_LOTE_MAX mensajes
+app.config['MENSAJES_WRITE_BEHIND'] = os.getenv("MENSAJES_WRITE_BEHIND", "0") == "1"
+app.config['MENSAJES_FLUSH_MS'] = 20
+app.config['MENSAJES_LOTE_MAX'] = 200
+app.config['MENSAJES_BUFFER_CAPACIDAD'] = 5000
+
+# Cola de mensajes de Socket.IO para correr varios procesos (ver servidor.py):
+# vacía = un solo proceso; redis://..., amqp://... o postgresql://... (LISTEN/NOTIFY)
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+# Log de cada paquete de Socket.IO/Engine.IO: solo para depurar, es caro con carga
+app.config['SOCKETIO_LOGS'] = os.getenv("SOCKETIO_LOGS", "0") == "1"
+
+# Métricas de Prometheus en /metrics (ver metricas.py). Con METRICAS_TOKEN se
+# exige "Authorization: Bearer <token>" para leerlas
+app.config['METRICAS_HABILITADAS'] = os.getenv("METRICAS_HABILITADAS", "0") == "1"
+app.config['METRICAS_TOKEN'] = os.getenv("METRICAS_TOKEN")
+
+# Presupuesto de consultas SQL por ruta y detección de N+1 (ver presupuesto_consultas.py):
+# vacío = apagado, 'aviso' = imprime los excesos, 'error' = la petición falla
+app.config['PRESUPUESTO_CONSULTAS_MODO'] = os.getenv("PRESUPUESTO_CONSULTAS_MODO", "")
+app.config['PRESUPUESTO_CONSULTAS_DEFECTO'] = 10
+app.config['PRESUPUESTO_REPETICIONES'] = 3
+registrar_presupuesto_consultas(app)
+
+# Compresión gzip/brotli de respuestas de texto desde este tamaño (0 = desactivada,
+# ej: si ya comprime nginx). Ver compresion.py
+app.config['COMPRESION_MIN_BYTES'] = int(os.getenv("COMPRESION_MIN_BYTES", 1024))
+app.config['COMPRESION_NIVEL_GZIP'] = 6
+app.config['COMPRESION_CALIDAD_BROTLI'] = 4
+registrar_compresion(app)
+
 db = SQLAlchemy(app)
+# Migraciones del esquema (carpeta migrations/): flask --app app db upgrade
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
 
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
-    logger=True,
-    engineio_logger=True
+    logger=app.config['SOCKETIO_LOGS'],
+    engineio_logger=app.config['SOCKETIO_LOGS'],
+    client_manager=crear_gestor_clientes(app.config['SOCKETIO_MESSAGE_QUEUE'])
 )
+registrar_metricas(app, socketio)
 
 # --- MODELOS ---
 
@@ -49,9 +161,10 @@ class Usuario(db.Model):
     direccion = db.Column(db.String(255)) 
     lat = db.Column(db.Float)
     lon = db.Column(db.Float)
+    geocode_estado = db.Column(db.String(20)) # PENDIENTE, OK o FALLIDO
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, app.config['PASSWORD_HASH_METODO'])
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -69,21 +182,81 @@ class Proveedor(db.Model):
     atiende_urgencias = db.Column(db.Boolean, default=False)
     lat = db.Column(db.Float)
     lon = db.Column(db.Float)
+    geocode_estado = db.Column(db.String(20)) # PENDIENTE, OK o FALLIDO
+
+    # Agregados de Calificacion, mantenidos por api_calificar (recalcular_calificaciones.py los reconcilia)
+    calif_suma = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    calif_total = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    calif_promedio = db.Column(db.Float, nullable=False, default=0, server_default='0')
+
+    # Documento de búsqueda de texto (ver configuración zerby_es más abajo).
+    # Diferido: solo se usa en el WHERE, no hace falta traerlo en cada consulta.
+    busqueda = deferred(db.Column(TSVECTOR, db.Computed(
+        "setweight(to_tsvector('zerby_es', coalesce(oficio, '')), 'A') || "
+        "setweight(to_tsvector('zerby_es', coalesce(descripcion, '')), 'B') || "
+        "setweight(to_tsvector('zerby_es', coalesce(direccion, '')), 'C')",
+        persisted=True
+    )))
+
+    __table_args__ = (
+        db.Index('ix_proveedor_lat_lon', 'lat', 'lon'),
+        db.Index('ix_proveedor_busqueda', 'busqueda', postgresql_using='gin'),
+    )
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, app.config['PASSWORD_HASH_METODO'])
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+# --- BÚSQUEDA DE TEXTO ---
+# zerby_es: español con stemming y sin tildes ("gasfíter" == "gasfiter").
+# f_unaccent: envoltorio IMMUTABLE de unaccent para poder usarlo en índices.
+# El índice de trigramas sobre el oficio permite encontrar términos con errores de tipeo.
+SQL_BUSQUEDA_TEXTO = """
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'zerby_es') THEN
+        CREATE TEXT SEARCH CONFIGURATION zerby_es (COPY = spanish);
+        ALTER TEXT SEARCH CONFIGURATION zerby_es
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    END IF;
+END
+$$;
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent', $1) $$;
+"""
+SQL_INDICE_TRIGRAMAS = """
+CREATE INDEX IF NOT EXISTS ix_proveedor_oficio_trgm
+    ON proveedor USING gin (f_unaccent(lower(oficio)) gin_trgm_ops);
+"""
+event.listen(Proveedor.__table__, 'before_create', DDL(SQL_BUSQUEDA_TEXTO))
+event.listen(Proveedor.__table__, 'after_create', DDL(SQL_INDICE_TRIGRAMAS))
+
 class Conversacion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
     proveedor_id = db.Column(db.Integer, db.ForeignKey('proveedor.id'), nullable=False)
+    # Último mensaje leído por cada participante (para contar los no leídos), como posición
+    # (timestamp, id) del historial: con write-behind cada worker reserva ids por bloques, así
+    # que el id solo no sigue el orden de los mensajes
+    leido_usuario_ts = db.Column(db.DateTime, nullable=False, default=datetime(1970, 1, 1), server_default='1970-01-01')
+    leido_usuario_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    leido_proveedor_ts = db.Column(db.DateTime, nullable=False, default=datetime(1970, 1, 1), server_default='1970-01-01')
+    leido_proveedor_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     mensajes = db.relationship('Mensaje', backref='conversacion', lazy=True, cascade="all, delete-orphan")
     usuario = db.relationship('Usuario', backref='conversaciones')
     proveedor = db.relationship('Proveedor', backref='conversaciones')
 
+    # Bandeja del cliente / iniciar_chat (usuario_id, proveedor_id) y bandeja del proveedor
+    __table_args__ = (
+        db.Index('ix_conversacion_usuario_proveedor', 'usuario_id', 'proveedor_id'),
+        db.Index('ix_conversacion_proveedor', 'proveedor_id'),
+    )
+
 class Mensaje(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     conversacion_id = db.Column(db.Integer, db.ForeignKey('conversacion.id'), nullable=False)
@@ -92,6 +265,11 @@ class Mensaje(db.Model):
     contenido = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
 
+    # Historial paginado: mismo orden (timestamp, id) que los cursores
+    __table_args__ = (
+        db.Index('ix_mensaje_conversacion_timestamp', 'conversacion_id', 'timestamp', 'id'),
+    )
+
 class Calificacion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     puntuacion = db.Column(db.Integer, nullable=False)
@@ -102,7 +280,9 @@ class Calificacion(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('usuario_id', 'proveedor_id', name='uq_usuario_proveedor_calificacion'),
-        db.CheckConstraint('puntuacion >= 1 AND puntuacion <= 7', name='check_puntuacion_range')
+        db.CheckConstraint('puntuacion >= 1 AND puntuacion <= 7', name='check_puntuacion_range'),
+        # Reseñas del perfil, de la más nueva a la más antigua
+        db.Index('ix_calificacion_proveedor_timestamp', 'proveedor_id', 'timestamp'),
     )
 
 class Portafolio(db.Model):
@@ -111,8 +291,30 @@ class Portafolio(db.Model):
     imagen_url = db.Column(db.Text, nullable=False) 
     descripcion = db.Column(db.Text, nullable=True) 
     timestamp = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    estado = db.Column(db.String(20), nullable=False, default='LISTO', server_default='LISTO') # PROCESANDO, LISTO o FALLIDO
+    # [{"ancho", "alto", "webp", "jpeg"}] de menor a mayor; NULL en fotos subidas antes del procesamiento
+    variantes = db.Column(db.JSON(none_as_null=True), nullable=True)
+    # SHA-256 de la foto subida: una segunda subida del mismo archivo reutiliza las variantes
+    original_sha256 = db.Column(db.String(64), nullable=True)
     proveedor = db.relationship('Proveedor', backref=db.backref('portafolios', lazy=True, cascade="all, delete-orphan"))
 
+    __table_args__ = (
+        db.Index('ix_portafolio_proveedor_timestamp', 'proveedor_id', 'timestamp'),
+        db.Index('ix_portafolio_original_sha256', 'original_sha256'),
+    )
+
+class Archivo(db.Model):
+    """Archivo del almacén (ver almacenamiento.py) y cuántas filas lo usan (ver archivos.py)."""
+    clave = db.Column(db.String(80), primary_key=True) # <sha256>.<extensión>
+    referencias = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    creado = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    sin_referencias_desde = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # El recolector solo mira las que quedaron sin referencias
+        db.Index('ix_archivo_sin_referencias', 'sin_referencias_desde', postgresql_where=db.text('referencias = 0')),
+    )
+
 class Trabajo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     conversacion_id = db.Column(db.Integer, db.ForeignKey('conversacion.id'), nullable=False)
@@ -134,6 +336,18 @@ class Trabajo(db.Model):
     proveedor = db.relationship('Proveedor', backref='trabajos')
     conversacion = db.relationship('Conversacion', backref='trabajos')
 
+    # Tarjetas de trabajo dentro del historial del chat
+    __table_args__ = (
+        db.Index('ix_trabajo_conversacion_timestamp', 'conversacion_id', 'timestamp_creacion', 'id'),
+    )
+
+class GeocodificacionCache(db.Model):
+    __tablename__ = 'geocodificacion_cache'
+    clave = db.Column(db.String(255), primary_key=True) # Dirección normalizada
+    lat = db.Column(db.Float) # NULL = dirección no encontrada (cache negativa)
+    lon = db.Column(db.Float)
+    actualizado = db.Column(db.DateTime, nullable=False)
+
 # --- EJECUCIÓN ---
 
 if __name__ == "__main__":
@@ -0,0 +1,91 @@
+"""
+Referencias a los archivos del almacén (tabla archivo).
+
+Quien guarda una clave en la BD (ej: Portafolio.variantes) suma una
+referencia en la misma transacción, y quien la deja de usar la resta. Los
+archivos nunca se borran en el request: cuando una clave queda en 0
+referencias se marca la fecha, y limpiar_archivos.py borra las que llevan más
+de ARCHIVOS_GC_GRACIA_HORAS así. También borra los huérfanos: archivos del
+almacén sin fila (ej: variantes de una foto que se borró mientras se procesaba).
+
+Carrera con una subida del mismo contenido: almacen.guardar() renueva la fecha
+de modificación del archivo existente antes de sumar la referencia, y el
+recolector no borra archivos modificados dentro del período de gracia.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import time
+
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app import app, db, Archivo
+from almacenamiento import crear_almacen
+
+almacen = crear_almacen(app.config['ALMACEN_URL'], app.config['MEDIA_FOLDER'])
+
+
+def claves_de(variantes):
+    """Claves del almacén usadas por la lista Portafolio.variantes."""
+    return [clave for v in variantes or [] for clave in (v["webp"], v["jpeg"])]
+
+
+def agregar_referencias(claves):
+    """Suma una referencia por clave, en la transacción actual (el llamador hace commit)."""
+    conteo = Counter(claves)
+    if not conteo:
+        return
+    # Orden fijo de claves: dos transacciones con claves en común no se bloquean mutuamente
+    stmt = insert(Archivo).values([{"clave": clave, "referencias": n} for clave, n in sorted(conteo.items())])
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[Archivo.clave],
+        set_={"referencias": Archivo.referencias + stmt.excluded.referencias, "sin_referencias_desde": None}
+    ))
+
+
+def liberar_referencias(claves):
+    """Resta una referencia por clave, en la transacción actual (el llamador hace commit)."""
+    ahora = datetime.now(timezone.utc)
+    # Un UPDATE por cantidad distinta (normalmente uno solo: cada clave aparece una vez),
+    # no uno por clave
+    por_cantidad = {}
+    for clave, n in sorted(Counter(claves).items()):
+        por_cantidad.setdefault(n, []).append(clave)
+    for n, grupo in sorted(por_cantidad.items()):
+        db.session.execute(
+            update(Archivo)
+            .where(Archivo.clave.in_(grupo))
+            .values(referencias=func.greatest(Archivo.referencias - n, 0),
+                    sin_referencias_desde=case((Archivo.referencias - n <= 0, ahora), else_=None))
+        )
+
+
+def recolectar(gracia, simular=False):
+    """
+    Borra del almacén los archivos sin referencias hace más de `gracia`
+    segundos y los huérfanos. Retorna {"sin_referencias", "huerfanos"} borrados.
+    """
+    limite = datetime.now(timezone.utc) - timedelta(seconds=gracia)
+    limite_epoch = time.time() - gracia
+    condicion = (Archivo.referencias == 0) & (Archivo.sin_referencias_desde < limite)
+
+    if simular:
+        claves = db.session.execute(select(Archivo.clave).where(condicion)).scalars().all()
+        sin_referencias = len(claves)
+    else:
+        claves = db.session.execute(delete(Archivo).where(condicion).returning(Archivo.clave)).scalars().all()
+        db.session.commit()
+        sin_referencias = sum(almacen.borrar(clave, sin_modificar_desde=limite_epoch) for clave in claves)
+
+    registradas = set(db.session.execute(select(Archivo.clave)).scalars())
+    db.session.rollback()
+    huerfanos = 0
+    for clave, modificado in almacen.listar():
+        if clave in registradas or modificado >= limite_epoch:
+            continue
+        if simular or almacen.borrar(clave, sin_modificar_desde=limite_epoch):
+            huerfanos += 1
+
+    if not simular:
+        almacen.limpiar_temporales()
+    return {"sin_referencias": sin_referencias, "huerfanos": huerfanos}
@@ -0,0 +1,150 @@
+"""
+Trie en memoria para autocompletar el buscador de servicios.
+
+Indexa el oficio normalizado de cada proveedor (como frase completa) y las
+palabras de su descripción, con la cantidad de proveedores que usan cada
+término. Cada nodo guarda en cache sus mejores sugerencias; al modificar un
+término solo se invalidan los nodos de su camino, así que las consultas
+repetidas no recorren el subárbol.
+"""
+import re
+import threading
+import time
+import unicodedata
+
+# Palabras frecuentes que no aportan como sugerencia
+PALABRAS_VACIAS = {
+    "para", "como", "todo", "todos", "toda", "todas", "tipo", "tipos", "desde", "hasta",
+    "sobre", "entre", "cada", "donde", "cuando", "tambien", "pero", "este", "esta",
+    "estos", "estas", "otro", "otros", "mucho", "muy", "años", "anos", "experiencia",
+    "servicio", "servicios", "trabajo", "trabajos", "realizo", "hago", "ofrezco",
+}
+
+
+def palabras_normalizadas(texto):
+    """Palabras en minúscula y sin tildes: 'Gasfíter Ñuñoa' -> ['gasfiter', 'nunoa']."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return re.findall(r"[a-z0-9]+", texto)
+
+
+def terminos_de_proveedor(oficio, descripcion):
+    """Retorna {(termino, tipo)} de un proveedor; tipo es 'oficio' o 'termino'."""
+    terminos = set()
+    oficio_normalizado = " ".join(palabras_normalizadas(oficio))
+    if oficio_normalizado:
+        terminos.add((oficio_normalizado, "oficio"))
+    for palabra in palabras_normalizadas(descripcion):
+        if len(palabra) >= 4 and not palabra.isdigit() and palabra not in PALABRAS_VACIAS:
+            terminos.add((palabra, "termino"))
+    return terminos
+
+
+class _Nodo:
+    __slots__ = ("hijos", "conteos", "mejores")
+
+    def __init__(self):
+        self.hijos = {}
+        self.conteos = None   # En nodos terminales: {"oficio": n, "termino": m}
+        self.mejores = None   # Cache de sugerencias del subárbol (None = invalidada)
+
+
+class TrieAutocompletado:
+
+    def __init__(self, max_sugerencias=10, min_frecuencia_termino=2):
+        """
+        min_frecuencia_termino: las palabras de descripción solo se sugieren si
+        las usan al menos esa cantidad de proveedores (los oficios siempre).
+        """
+        self.max_sugerencias = max_sugerencias
+        self.min_frecuencia_termino = min_frecuencia_termino
+        self._raiz = _Nodo()
+        self._terminos_proveedor = {}  # proveedor_id -> {(termino, tipo)}
+        self._lock = threading.RLock()
+        self.construido_en = None
+
+    def __len__(self):
+        return len(self._terminos_proveedor)
+
+    # --- ESCRITURA ---
+
+    def reconstruir(self, proveedores):
+        """Reemplaza todo el contenido con un iterable de (id, oficio, descripcion)."""
+        raiz, terminos_proveedor = _Nodo(), {}
+        for proveedor_id, oficio, descripcion in proveedores:
+            terminos = terminos_de_proveedor(oficio, descripcion)
+            terminos_proveedor[proveedor_id] = terminos
+            for termino, tipo in terminos:
+                self._sumar(raiz, termino, tipo, 1)
+        with self._lock:
+            self._raiz = raiz
+            self._terminos_proveedor = terminos_proveedor
+            self.construido_en = time.time()
+
+    def actualizar(self, proveedor_id, oficio, descripcion):
+        nuevos = terminos_de_proveedor(oficio, descripcion)
+        with self._lock:
+            anteriores = self._terminos_proveedor.get(proveedor_id, set())
+            for termino, tipo in anteriores - nuevos:
+                self._sumar(self._raiz, termino, tipo, -1)
+            for termino, tipo in nuevos - anteriores:
+                self._sumar(self._raiz, termino, tipo, 1)
+            self._terminos_proveedor[proveedor_id] = nuevos
+
+    def eliminar(self, proveedor_id):
+        with self._lock:
+            for termino, tipo in self._terminos_proveedor.pop(proveedor_id, set()):
+                self._sumar(self._raiz, termino, tipo, -1)
+
+    def _sumar(self, raiz, termino, tipo, delta):
+        nodo = raiz
+        nodo.mejores = None
+        for letra in termino:
+            nodo = nodo.hijos.setdefault(letra, _Nodo())
+            nodo.mejores = None
+        if nodo.conteos is None:
+            nodo.conteos = {}
+        nodo.conteos[tipo] = nodo.conteos.get(tipo, 0) + delta
+        if nodo.conteos[tipo] <= 0:
+            del nodo.conteos[tipo]
+
+    # --- CONSULTAS ---
+
+    def sugerir(self, prefijo, limite=None):
+        """
+        Retorna [{"termino", "tipo", "proveedores"}, ...] para el prefijo dado:
+        primero los oficios y luego los términos, cada grupo por cantidad de proveedores.
+        """
+        if not limite or limite <= 0:
+            limite = self.max_sugerencias
+        limite = min(limite, self.max_sugerencias)
+        prefijo = " ".join(palabras_normalizadas(prefijo))
+        if not prefijo:
+            return []
+        with self._lock:
+            nodo = self._raiz
+            for letra in prefijo:
+                nodo = nodo.hijos.get(letra)
+                if nodo is None:
+                    return []
+            if nodo.mejores is None:
+                nodo.mejores = self._calcular_mejores(nodo, prefijo)
+            mejores = nodo.mejores
+        return [{"termino": t, "tipo": tipo, "proveedores": n} for _, t, tipo, n in mejores[:limite]]
+
+    def _calcular_mejores(self, nodo, prefijo):
+        candidatos = []
+        pila = [(nodo, prefijo)]
+        while pila:
+            actual, texto = pila.pop()
+            if actual.conteos:
+                n_oficio = actual.conteos.get("oficio", 0)
+                n_termino = actual.conteos.get("termino", 0)
+                if n_oficio:
+                    candidatos.append(((0, -n_oficio, texto), texto, "oficio", n_oficio))
+                elif n_termino >= self.min_frecuencia_termino:
+                    candidatos.append(((1, -n_termino, texto), texto, "termino", n_termino))
+            for letra, hijo in actual.hijos.items():
+                pila.append((hijo, texto + letra))
+        candidatos.sort()
+        return candidatos[:self.max_sugerencias]
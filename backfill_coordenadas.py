@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import bindparam, or_, update
+
+from app import app, db, Usuario, Proveedor
+from geocodificacion import cache_geocodificacion, crear_geocodificador, ErrorGeocodificacion, LimitadorTasa
+
+MODELOS = {'usuario': Usuario, 'proveedor': Proveedor}
+
+
+def leer_progreso(ruta):
+    if os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as archivo:
+            return json.load(archivo)
+    return {}
+
+
+def guardar_progreso(ruta, progreso):
+    # Escribimos a un temporal y renombramos para no dejar el archivo a medias
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(progreso, archivo)
+    os.replace(temporal, ruta)
+
+
+def filas_sin_coordenadas(modelo, desde_id, tamano_lote):
+    """Genera lotes [(id, direccion), ...] sin coordenadas, recorriendo por id (keyset)."""
+    ultimo_id = desde_id
+    while True:
+        lote = db.session.query(modelo.id, modelo.direccion).filter(
+            modelo.id > ultimo_id,
+            modelo.direccion.isnot(None),
+            modelo.direccion != '',
+            or_(modelo.lat.is_(None), modelo.lon.is_(None))
+        ).order_by(modelo.id).limit(tamano_lote).all()
+        db.session.rollback()  # No mantenemos la transacción abierta mientras geocodificamos
+        if not lote:
+            return
+        yield lote
+        ultimo_id = lote[-1].id
+
+
+def procesar_tabla(tipo, args, progreso, limitador):
+    modelo = MODELOS[tipo]
+    tabla = modelo.__table__
+
+    def geocodificar(direccion):
+        """(lat, lon), (None, None) si no existe, o None si falló la red (se reintenta en otra corrida)."""
+        coords = cache_geocodificacion.en_cache(direccion)
+        if coords is not None:
+            return coords
+        # El límite de tasa es para el geocodificador: los aciertos de cache no esperan
+        limitador.esperar()
+        try:
+            return cache_geocodificacion.consultar(direccion)
+        except ErrorGeocodificacion as e:
+            print(f"[{tipo}] Error geocodificando '{direccion}': {e}")
+            return None
+
+    # UPDATE por lotes; solo escribe si la dirección no cambió desde que la leímos
+    stmt = update(tabla).where(
+        tabla.c.id == bindparam('b_id'),
+        tabla.c.direccion == bindparam('b_direccion')
+    ).values(lat=bindparam('b_lat'), lon=bindparam('b_lon'), geocode_estado=bindparam('b_estado'))
+
+    desde_id = progreso.get(tipo, 0)
+    total = db.session.query(modelo.id).filter(
+        modelo.id > desde_id, modelo.direccion.isnot(None), modelo.direccion != '',
+        or_(modelo.lat.is_(None), modelo.lon.is_(None))
+    ).count()
+    print(f"[{tipo}] {total} filas sin coordenadas (desde id > {desde_id})")
+
+    procesadas, encontradas, con_error, inicio = 0, 0, 0, time.time()
+    # Id de la primera fila con error de red: el avance guardado no pasa de ahí,
+    # así la próxima corrida la reintenta (las ya geocodificadas no se repiten)
+    primer_error = None
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+        for lote in filas_sin_coordenadas(modelo, desde_id, args.lote):
+            coordenadas = list(pool.map(geocodificar, [fila.direccion for fila in lote]))
+            parametros = []
+            for fila, coords in zip(lote, coordenadas):
+                if coords is None:
+                    con_error += 1
+                    if primer_error is None:
+                        primer_error = fila.id
+                    lat, lon, estado = None, None, 'PENDIENTE'
+                else:
+                    lat, lon = coords
+                    estado = 'OK' if lat is not None else 'FALLIDO'
+                parametros.append({"b_id": fila.id, "b_direccion": fila.direccion,
+                                   "b_lat": lat, "b_lon": lon, "b_estado": estado})
+
+            if not args.simular:
+                db.session.execute(stmt, parametros)
+                db.session.commit()
+                progreso[tipo] = lote[-1].id if primer_error is None else primer_error - 1
+                guardar_progreso(args.progreso, progreso)
+
+            procesadas += len(lote)
+            encontradas += sum(1 for coords in coordenadas if coords is not None and coords[0] is not None)
+            velocidad = procesadas / max(time.time() - inicio, 1e-6)
+            print(f"[{tipo}] {procesadas}/{total} procesadas, {encontradas} con coordenadas, {con_error} con error "
+                  f"({velocidad:.1f} filas/s, último id {lote[-1].id})")
+
+    if con_error:
+        print(f"[{tipo}] {con_error} filas quedaron PENDIENTE por errores del geocodificador; "
+              f"volver a correr para reintentarlas")
+    return procesadas, encontradas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Geocodifica en lote los usuarios y proveedores que no tienen coordenadas. "
+                    "Se puede interrumpir y retomar: el avance se guarda en --progreso."
+    )
+    parser.add_argument("--tablas", nargs="+", choices=list(MODELOS), default=list(MODELOS))
+    parser.add_argument("--lote", type=int, default=200, help="Filas por lote (y por UPDATE)")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Consultas de geocodificación simultáneas")
+    parser.add_argument("--por-segundo", type=float, default=1.0, help="Máximo de consultas por segundo al geocodificador")
+    parser.add_argument("--geocoder", default=app.config['GEOCODER'], help="Backend: nominatim o local")
+    parser.add_argument("--progreso", default="backfill_coordenadas.progreso.json", help="Archivo de avance")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el avance guardado y empezar desde el inicio")
+    parser.add_argument("--simular", action="store_true", help="Geocodificar sin escribir en la BD")
+    args = parser.parse_args()
+
+    cache_geocodificacion.backend = crear_geocodificador(args.geocoder)
+    limitador = LimitadorTasa(args.por_segundo)
+    progreso = {} if args.reiniciar else leer_progreso(args.progreso)
+
+    with app.app_context():
+        for tipo in args.tablas:
+            procesadas, encontradas = procesar_tabla(tipo, args, progreso, limitador)
+            print(f"[{tipo}] Listo: {encontradas} de {procesadas} filas quedaron con coordenadas.")
+        print(f"Cache de geocodificación: {cache_geocodificacion.estadisticas()}")
@@ -0,0 +1,338 @@
+"""
+Benchmark de carga: latencia (p50/p95/p99) y throughput por endpoint.
+
+- HTTP: cada endpoint corre --segundos con --concurrencia hilos, cada uno con
+  su cliente de pruebas de Flask y la sesión de una cuenta sintética al azar.
+  Mide la app y la BD sin la red ni el servidor de por medio.
+- Socket.IO (fan-out): levanta un worker con servidor.py y conecta los dos
+  participantes de --salas conversaciones (más --pestanas clientes extra por
+  participante, como pestañas abiertas). Un cliente por sala envía
+  send_message cada --intervalo segundos; se mide el ack del remitente y el
+  tiempo hasta que cada cliente de la sala recibe receive_message.
+
+Necesita los datos de benchmarks.datos_sinteticos en una BD local. Los
+mensajes que envía el benchmark quedan en esas conversaciones sintéticas.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.datos_sinteticos
+    python -m benchmarks.bench_carga
+    python -m benchmarks.bench_carga --endpoints cercanos buscar --concurrencia 16 --segundos 20
+    python -m benchmarks.bench_carga --sin-socket
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import simple_websocket
+from sqlalchemy import text
+
+from app import app, db
+import routes
+from benchmarks.bench_login import esperar_worker
+from benchmarks.datos_sinteticos import DOMINIO, OFICIOS, verificar_bd_local
+
+
+def cargar_contexto(rnd, muestra):
+    """
+    Cuentas y conversaciones sintéticas al azar, con un cursor a la mitad de
+    cada historial. Los ids se leen en orden y se sortean con rnd, así la
+    misma --semilla elige las mismas cuentas sobre los mismos datos.
+    """
+    patron = {"patron": f"%@{DOMINIO}"}
+
+    def sortear(filas):
+        return rnd.sample(filas, min(muestra, len(filas)))
+
+    usuarios = sortear(db.session.execute(text(
+        "SELECT id FROM usuario WHERE email LIKE :patron ORDER BY id"), patron).scalars().all())
+    proveedores = sortear(db.session.execute(text(
+        "SELECT id FROM proveedor WHERE email LIKE :patron ORDER BY id"), patron).scalars().all())
+    conversaciones = []
+    for conv_id, usuario_id, proveedor_id in sortear(db.session.execute(text(
+            "SELECT c.id, c.usuario_id, c.proveedor_id FROM conversacion c JOIN usuario u ON u.id = c.usuario_id "
+            "WHERE u.email LIKE :patron ORDER BY c.id"), patron).all()):
+        mitad = db.session.execute(text(
+            "SELECT timestamp, id FROM mensaje WHERE conversacion_id = :c ORDER BY timestamp, id "
+            "OFFSET (SELECT count(*) / 2 FROM mensaje WHERE conversacion_id = :c) LIMIT 1"), {"c": conv_id}).first()
+        cursor = routes._cursor_historial(mitad.timestamp, 'mensaje', mitad.id) if mitad else None
+        conversaciones.append((conv_id, usuario_id, proveedor_id, cursor))
+    db.session.rollback()
+    if not usuarios or not proveedores or not conversaciones:
+        sys.exit("No hay datos sintéticos: correr primero python -m benchmarks.datos_sinteticos")
+    palabras = [p for oficio in OFICIOS for p in oficio.lower().split() if len(p) > 3]
+    return {"usuarios": usuarios, "proveedores": proveedores, "conversaciones": conversaciones,
+            "oficios": list(OFICIOS), "palabras": palabras}
+
+
+def _usuario(rnd, ctx):
+    return 'usuario', rnd.choice(ctx["usuarios"])
+
+
+def _participante(rnd, ctx):
+    """Una conversación al azar y uno de sus dos participantes."""
+    conv = rnd.choice(ctx["conversaciones"])
+    conv_id, usuario_id, proveedor_id, _ = conv
+    return conv, (('usuario', usuario_id) if rnd.random() < 0.5 else ('proveedor', proveedor_id))
+
+
+# Cada escenario retorna (tipo de sesión, id de la cuenta, método, url, kwargs del cliente de pruebas)
+
+def escenario_cercanos(rnd, ctx):
+    return (*_usuario(rnd, ctx), 'GET', '/api/proveedores/cercanos', {"query_string": {"radio_km": 10}})
+
+
+def escenario_buscar(rnd, ctx):
+    return (*_usuario(rnd, ctx), 'GET', '/api/buscar', {"query_string": {"q": rnd.choice(ctx["oficios"])}})
+
+
+def escenario_autocompletar(rnd, ctx):
+    prefijo = rnd.choice(ctx["palabras"])[:rnd.randint(2, 4)]
+    return (*_usuario(rnd, ctx), 'GET', '/api/autocompletar', {"query_string": {"q": prefijo}})
+
+
+def escenario_perfil(rnd, ctx):
+    return (*_usuario(rnd, ctx), 'GET', f'/api/perfil/proveedor/{rnd.choice(ctx["proveedores"])}', {})
+
+
+def escenario_bandeja(rnd, ctx):
+    _, cuenta = _participante(rnd, ctx)
+    return (*cuenta, 'GET', '/api/conversaciones', {})
+
+
+def escenario_detalles(rnd, ctx):
+    conv, cuenta = _participante(rnd, ctx)
+    return (*cuenta, 'GET', f'/api/conversacion/{conv[0]}/detalles', {})
+
+
+def escenario_historial(rnd, ctx):
+    """Scroll hacia arriba desde la mitad del historial."""
+    conv, cuenta = _participante(rnd, ctx)
+    return (*cuenta, 'GET', f'/api/conversacion/{conv[0]}/historial',
+            {"query_string": {"before": conv[3]} if conv[3] else {}})
+
+
+def escenario_enviar(rnd, ctx):
+    conv, cuenta = _participante(rnd, ctx)
+    return (*cuenta, 'POST', f'/api/conversacion/{conv[0]}/enviar', {"json": {"contenido": "Mensaje de benchmark"}})
+
+
+ESCENARIOS = {
+    "cercanos": escenario_cercanos,
+    "buscar": escenario_buscar,
+    "autocompletar": escenario_autocompletar,
+    "perfil": escenario_perfil,
+    "bandeja": escenario_bandeja,
+    "detalles": escenario_detalles,
+    "historial": escenario_historial,
+    "enviar": escenario_enviar,
+}
+
+
+def percentiles(latencias):
+    if len(latencias) < 2:
+        valor = latencias[0] if latencias else float('nan')
+        return valor, valor, valor
+    q = statistics.quantiles(latencias, n=100)
+    return q[49], q[94], q[98]
+
+
+def imprimir_fila(nombre, latencias, segundos, errores=0):
+    p50, p95, p99 = percentiles(latencias)
+    print(f"{nombre:<16}{len(latencias):>8}{len(latencias) / segundos:>10.1f}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}"
+          f"{errores:>9}")
+
+
+def correr_escenario(escenario, ctx, concurrencia, segundos, semilla):
+    latencias, errores = [], []
+
+    def trabajador(indice):
+        rnd = random.Random(f"{semilla}-{indice}")
+        cliente = app.test_client()
+        propias, fallidas = [], 0
+        limite = time.perf_counter() + segundos
+        while time.perf_counter() < limite:
+            tipo, cuenta_id, metodo, url, kwargs = escenario(rnd, ctx)
+            with cliente.session_transaction() as sesion:
+                sesion['user_id'], sesion['user_type'] = cuenta_id, tipo
+            inicio = time.perf_counter()
+            respuesta = cliente.open(url, method=metodo, **kwargs)
+            propias.append((time.perf_counter() - inicio) * 1000)
+            fallidas += respuesta.status_code >= 400
+        latencias.extend(propias)
+        errores.append(fallidas)
+
+    # Calentamiento: caches, trie de autocompletado e índices en memoria
+    calentamiento = random.Random(semilla)
+    cliente = app.test_client()
+    for _ in range(20):
+        tipo, cuenta_id, metodo, url, kwargs = escenario(calentamiento, ctx)
+        with cliente.session_transaction() as sesion:
+            sesion['user_id'], sesion['user_type'] = cuenta_id, tipo
+        cliente.open(url, method=metodo, **kwargs)
+
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return latencias, sum(errores)
+
+
+class ClienteSocket:
+    """Cliente Socket.IO mínimo (Engine.IO v4 sobre websocket) con la sesión de una cuenta."""
+
+    def __init__(self, puerto, tipo, cuenta_id, al_evento):
+        cookie = app.session_interface.get_signing_serializer(app).dumps({"user_id": cuenta_id, "user_type": tipo})
+        self.ws = simple_websocket.Client(f"ws://127.0.0.1:{puerto}/socket.io/?EIO=4&transport=websocket",
+                                          headers={"Cookie": f"{app.config['SESSION_COOKIE_NAME']}={cookie}"})
+        self.al_evento = al_evento
+        self._envio = threading.Lock()
+        self._acks = {}
+        self._ack_id = 0
+        self.ws.receive(timeout=5)  # Paquete "open" de Engine.IO
+        self._enviar("40")
+        while not (self.ws.receive(timeout=5) or "").startswith("40"):
+            pass
+        self._lector = threading.Thread(target=self._leer, daemon=True)
+        self._lector.start()
+
+    def _enviar(self, paquete):
+        with self._envio:
+            self.ws.send(paquete)
+
+    def emitir(self, evento, datos, al_ack=None):
+        paquete = json.dumps([evento, datos])
+        if al_ack is None:
+            self._enviar(f"42{paquete}")
+            return
+        with self._envio:
+            self._ack_id += 1
+            self._acks[self._ack_id] = al_ack
+            self.ws.send(f"42{self._ack_id}{paquete}")
+
+    def _leer(self):
+        while True:
+            try:
+                paquete = self.ws.receive(timeout=1)
+            except simple_websocket.ConnectionClosed:
+                return
+            if paquete is None:
+                continue
+            if paquete == "2":
+                self._enviar("3")  # ping -> pong
+            elif paquete.startswith("42"):
+                evento, *datos = json.loads(paquete[2:])
+                self.al_evento(evento, datos[0] if datos else None)
+            elif paquete.startswith("43"):
+                inicio = paquete.index("[")
+                al_ack = self._acks.pop(int(paquete[2:inicio]), None)
+                if al_ack:
+                    al_ack(json.loads(paquete[inicio:])[0])
+
+    def cerrar(self):
+        self.ws.close()
+
+
+def correr_fanout(ctx, args):
+    entorno = dict(os.environ)
+    entorno.pop("SOCKETIO_MESSAGE_QUEUE", None)
+    servidor = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "servidor.py"),
+         "--workers", "1", "--puerto", str(args.puerto)],
+        env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    clientes, acks, entregas, unidos = [], [], [], []
+    lock = threading.Lock()
+
+    def al_evento(evento, datos):
+        if evento == "joined":
+            with lock:
+                unidos.append(1)
+        elif evento == "receive_message" and (datos.get("contenido") or "").startswith("bench "):
+            latencia = (time.perf_counter() - float(datos["contenido"].split()[1])) * 1000
+            with lock:
+                entregas.append(latencia)
+
+    try:
+        esperar_worker(args.puerto)
+        salas = ctx["conversaciones"][:args.salas]
+        remitentes = []
+        for conv_id, usuario_id, proveedor_id, _ in salas:
+            miembros = [('usuario', usuario_id), ('proveedor', proveedor_id)] * args.pestanas
+            conectados = [ClienteSocket(args.puerto, tipo, cuenta_id, al_evento) for tipo, cuenta_id in miembros]
+            for cliente in conectados:
+                cliente.emitir("join", {"conv_id": conv_id})
+            clientes.extend(conectados)
+            remitentes.append((conv_id, conectados[0]))
+        limite = time.time() + 10
+        while len(unidos) < len(clientes) and time.time() < limite:
+            time.sleep(0.05)
+        if len(unidos) < len(clientes):
+            raise RuntimeError(f"Solo {len(unidos)} de {len(clientes)} clientes entraron a su sala")
+
+        detener = threading.Event()
+
+        def enviar(conv_id, cliente):
+            while not detener.is_set():
+                inicio = time.perf_counter()
+
+                def al_ack(_respuesta, inicio=inicio):
+                    with lock:
+                        acks.append((time.perf_counter() - inicio) * 1000)
+
+                cliente.emitir("send_message", {"conv_id": conv_id, "contenido": f"bench {inicio:.9f}"}, al_ack)
+                detener.wait(args.intervalo)
+
+        hilos = [threading.Thread(target=enviar, args=remitente) for remitente in remitentes]
+        for hilo in hilos:
+            hilo.start()
+        time.sleep(args.segundos)
+        detener.set()
+        for hilo in hilos:
+            hilo.join()
+        time.sleep(1)  # Las últimas entregas en vuelo
+        print(f"\nSocket.IO: {len(salas)} salas x {2 * args.pestanas} clientes, "
+              f"un envío por sala cada {args.intervalo}s")
+        imprimir_fila("ack send", acks, args.segundos)
+        imprimir_fila("entrega", entregas, args.segundos)
+    finally:
+        for cliente in clientes:
+            cliente.cerrar()
+        servidor.terminate()
+        servidor.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia y throughput por endpoint con datos sintéticos")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    parser.add_argument("--concurrencia", type=int, default=8, help="Hilos por endpoint HTTP")
+    parser.add_argument("--segundos", type=float, default=10, help="Duración de cada fase")
+    parser.add_argument("--muestra", type=int, default=500, help="Cuentas y conversaciones usadas")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--sin-socket", action="store_true", help="Solo los endpoints HTTP")
+    parser.add_argument("--puerto", type=int, default=5800)
+    parser.add_argument("--salas", type=int, default=50, help="Conversaciones con clientes conectados")
+    parser.add_argument("--pestanas", type=int, default=1, help="Clientes por participante en cada sala")
+    parser.add_argument("--intervalo", type=float, default=0.5, help="Segundos entre envíos de cada sala")
+    args = parser.parse_args()
+
+    verificar_bd_local(app.config['SQLALCHEMY_DATABASE_URI'], permitir_remota=False)
+    with app.app_context():
+        ctx = cargar_contexto(random.Random(args.semilla), args.muestra)
+        print(f"{args.concurrencia} hilos | {args.segundos}s por endpoint | CERCANOS_BACKEND={app.config['CERCANOS_BACKEND']}")
+        print(f"{'endpoint':<16}{'n':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errores':>9}")
+        for nombre in args.endpoints:
+            latencias, errores = correr_escenario(ESCENARIOS[nombre], ctx, args.concurrencia, args.segundos,
+                                                  args.semilla)
+            imprimir_fila(nombre, latencias, args.segundos, errores)
+        if not args.sin_socket:
+            correr_fanout(ctx, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark: ranking de proveedores cercanos con el loop original vs MatrizDistancias.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_distancias
+    python -m benchmarks.bench_distancias --tamanos 1000 10000 100000 --consultas 50
+
+No necesita base de datos: genera coordenadas sintéticas dentro de Chile.
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from distancias import MatrizDistancias
+
+try:
+    from haversine import haversine
+except ImportError:
+    # Misma fórmula que la librería, para poder correr sin ella
+    from indice_geo import distancia_km
+
+    def haversine(p1, p2):
+        return distancia_km(p1[0], p1[1], p2[0], p2[1])
+
+
+def generar_proveedores(n, semilla):
+    rnd = random.Random(semilla)
+    return [SimpleNamespace(id=i, lat=rnd.uniform(-53.2, -18.4), lon=rnd.uniform(-73.5, -68.9))
+            for i in range(1, n + 1)]
+
+
+def loop_original(proveedores, user_coords, k=20):
+    """Réplica del algoritmo original de api_proveedores_cercanos."""
+    lista_con_distancia = []
+    for p in proveedores:
+        if p.lat and p.lon:
+            distancia = haversine(user_coords, (p.lat, p.lon))
+            lista_con_distancia.append({"obj": p, "prom": None, "total": None, "dist": distancia})
+    lista_con_distancia.sort(key=lambda x: x['dist'])
+    return [(item['dist'], item['obj'].id) for item in lista_con_distancia[:k]]
+
+
+def medir(funcion, consultas):
+    inicio = time.perf_counter()
+    for lat, lon in consultas:
+        funcion(lat, lon)
+    return (time.perf_counter() - inicio) / len(consultas) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--consultas", type=int, default=30)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.semilla + 1)
+    consultas = [(rnd.uniform(-40, -30), rnd.uniform(-72, -70)) for _ in range(args.consultas)]
+
+    print(f"{'proveedores':>12} {'loop (ms)':>12} {'numpy (ms)':>12} {'speedup':>9}")
+    for n in args.tamanos:
+        proveedores = generar_proveedores(n, args.semilla)
+        matriz = MatrizDistancias()
+        matriz.reconstruir((p.id, p.lat, p.lon) for p in proveedores)
+
+        # Verificamos que ambos entreguen los mismos ids antes de medir
+        lat, lon = consultas[0]
+        ids_loop = [pid for _, pid in loop_original(proveedores, (lat, lon), args.k)]
+        ids_numpy = [pid for _, pid in matriz.cercanos(lat, lon, args.k)]
+        assert ids_loop == ids_numpy, "Los resultados no coinciden"
+
+        t_loop = medir(lambda la, lo: loop_original(proveedores, (la, lo), args.k), consultas)
+        t_numpy = medir(lambda la, lo: matriz.cercanos(la, lo, args.k), consultas)
+        print(f"{n:>12} {t_loop:>12.3f} {t_numpy:>12.3f} {t_loop / t_numpy:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark: serialización de respuestas JSON y bytes enviados.
+
+Compara el proveedor JSON por defecto de Flask con ProveedorJSONRapido
+(json_rapido.py) armando la respuesta de jsonify() para listas sintéticas con
+la forma de /api/buscar, /api/proveedores-cercanos y el historial del chat, y
+mide el tamaño del cuerpo sin comprimir, con gzip y con brotli.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_json
+    python -m benchmarks.bench_json --items 1000 5000 --repeticiones 50
+
+No necesita base de datos.
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+import compresion
+import json_rapido
+from json_rapido import ProveedorJSONRapido
+
+OFICIOS = ["Gasfíter", "Electricista", "Carpintero", "Pintor", "Cerrajero", "Jardinero", "Albañil"]
+COMUNAS = ["Ñuñoa", "Providencia", "Maipú", "Viña del Mar", "Concepción", "Puerto Montt", "La Florida"]
+
+
+def generar_proveedores(n, semilla):
+    """Misma forma que _serializar_proveedor en routes.py."""
+    rnd = random.Random(semilla)
+    return [{
+        "proveedor_id": i,
+        "nombre": f"Proveedor {i} Muñoz",
+        "oficio": rnd.choice(OFICIOS),
+        "descripcion": "Trabajos de mantención y reparación con garantía. " * rnd.randint(1, 4),
+        "telefono": f"+5699{rnd.randint(1000000, 9999999)}",
+        "direccion": f"Calle {rnd.randint(1, 9999)}, {rnd.choice(COMUNAS)}",
+        "horario": "Lunes a sábado, 9:00 a 19:00",
+        "atiende_urgencias": rnd.random() < 0.3,
+        "calif_promedio": round(rnd.uniform(1, 5), 1),
+        "calif_total": rnd.randint(0, 500),
+        "lat": rnd.uniform(-53.2, -18.4),
+        "lon": rnd.uniform(-73.5, -68.9),
+        "distancia_km": round(rnd.uniform(0, 50), 2),
+    } for i in range(1, n + 1)]
+
+
+def generar_mensajes(n, semilla):
+    """Misma forma que los mensajes del historial del chat."""
+    rnd = random.Random(semilla)
+    inicio = datetime(2025, 1, 1)
+    return [{
+        "id": i,
+        "remitente_tipo": rnd.choice(["usuario", "proveedor"]),
+        "contenido": rnd.choice(["¿Mañana a las 10 le acomoda?", "Perfecto, quedo atento.",
+                                 "Le envío la cotización por acá.", "Sí, el baño también."]),
+        "timestamp": (inicio + timedelta(minutes=i)).isoformat(),
+    } for i in range(1, n + 1)]
+
+
+def medir(app, datos, repeticiones):
+    """Retorna (ms mediana por respuesta, cuerpo)."""
+    tiempos = []
+    with app.app_context():
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            cuerpo = jsonify(datos).get_data()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), cuerpo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialización JSON y bytes enviados")
+    parser.add_argument("--items", type=int, nargs="+", default=[1000])
+    parser.add_argument("--repeticiones", type=int, default=30)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    app_estandar = Flask("bench_estandar")
+    app_estandar.json = DefaultJSONProvider(app_estandar)
+    app_rapido = Flask("bench_rapido")
+    app_rapido.json = ProveedorJSONRapido(app_rapido)
+
+    print(f"orjson: {'sí' if json_rapido.orjson else 'no (se mide el fallback a json)'}"
+          f" | brotli: {'sí' if compresion.brotli else 'no'}")
+    print(f"{'payload':<22}{'json':<12}{'ms':>8}{'bytes':>10}{'gzip':>9}{'brotli':>9}")
+    for n in args.items:
+        for nombre, datos in ((f"proveedores x{n}", generar_proveedores(n, args.semilla)),
+                              (f"mensajes x{n}", generar_mensajes(n, args.semilla))):
+            for etiqueta, app in (("flask", app_estandar), ("rapido", app_rapido)):
+                ms, cuerpo = medir(app, datos, args.repeticiones)
+                gz = len(compresion.comprimir(cuerpo, 'gzip'))
+                br = len(compresion.comprimir(cuerpo, 'br')) if compresion.brotli else None
+                print(f"{nombre:<22}{etiqueta:<12}{ms:>8.2f}{len(cuerpo):>10}{gz:>9}{br if br else '-':>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark: latencia de los sockets durante una ráfaga de logins.
+
+Levanta un worker con servidor.py y conecta un cliente Socket.IO que mide la
+ida y vuelta de un evento con ack (send_message sin sesión, que responde de
+inmediato) cada --intervalo ms: primero en reposo y luego mientras --hilos
+clientes HTTP hacen login sin parar. Si el hash de la contraseña corriera en
+el loop de eventos, cada ack esperaría detrás de varios hashes; con el hash
+en el pool de hilos la latencia se mantiene cerca de la de reposo.
+
+Necesita DATABASE_URL. Crea un usuario de prueba que se borra al terminar.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_login
+    python -m benchmarks.bench_login --hilos 16 --segundos 10 --metodo pbkdf2:sha256:600000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import simple_websocket
+
+from app import app, db, Usuario
+
+EMAIL = 'bench-login@zerby.test'
+PASSWORD = 'clave-de-prueba'
+
+
+def esperar_worker(puerto, timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{puerto}/login", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.3)
+    raise RuntimeError(f"El worker del puerto {puerto} no respondió")
+
+
+class Sonda:
+    """Cliente Socket.IO mínimo (Engine.IO v4) que mide la ida y vuelta de un ack."""
+
+    def __init__(self, puerto):
+        self.ws = simple_websocket.Client(f"ws://127.0.0.1:{puerto}/socket.io/?EIO=4&transport=websocket")
+        self.ws.receive(timeout=5)  # Paquete "open" de Engine.IO
+        self.ws.send("40")
+        while not (self.ws.receive(timeout=5) or "").startswith("40"):
+            pass
+        self.ack_id = 0
+
+    def medir(self):
+        self.ack_id += 1
+        inicio = time.perf_counter()
+        self.ws.send(f'42{self.ack_id}["send_message",{{"conv_id":0}}]')
+        while True:
+            paquete = self.ws.receive(timeout=30)
+            if paquete == "2":
+                self.ws.send("3")  # ping -> pong
+            elif paquete and paquete.startswith(f"43{self.ack_id}["):
+                return (time.perf_counter() - inicio) * 1000
+
+    def cerrar(self):
+        self.ws.close()
+
+
+def medir_latencias(sonda, segundos, intervalo):
+    latencias = []
+    limite = time.time() + segundos
+    while time.time() < limite:
+        latencias.append(sonda.medir())
+        time.sleep(intervalo)
+    return latencias
+
+
+def rafaga_de_logins(puerto, detener, contador):
+    cuerpo = json.dumps({"email": EMAIL, "password": PASSWORD}).encode()
+    while not detener.is_set():
+        peticion = urllib.request.Request(f"http://127.0.0.1:{puerto}/api/login", method="POST", data=cuerpo,
+                                          headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(peticion, timeout=30)
+            contador.append(1)
+        except urllib.error.URLError as e:
+            print(f"Login fallido: {e}")
+
+
+def resumen(nombre, latencias):
+    q = statistics.quantiles(latencias, n=100)
+    print(f"{nombre:<10}{len(latencias):>8}{q[49]:>10.1f}{q[94]:>10.1f}{q[98]:>10.1f}{max(latencias):>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de los sockets durante una ráfaga de logins")
+    parser.add_argument("--puerto", type=int, default=5700)
+    parser.add_argument("--hilos", type=int, default=8, help="Clientes haciendo login en paralelo")
+    parser.add_argument("--segundos", type=float, default=5, help="Duración de cada fase")
+    parser.add_argument("--intervalo", type=float, default=0.02, help="Segundos entre mediciones del socket")
+    parser.add_argument("--metodo", default=app.config['PASSWORD_HASH_METODO'], help="Método de hash de la cuenta")
+    args = parser.parse_args()
+
+    app.config['PASSWORD_HASH_METODO'] = args.metodo
+    with app.app_context():
+        Usuario.query.filter_by(email=EMAIL).delete()
+        usuario = Usuario(nombre_completo='bench-login', email=EMAIL)
+        usuario.set_password(PASSWORD)
+        db.session.add(usuario)
+        db.session.commit()
+
+    # Un solo worker y sin cola: medimos el loop de eventos de un proceso
+    entorno = dict(os.environ, PASSWORD_HASH_METODO=args.metodo)
+    entorno.pop("SOCKETIO_MESSAGE_QUEUE", None)
+    servidor = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "servidor.py"),
+         "--workers", "1", "--puerto", str(args.puerto)],
+        env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    sonda = None
+    try:
+        esperar_worker(args.puerto)
+        sonda = Sonda(args.puerto)
+        print(f"Hash: {args.metodo} | {args.hilos} clientes de login | {args.segundos}s por fase")
+        print(f"{'fase':<10}{'acks':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        resumen("reposo", medir_latencias(sonda, args.segundos, args.intervalo))
+
+        detener, contador = threading.Event(), []
+        hilos = [threading.Thread(target=rafaga_de_logins, args=(args.puerto, detener, contador), daemon=True)
+                 for _ in range(args.hilos)]
+        for hilo in hilos:
+            hilo.start()
+        inicio = time.time()
+        latencias = medir_latencias(sonda, args.segundos, args.intervalo)
+        detener.set()
+        for hilo in hilos:
+            hilo.join()
+        resumen("rafaga", latencias)
+        print(f"Logins completados: {len(contador)} ({len(contador) / (time.time() - inicio):.1f}/s)")
+    finally:
+        if sonda is not None:
+            sonda.cerrar()
+        servidor.terminate()
+        servidor.wait(timeout=10)
+        with app.app_context():
+            Usuario.query.filter_by(email=EMAIL).delete()
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
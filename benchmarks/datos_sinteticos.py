@@ -0,0 +1,304 @@
+"""
+Datos sintéticos para los benchmarks: usuarios, proveedores, calificaciones,
+conversaciones, mensajes y trabajos, reproducibles con --semilla.
+
+- Coordenadas alrededor de ciudades chilenas, con más peso en Santiago.
+- Oficios y descripciones en español (la búsqueda de texto tiene con qué trabajar).
+- Calificaciones sesgadas a 4 y 5 estrellas, con los agregados
+  (calif_suma/total/promedio) consistentes.
+- Largo de las conversaciones con cola larga (Pareto): la mayoría son cortas y
+  unas pocas tienen miles de mensajes, como en el historial real.
+
+Se carga con COPY en bloques, así que escala a 100k proveedores y 10M
+mensajes sin tener todo en memoria. Todas las cuentas usan el dominio
+DOMINIO y la contraseña PASSWORD; --limpiar borra solo esas filas.
+
+Solo Postgres local (o con --permitir-remota): el esquema usa tsvector,
+índices GIN y upserts propios de Postgres, así que SQLite no sirve de
+reemplazo, y cargar millones de filas en la BD de producción (Neon) no es
+la idea. La BD debe estar migrada (flask --app app db upgrade).
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.datos_sinteticos
+    python -m benchmarks.datos_sinteticos --proveedores 100000 --usuarios 50000 \\
+        --conversaciones 500000 --mensajes 10000000
+    python -m benchmarks.datos_sinteticos --limpiar
+"""
+import argparse
+import csv
+import io
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+
+DOMINIO = 'bench.zerby.test'
+PASSWORD = 'clave-bench'
+FILAS_POR_COPY = 50000
+
+# (nombre, lat, lon, peso): peso ~ proporción de la población
+CIUDADES = [
+    ("Santiago", -33.45, -70.66, 40), ("Valparaíso", -33.05, -71.60, 5), ("Viña del Mar", -33.02, -71.55, 4),
+    ("Concepción", -36.82, -73.05, 6), ("La Serena", -29.90, -71.25, 3), ("Coquimbo", -29.95, -71.34, 2),
+    ("Antofagasta", -23.65, -70.40, 4), ("Temuco", -38.74, -72.60, 4), ("Rancagua", -34.17, -70.74, 3),
+    ("Talca", -35.43, -71.66, 3), ("Puerto Montt", -41.47, -72.94, 3), ("Iquique", -20.21, -70.15, 2),
+    ("Arica", -18.48, -70.31, 2), ("Chillán", -36.61, -72.10, 2), ("Valdivia", -39.81, -73.24, 2),
+    ("Osorno", -40.57, -73.14, 1), ("Calama", -22.46, -68.93, 1), ("Copiapó", -27.37, -70.33, 1),
+    ("Punta Arenas", -53.16, -70.91, 1), ("Los Ángeles", -37.47, -72.35, 1),
+]
+CALLES = ["Av. Libertador Bernardo O'Higgins", "Av. Providencia", "Los Carrera", "Av. Pajaritos", "Freire",
+          "Manuel Montt", "Av. Grecia", "Arturo Prat", "Colón", "Av. Alemania", "San Martín", "Baquedano"]
+NOMBRES = ["Juan", "María", "José", "Francisca", "Pedro", "Camila", "Luis", "Valentina", "Diego", "Catalina",
+           "Jorge", "Constanza", "Cristián", "Javiera", "Matías", "Fernanda"]
+APELLIDOS = ["González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva", "Martínez",
+             "Sepúlveda", "Morales", "Rodríguez", "López", "Fuentes", "Hernández", "Torres"]
+OFICIOS = {
+    "Gasfíter": "cambio de calefont, destape de cañerías, filtraciones y grifería",
+    "Electricista": "instalaciones eléctricas, tableros, enchufes y certificación SEC",
+    "Carpintero": "muebles a medida, closets, puertas y terrazas de madera",
+    "Pintor": "pintura interior y exterior, empaste y barniz",
+    "Cerrajero": "apertura de puertas, cambio de chapas y copias de llaves",
+    "Jardinero": "mantención de jardines, poda de árboles y riego automático",
+    "Albañil": "ampliaciones, radieres, muros y reparaciones de cerámica",
+    "Mecánico": "mantención de autos a domicilio, frenos y cambio de aceite",
+    "Técnico en refrigeración": "mantención de aire acondicionado, refrigeradores y cámaras de frío",
+    "Soldador": "rejas, portones, estructuras metálicas y soldadura al arco",
+    "Vidriero": "ventanas, termopaneles, espejos y shower doors",
+    "Técnico en computación": "formateo, redes wifi, recuperación de datos y reparación de notebooks",
+}
+FRASES = ["Hola, ¿tiene disponibilidad esta semana?", "Sí, puedo ir el jueves en la tarde.",
+          "¿Cuánto sale más o menos?", "Depende de lo que haya que cambiar, le mando una cotización.",
+          "Perfecto, quedo atento.", "Le mando fotos del problema.", "Ya voy en camino.",
+          "Muchas gracias, quedó impecable.", "¿Acepta transferencia?", "Mañana a primera hora entonces.",
+          "Se me pasó el agua de nuevo, ¿puede venir a revisar?", "Listo, terminado."]
+
+
+def verificar_bd_local(url, permitir_remota):
+    """Sale con error si DATABASE_URL no es un Postgres local."""
+    url = make_url(url)
+    if not url.drivername.startswith('postgresql'):
+        sys.exit("Los benchmarks necesitan Postgres (el esquema usa tsvector, GIN y upserts de Postgres)")
+    host = url.host or url.query.get('host') or ''
+    if not permitir_remota and host not in ('', 'localhost', '127.0.0.1', '::1') and not host.startswith('/'):
+        sys.exit(f"DATABASE_URL apunta a {host}: usar una BD local o pasar --permitir-remota")
+
+
+class Copiador:
+    """Acumula filas en CSV y las manda con COPY cada FILAS_POR_COPY filas."""
+
+    def __init__(self, cursor, tabla, columnas):
+        self.cursor = cursor
+        self.sql = f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)"
+        self.buffer = io.StringIO()
+        self.escritor = csv.writer(self.buffer)
+        self.pendientes = 0
+        self.total = 0
+
+    def agregar(self, fila):
+        self.escritor.writerow(fila)  # None -> campo vacío sin comillas -> NULL
+        self.pendientes += 1
+        if self.pendientes >= FILAS_POR_COPY:
+            self.enviar()
+
+    def enviar(self):
+        if self.pendientes:
+            self.buffer.seek(0)
+            self.cursor.copy_expert(self.sql, self.buffer)
+            self.total += self.pendientes
+            self.buffer = io.StringIO()
+            self.escritor = csv.writer(self.buffer)
+            self.pendientes = 0
+
+
+def _punto(rnd):
+    nombre, lat, lon, _ = rnd.choices(CIUDADES, weights=[c[3] for c in CIUDADES])[0]
+    # ~5 km de dispersión alrededor del centro
+    return nombre, round(rnd.gauss(lat, 0.045), 6), round(rnd.gauss(lon, 0.055), 6)
+
+
+def _direccion(rnd, ciudad):
+    return f"{rnd.choice(CALLES)} {rnd.randint(10, 9999)}, {ciudad}"
+
+
+def _nombre(rnd):
+    return f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}"
+
+
+def _calificaciones(semilla, indice, n_usuarios):
+    """Calificaciones del proveedor `indice` como [(usuario_indice, puntuacion)], siempre las mismas."""
+    rnd = random.Random(f"{semilla}-calificaciones-{indice}")
+    cantidad = min(n_usuarios, int(rnd.expovariate(1 / 8)))
+    return [(u, rnd.choices((1, 2, 3, 4, 5), weights=(1, 1, 3, 10, 15))[0])
+            for u in rnd.sample(range(n_usuarios), cantidad)]
+
+
+def _ids(cursor, tabla):
+    cursor.execute(f"SELECT id FROM {tabla} WHERE email LIKE %s ORDER BY id", (f"%@{DOMINIO}",))
+    return [fila[0] for fila in cursor.fetchall()]
+
+
+def _largos_conversaciones(rnd, conversaciones, mensajes):
+    """Reparte `mensajes` entre las conversaciones con una distribución de cola larga."""
+    pesos = [rnd.paretovariate(1.16) for _ in range(conversaciones)]
+    escala = mensajes / sum(pesos)
+    largos = [int(p * escala) for p in pesos]
+    for i in rnd.choices(range(conversaciones), k=mensajes - sum(largos)):
+        largos[i] += 1
+    return largos
+
+
+def generar(args):
+    rnd = random.Random(args.semilla)
+    ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+    password_hash = generate_password_hash(PASSWORD, app.config['PASSWORD_HASH_METODO'])
+    conexion = db.engine.raw_connection()
+    cursor = conexion.cursor()
+    inicio = time.time()
+    try:
+        cursor.execute("SELECT 1 FROM usuario WHERE email LIKE %s LIMIT 1", (f"%@{DOMINIO}",))
+        if cursor.fetchone():
+            sys.exit("Ya hay datos sintéticos: correr primero con --limpiar")
+
+        copia = Copiador(cursor, 'usuario', ['nombre_completo', 'email', 'password_hash', 'telefono', 'direccion',
+                                             'lat', 'lon', 'geocode_estado'])
+        for i in range(args.usuarios):
+            ciudad, lat, lon = _punto(rnd)
+            copia.agregar([_nombre(rnd), f"u{i}@{DOMINIO}", password_hash, f"+5699{rnd.randint(1000000, 9999999)}",
+                           _direccion(rnd, ciudad), lat, lon, 'OK'])
+        copia.enviar()
+        usuario_ids = _ids(cursor, 'usuario')
+        print(f"usuarios: {len(usuario_ids)} ({time.time() - inicio:.0f}s)")
+
+        copia = Copiador(cursor, 'proveedor', ['nombre_completo', 'email', 'password_hash', 'telefono', 'oficio',
+                                               'descripcion', 'direccion', 'horario', 'atiende_urgencias', 'lat',
+                                               'lon', 'geocode_estado', 'calif_suma', 'calif_total',
+                                               'calif_promedio'])
+        for i in range(args.proveedores):
+            ciudad, lat, lon = _punto(rnd)
+            oficio = rnd.choice(list(OFICIOS))
+            notas = [p for _, p in _calificaciones(args.semilla, i, len(usuario_ids))]
+            copia.agregar([
+                _nombre(rnd), f"p{i}@{DOMINIO}", password_hash, f"+5698{rnd.randint(1000000, 9999999)}", oficio,
+                f"{oficio} con {rnd.randint(1, 30)} años de experiencia: {OFICIOS[oficio]}.",
+                _direccion(rnd, ciudad), rnd.choice(["Lunes a viernes 9:00-18:00", "Todos los días", "Sábados"]),
+                rnd.random() < 0.3, lat, lon, 'OK', sum(notas), len(notas), sum(notas) / len(notas) if notas else 0,
+            ])
+        copia.enviar()
+        proveedor_ids = _ids(cursor, 'proveedor')
+        print(f"proveedores: {len(proveedor_ids)} ({time.time() - inicio:.0f}s)")
+
+        copia = Copiador(cursor, 'calificacion', ['puntuacion', 'usuario_id', 'proveedor_id', 'timestamp', 'comentario'])
+        for i, proveedor_id in enumerate(proveedor_ids):
+            for u, puntuacion in _calificaciones(args.semilla, i, len(usuario_ids)):
+                comentario = rnd.choice(["Muy recomendable", "Puntual y prolijo", "Buen precio", None])
+                copia.agregar([puntuacion, usuario_ids[u], proveedor_id,
+                               ahora - timedelta(minutes=rnd.randint(0, 525600)), comentario])
+        copia.enviar()
+        print(f"calificaciones: {copia.total} ({time.time() - inicio:.0f}s)")
+
+        parejas = set()
+        objetivo = min(args.conversaciones, len(usuario_ids) * len(proveedor_ids))
+        while len(parejas) < objetivo:
+            parejas.add((rnd.choice(usuario_ids), rnd.choice(proveedor_ids)))
+        copia = Copiador(cursor, 'conversacion', ['usuario_id', 'proveedor_id'])
+        for pareja in sorted(parejas):
+            copia.agregar(pareja)
+        copia.enviar()
+        cursor.execute("SELECT c.id, c.usuario_id, c.proveedor_id FROM conversacion c "
+                       "JOIN usuario u ON u.id = c.usuario_id WHERE u.email LIKE %s ORDER BY c.id", (f"%@{DOMINIO}",))
+        conversaciones = cursor.fetchall()
+        print(f"conversaciones: {len(conversaciones)} ({time.time() - inicio:.0f}s)")
+
+        copia_mensajes = Copiador(cursor, 'mensaje', ['conversacion_id', 'remitente_id', 'remitente_tipo',
+                                                      'contenido', 'timestamp'])
+        copia_trabajos = Copiador(cursor, 'trabajo', ['conversacion_id', 'proveedor_id', 'usuario_id', 'monto',
+                                                      'descripcion', 'estado', 'timestamp_creacion',
+                                                      'timestamp_pago', 'timestamp_fin'])
+        largos = _largos_conversaciones(rnd, len(conversaciones), args.mensajes)
+        for (conv_id, usuario_id, proveedor_id), largo in zip(conversaciones, largos):
+            # Mensajes cada ~10 minutos en promedio, terminando antes de ahora
+            pasos = [rnd.expovariate(1 / 600) for _ in range(largo)]
+            momento = ahora - timedelta(seconds=sum(pasos) + rnd.uniform(0, 30 * 86400))
+            for paso in pasos:
+                momento += timedelta(seconds=paso)
+                if rnd.random() < 0.5:
+                    copia_mensajes.agregar([conv_id, usuario_id, 'usuario', rnd.choice(FRASES), momento])
+                else:
+                    copia_mensajes.agregar([conv_id, proveedor_id, 'proveedor', rnd.choice(FRASES), momento])
+            if largo and rnd.random() < 0.3:
+                estado = rnd.choice(['COTIZADO', 'PAGADO', 'FINALIZADO'])
+                pago = momento if estado != 'COTIZADO' else None
+                fin = momento if estado == 'FINALIZADO' else None
+                copia_trabajos.agregar([conv_id, proveedor_id, usuario_id, rnd.randint(10, 500) * 1000,
+                                        "Trabajo según lo conversado", estado, momento, pago, fin])
+        copia_mensajes.enviar()
+        copia_trabajos.enviar()
+        print(f"mensajes: {copia_mensajes.total}, trabajos: {copia_trabajos.total} ({time.time() - inicio:.0f}s)")
+
+        # Todo el historial cargado queda leído: los no leídos los generan los benchmarks
+        cursor.execute("""
+            UPDATE conversacion c
+            SET leido_usuario_ts = m.timestamp, leido_usuario_id = m.id,
+                leido_proveedor_ts = m.timestamp, leido_proveedor_id = m.id
+            FROM (
+                SELECT DISTINCT ON (conversacion_id) conversacion_id, timestamp, id
+                FROM mensaje WHERE conversacion_id = ANY(%s)
+                ORDER BY conversacion_id, timestamp DESC, id DESC
+            ) m
+            WHERE m.conversacion_id = c.id
+        """, ([c[0] for c in conversaciones],))
+        conexion.commit()
+    finally:
+        conexion.close()
+
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text("ANALYZE usuario, proveedor, calificacion, conversacion, mensaje, trabajo"))
+    print(f"Listo en {time.time() - inicio:.0f}s. Contraseña de todas las cuentas: {PASSWORD}")
+
+
+def limpiar():
+    patron = {"patron": f"%@{DOMINIO}"}
+    with db.engine.begin() as conn:
+        convs = "SELECT c.id FROM conversacion c JOIN usuario u ON u.id = c.usuario_id WHERE u.email LIKE :patron"
+        for sql in (
+            f"DELETE FROM mensaje WHERE conversacion_id IN ({convs})",
+            f"DELETE FROM trabajo WHERE conversacion_id IN ({convs})",
+            "DELETE FROM conversacion WHERE usuario_id IN (SELECT id FROM usuario WHERE email LIKE :patron)"
+            " OR proveedor_id IN (SELECT id FROM proveedor WHERE email LIKE :patron)",
+            "DELETE FROM calificacion WHERE usuario_id IN (SELECT id FROM usuario WHERE email LIKE :patron)"
+            " OR proveedor_id IN (SELECT id FROM proveedor WHERE email LIKE :patron)",
+            "DELETE FROM portafolio WHERE proveedor_id IN (SELECT id FROM proveedor WHERE email LIKE :patron)",
+            "DELETE FROM proveedor WHERE email LIKE :patron",
+            "DELETE FROM usuario WHERE email LIKE :patron",
+        ):
+            resultado = conn.execute(text(sql), patron)
+            print(f"{resultado.rowcount:>10}  {sql.split(' WHERE')[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga datos sintéticos para los benchmarks")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--usuarios", type=int, default=5000)
+    parser.add_argument("--proveedores", type=int, default=10000)
+    parser.add_argument("--conversaciones", type=int, default=20000)
+    parser.add_argument("--mensajes", type=int, default=500000)
+    parser.add_argument("--limpiar", action="store_true", help="Borrar los datos sintéticos y salir")
+    parser.add_argument("--permitir-remota", action="store_true", help="Permitir una BD que no es local")
+    args = parser.parse_args()
+
+    verificar_bd_local(app.config['SQLALCHEMY_DATABASE_URI'], args.permitir_remota)
+    with app.app_context():
+        if args.limpiar:
+            limpiar()
+        else:
+            generar(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Escritura diferida (write-behind) de mensajes de chat.
+
+Con MENSAJES_WRITE_BEHIND activo, el mensaje se emite a la sala apenas llega
+y queda en un buffer en memoria; una tarea de fondo lo escribe en la BD con
+INSERTs de varias filas cada pocos milisegundos (o apenas se juntan
+max_lote mensajes). Así el commit a la BD remota deja de estar en el camino
+de cada mensaje.
+
+Garantías:
+- Orden: el id (reservado por adelantado de mensaje_id_seq) y el timestamp se
+  asignan al entrar al buffer, así que el historial (timestamp, id) queda en
+  el orden en que se aceptaron los mensajes, aunque se escriban después.
+- Durabilidad: si la BD no responde (error de conexión) el lote vuelve al
+  inicio del buffer y se reintenta. Si la BD rechaza el lote por los datos
+  (ej: la conversación ya no existe), se parte en mitades hasta aislar las
+  filas malas: esas van a cuarentena (se imprimen y quedan en `descartados`)
+  y el resto se escribe, así una fila mala no bloquea a las siguientes.
+- Al cerrar el proceso se vacía el buffer (detener()), también con SIGTERM y
+  SIGINT (instalar_cierre()). Lo que se pierde ante una caída abrupta
+  (SIGKILL, corte de luz) es a lo más lo aceptado en el último intervalo.
+- Si el buffer está lleno (ej: la BD no responde), agregar() retorna None y
+  el llamador guarda el mensaje de forma síncrona.
+"""
+import atexit
+import json
+import signal
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from app import app, db, socketio, Mensaje
+from tareas import ejecutar_bloqueante
+
+
+class BufferMensajes:
+
+    def __init__(self, intervalo_ms=20, max_lote=200, capacidad=5000):
+        self.intervalo = intervalo_ms / 1000
+        self.max_lote = max_lote
+        self.capacidad = capacidad
+        self._pendientes = deque()
+        self._ids_reservados = deque()
+        self._vaciando = False
+        self._lock = threading.Lock()
+        self._lock_escritura = threading.Lock()
+        self._latencias_ms = deque(maxlen=1000)
+        self.descartados = deque(maxlen=1000)  # (fila, error) rechazadas por la BD
+        self.contadores = {"aceptados": 0, "escritos": 0, "lotes": 0, "lote_max": 0,
+                           "sincronos": 0, "errores": 0, "descartados": 0}
+
+    def __len__(self):
+        return len(self._pendientes)
+
+    def agregar(self, conversacion_id, remitente_id, remitente_tipo, contenido):
+        """
+        Acepta un mensaje para escritura diferida y retorna la fila (dict con
+        id y timestamp ya asignados), o None si el buffer está lleno.
+        """
+        if len(self._pendientes) >= self.capacidad:
+            self.contadores["sincronos"] += 1
+            return None
+        if not self._ids_reservados:
+            self._reservar_ids()
+        with self._lock:
+            if len(self._pendientes) >= self.capacidad or not self._ids_reservados:
+                self.contadores["sincronos"] += 1
+                return None
+            fila = {
+                "id": self._ids_reservados.popleft(),
+                "conversacion_id": conversacion_id,
+                "remitente_id": remitente_id,
+                "remitente_tipo": remitente_tipo,
+                "contenido": contenido,
+                # Misma convención que el default de la columna: UTC sin zona
+                "timestamp": datetime.now(timezone.utc).replace(tzinfo=None),
+            }
+            self._pendientes.append(fila)
+            self.contadores["aceptados"] += 1
+            iniciar_vaciador = not self._vaciando
+            self._vaciando = True
+        if iniciar_vaciador:
+            socketio.start_background_task(self._vaciador)
+        return fila
+
+    def _reservar_ids(self):
+        with app.app_context(), db.engine.connect() as conn:
+            ids = conn.execute(
+                text("SELECT nextval('mensaje_id_seq') FROM generate_series(1, :n)"), {"n": self.max_lote}
+            ).scalars().all()
+        with self._lock:
+            self._ids_reservados.extend(sorted(ids))
+
+    # --- ESCRITURA ---
+
+    def _vaciador(self):
+        espera = self.intervalo
+        while True:
+            socketio.sleep(espera)
+            with self._lock:
+                if not self._pendientes:
+                    self._vaciando = False
+                    return
+            try:
+                ejecutar_bloqueante(self.vaciar)
+                espera = self.intervalo
+            except Exception as e:
+                self.contadores["errores"] += 1
+                print(f"[MENSAJES] Error escribiendo lote, se reintentará: {e}")
+                espera = min(max(espera * 2, 0.1), 5.0)
+
+    def vaciar(self):
+        """
+        Escribe todo lo pendiente en lotes de max_lote filas. Lanza excepción si
+        no se pudo conectar a la BD; lo no escrito queda al inicio del buffer.
+        """
+        with self._lock_escritura:
+            while True:
+                with self._lock:
+                    lote = [self._pendientes.popleft() for _ in range(min(self.max_lote, len(self._pendientes)))]
+                if not lote:
+                    return
+                inicio = time.perf_counter()
+                self._escribir(lote)
+                self._latencias_ms.append((time.perf_counter() - inicio) * 1000)
+                self.contadores["lotes"] += 1
+                self.contadores["lote_max"] = max(self.contadores["lote_max"], len(lote))
+
+    def _escribir(self, lote):
+        # Pila de partes por escribir, la siguiente al final
+        partes = [lote]
+        while partes:
+            parte = partes.pop()
+            try:
+                with app.app_context(), db.engine.begin() as conn:
+                    # executemany de un INSERT sin RETURNING -> INSERT ... VALUES (...), (...), ...
+                    conn.execute(insert(Mensaje.__table__), parte)
+            except Exception as e:
+                if _es_transitorio(e):
+                    restantes = parte + [fila for p in reversed(partes) for fila in p]
+                    with self._lock:
+                        self._pendientes.extendleft(reversed(restantes))  # Conservamos el orden
+                    raise
+                if len(parte) == 1:
+                    self._cuarentena(parte[0], e)
+                else:
+                    mitad = len(parte) // 2
+                    partes += [parte[mitad:], parte[:mitad]]
+                continue
+            self.contadores["escritos"] += len(parte)
+
+    def _cuarentena(self, fila, error):
+        """La BD rechazó la fila por sus datos: reintentarla no sirve, la dejamos registrada."""
+        self.contadores["descartados"] += 1
+        self.descartados.append((fila, str(error.orig if isinstance(error, DBAPIError) else error)))
+        print(f"[MENSAJES] Mensaje descartado por la BD ({type(error).__name__}): "
+              f"{json.dumps(fila, default=str, ensure_ascii=False)}")
+
+    def detener(self):
+        """Escribe lo pendiente antes de cerrar el proceso."""
+        try:
+            self.vaciar()
+        except Exception as e:
+            print(f"[MENSAJES] No se pudieron escribir {len(self._pendientes)} mensajes al cerrar: {e}")
+
+    def instalar_cierre(self):
+        """
+        Vacía el buffer al terminar el proceso. atexit no corre con SIGTERM
+        (systemd, docker, servidor.py), así que SIGTERM y SIGINT se convierten
+        en SystemExit: eventlet lo propaga hasta socketio.run() y el proceso
+        sale por el camino normal, pasando por detener(). No se vacía dentro del
+        manejador porque la señal puede llegar con self._lock tomado.
+        """
+        atexit.register(self.detener)
+        if threading.current_thread() is threading.main_thread():
+            for senal in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(senal, _salir_por_senal)
+
+    # --- MÉTRICAS ---
+
+    def estadisticas(self):
+        latencias = sorted(self._latencias_ms)
+
+        def percentil(p):
+            return round(latencias[min(len(latencias) - 1, int(p * len(latencias)))], 2) if latencias else None
+
+        lotes = self.contadores["lotes"]
+        return dict(
+            self.contadores,
+            pendientes=len(self._pendientes),
+            lote_promedio=round(self.contadores["escritos"] / lotes, 1) if lotes else None,
+            flush_ms_p50=percentil(0.50),
+            flush_ms_p95=percentil(0.95),
+            flush_ms_max=round(latencias[-1], 2) if latencias else None,
+        )
+
+
+def _es_transitorio(error):
+    """
+    True si el error es de conexión (reintentar). Cualquier otro (datos del
+    lote, StatementError al convertir parámetros, bugs) pasa a la división en
+    mitades y la cuarentena, para no bloquear a los mensajes siguientes.
+    """
+    if isinstance(error, (OperationalError, InterfaceError)):
+        return True
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated
+    return False
+
+
+def _salir_por_senal(senal, _frame):
+    print(f"[MENSAJES] Señal {signal.Signals(senal).name}: vaciando el buffer antes de salir")
+    raise SystemExit(128 + senal)
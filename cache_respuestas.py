@@ -0,0 +1,199 @@
+"""
+Cache de respuestas JSON ya serializadas (ej: perfil público de un proveedor).
+
+Cada entrada guarda el cuerpo de la respuesta y su ETag (hash del cuerpo), así
+que una visita repetida con If-None-Match se responde con 304 sin ir a la BD.
+Las rutas que modifican los datos invalidan la clave exacta.
+
+Niveles:
+1. LRU en memoria del proceso.
+2. Opcional: un backend compartido entre procesos (RESPUESTAS_CACHE_URL,
+   ej: redis://...). Con backend compartido las entradas locales solo se usan
+   durante ttl_local segundos, que es el máximo que un proceso puede servir
+   una versión ya invalidada por otro.
+
+El contador de invalidaciones de cada clave también vive en el backend
+compartido: una respuesta armada con datos leídos antes de una invalidación
+(de cualquier proceso) no se escribe, porque el guardado compara la versión
+leída antes de consultar la BD con la actual en el mismo paso.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def calcular_etag(cuerpo):
+    return hashlib.sha256(cuerpo).hexdigest()[:32]
+
+
+# Guarda el cuerpo solo si la versión de la clave y la generación siguen siendo las leídas
+_GUARDAR_SI_VERSION = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[3] or (redis.call('GET', KEYS[3]) or '0') ~= ARGV[4] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+
+class BackendRedis:
+    """
+    Backend compartido sobre Redis (requiere el paquete redis). Junto a cada
+    cuerpo lleva la versión de la clave (sube en cada invalidación) y una
+    generación común a todas (sube en cada limpiar()).
+    """
+
+    # Más que cualquier petición: si la versión vence, vuelve a 0 y no debe coincidir por error
+    TTL_VERSION = 86400
+
+    def __init__(self, url, prefijo="zerby:respuestas:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPUESTAS_CACHE_URL usa Redis: instalar el paquete redis")
+        self.cliente = redis.Redis.from_url(url)
+        self.prefijo = prefijo
+        # Fuera de prefijo*, para que limpiar() no borre los contadores
+        self.prefijo_version = prefijo.rstrip(":") + "-version:"
+        self.clave_generacion = prefijo.rstrip(":") + "-generacion"
+        self._guardar_si_version = self.cliente.register_script(_GUARDAR_SI_VERSION)
+
+    def obtener(self, clave):
+        return self.cliente.get(self.prefijo + clave)
+
+    def version(self, clave):
+        version, generacion = self.cliente.mget([self.prefijo_version + clave, self.clave_generacion])
+        return int(version or 0), int(generacion or 0)
+
+    def guardar(self, clave, valor, ttl, version=None):
+        """Retorna False si `version` (de version()) ya no es la actual y no se guardó."""
+        if version is None:
+            self.cliente.set(self.prefijo + clave, valor, ex=ttl)
+            return True
+        claves = [self.prefijo + clave, self.prefijo_version + clave, self.clave_generacion]
+        return bool(self._guardar_si_version(keys=claves, args=[valor, ttl, *version]))
+
+    def eliminar(self, clave):
+        # En una transacción: ningún guardado puede quedar entre el INCR y el DEL
+        with self.cliente.pipeline() as pipe:
+            pipe.incr(self.prefijo_version + clave)
+            pipe.expire(self.prefijo_version + clave, self.TTL_VERSION)
+            pipe.delete(self.prefijo + clave)
+            pipe.execute()
+
+    def limpiar(self):
+        # Primero la generación: lo que se esté armando con datos anteriores ya no se guarda
+        self.cliente.incr(self.clave_generacion)
+        for clave in self.cliente.scan_iter(match=self.prefijo + "*"):
+            self.cliente.delete(clave)
+
+
+def crear_backend_compartido(url):
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://')):
+        return BackendRedis(url)
+    raise RuntimeError(f"RESPUESTAS_CACHE_URL no soportada: {url}")
+
+
+class CacheRespuestas:
+
+    def __init__(self, max_items=2000, ttl=300, compartido=None, ttl_local=5):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.compartido = compartido
+        # Sin backend compartido la invalidación es exacta y vale el TTL completo
+        self.ttl_local = ttl_local if compartido is not None else ttl
+        self._memoria = OrderedDict()  # clave -> (cuerpo, etag, expira_en)
+        self._versiones = {}  # clave -> cantidad de invalidaciones
+        self._lock = threading.Lock()
+        self.contadores = {"hits_memoria": 0, "hits_compartido": 0, "misses": 0, "invalidaciones": 0}
+
+    def estadisticas(self):
+        return dict(self.contadores, items_memoria=len(self._memoria))
+
+    def obtener(self, clave):
+        """Retorna (cuerpo, etag) o None."""
+        with self._lock:
+            item = self._memoria.get(clave)
+            if item is not None:
+                cuerpo, etag, expira_en = item
+                if expira_en >= time.time():
+                    self._memoria.move_to_end(clave)
+                    self.contadores["hits_memoria"] += 1
+                    return cuerpo, etag
+                del self._memoria[clave]
+
+        if self.compartido is not None:
+            try:
+                valor = self.compartido.obtener(clave)
+            except Exception as e:
+                print(f"No se pudo leer la cache compartida de respuestas: {e}")
+                valor = None
+            if valor is not None:
+                etag, cuerpo = valor.split(b"\n", 1)
+                etag = etag.decode()
+                self._escribir_memoria(clave, cuerpo, etag)
+                self.contadores["hits_compartido"] += 1
+                return cuerpo, etag
+
+        self.contadores["misses"] += 1
+        return None
+
+    def version(self, clave):
+        """
+        Leer antes de consultar la BD y pasarla a guardar(). Retorna (versión
+        local, versión compartida); la compartida es None sin backend o si no se
+        pudo leer, y entonces la respuesta no se escribe en el backend.
+        """
+        compartida = None
+        if self.compartido is not None:
+            try:
+                compartida = self.compartido.version(clave)
+            except Exception as e:
+                print(f"No se pudo leer la versión en la cache compartida de respuestas: {e}")
+        return self._versiones.get(clave, 0), compartida
+
+    def guardar(self, clave, cuerpo, version=None):
+        """
+        Guarda el cuerpo (bytes) y retorna su ETag. Si se pasa `version` y la
+        clave se invalidó mientras se armaba la respuesta (en este proceso o en
+        otro), no se guarda: los datos leídos pueden ser anteriores al cambio.
+        """
+        etag = calcular_etag(cuerpo)
+        if version is not None and version[0] != self._versiones.get(clave, 0):
+            return etag
+        if self.compartido is not None and (version is None or version[1] is not None):
+            try:
+                if not self.compartido.guardar(clave, etag.encode() + b"\n" + cuerpo, self.ttl,
+                                               None if version is None else version[1]):
+                    return etag
+            except Exception as e:
+                print(f"No se pudo guardar en la cache compartida de respuestas: {e}")
+        self._escribir_memoria(clave, cuerpo, etag)
+        return etag
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._memoria.pop(clave, None)
+            self._versiones[clave] = self._versiones.get(clave, 0) + 1
+        self.contadores["invalidaciones"] += 1
+        if self.compartido is not None:
+            try:
+                self.compartido.eliminar(clave)
+            except Exception as e:
+                print(f"No se pudo invalidar la cache compartida de respuestas: {e}")
+
+    def limpiar(self):
+        with self._lock:
+            self._memoria.clear()
+        if self.compartido is not None:
+            self.compartido.limpiar()
+
+    def _escribir_memoria(self, clave, cuerpo, etag):
+        with self._lock:
+            self._memoria[clave] = (cuerpo, etag, time.time() + self.ttl_local)
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_items:
+                self._memoria.popitem(last=False)
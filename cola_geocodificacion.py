@@ -0,0 +1,99 @@
+"""
+Cola de geocodificación en segundo plano.
+
+Los registros y actualizaciones de perfil guardan la dirección con
+geocode_estado='PENDIENTE' y responden de inmediato. Esta cola resuelve las
+coordenadas con concurrencia acotada y un límite de consultas por segundo
+(solo para las consultas reales al geocodificador, no para los aciertos de
+cache), escribe lat/lon en la BD y avisa al cliente por Socket.IO. Si el
+geocodificador falla por la red, la fila queda PENDIENTE para el backfill.
+
+Los trabajadores son tareas de fondo de Flask-SocketIO (greenlets con
+eventlet) y la llamada de red se hace con ejecutar_bloqueante(), así que
+nunca bloquean el loop de eventos.
+"""
+import threading
+from collections import deque
+
+from sqlalchemy import update
+
+from app import app, db, socketio, Usuario, Proveedor
+from geocodificacion import ErrorGeocodificacion
+from tareas import ejecutar_bloqueante
+
+MODELOS = {'usuario': Usuario, 'proveedor': Proveedor}
+
+
+class ColaGeocodificacion:
+
+    def __init__(self, cache, limitador, concurrencia=2, capacidad=1000, al_terminar=None):
+        """
+        - cache: CacheGeocodificacion (en_cache sin límite, consultar con límite).
+        - limitador: LimitadorTasa compartido por todos los trabajadores.
+        - al_terminar: callable(tipo, entidad_id, lat, lon) que se llama
+          después de guardar el resultado (ej: actualizar índices y avisar).
+        """
+        self.cache = cache
+        self.limitador = limitador
+        self.concurrencia = concurrencia
+        self.capacidad = capacidad
+        self.al_terminar = al_terminar
+        self._pendientes = deque()
+        self._activos = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pendientes)
+
+    def encolar(self, tipo, entidad_id, direccion):
+        """
+        Agrega un trabajo. Retorna False si la cola está llena; en ese caso la
+        fila queda PENDIENTE y la recoge el backfill (backfill_coordenadas.py).
+        """
+        with self._lock:
+            if len(self._pendientes) >= self.capacidad:
+                print(f"[GEOCODING] Cola llena, {tipo} {entidad_id} queda pendiente")
+                return False
+            self._pendientes.append((tipo, entidad_id, direccion))
+            iniciar_trabajador = self._activos < self.concurrencia
+            if iniciar_trabajador:
+                self._activos += 1
+        if iniciar_trabajador:
+            socketio.start_background_task(self._trabajador)
+        return True
+
+    def _trabajador(self):
+        while True:
+            with self._lock:
+                if not self._pendientes:
+                    self._activos -= 1
+                    return
+                trabajo = self._pendientes.popleft()
+            try:
+                self._procesar(*trabajo)
+            except Exception as e:
+                print(f"[GEOCODING] Error procesando {trabajo}: {e}")
+
+    def _procesar(self, tipo, entidad_id, direccion):
+        coords = ejecutar_bloqueante(self.cache.en_cache, direccion)
+        if coords is None:
+            self.limitador.esperar(dormir=socketio.sleep)
+            try:
+                coords = ejecutar_bloqueante(self.cache.consultar, direccion)
+            except ErrorGeocodificacion as e:
+                print(f"[GEOCODING] {tipo} {entidad_id} queda pendiente: {e}")
+                return
+        lat, lon = coords
+        estado = 'OK' if lat is not None else 'FALLIDO'
+
+        modelo = MODELOS[tipo]
+        with app.app_context():
+            # Solo escribimos si la dirección no cambió mientras esperábamos
+            resultado = db.session.execute(
+                update(modelo)
+                .where(modelo.id == entidad_id, modelo.direccion == direccion)
+                .values(lat=lat, lon=lon, geocode_estado=estado)
+            )
+            db.session.commit()
+            if resultado.rowcount and self.al_terminar:
+                self.al_terminar(tipo, entidad_id, lat, lon)
@@ -0,0 +1,135 @@
+"""
+Cola de procesamiento de fotos del portafolio en segundo plano.
+
+api_add_portafolio guarda la foto original en PORTAFOLIO_PENDIENTES_FOLDER como
+<id>.orig (fuera de static/, porque todavía trae metadatos), crea el Portafolio con
+estado='PROCESANDO' y responde de inmediato. Esta cola genera las variantes
+(imagenes.py) con concurrencia acotada, las guarda en el almacén por
+contenido (archivos.py), las registra en el Portafolio, borra la original y
+llama a al_terminar (invalidar cache, avisar al proveedor).
+
+Igual que la cola de geocodificación: los trabajadores son tareas de fondo de
+Flask-SocketIO y el trabajo de CPU va por ejecutar_bloqueante(), así que no
+bloquea el loop de eventos.
+"""
+import io
+import os
+import threading
+from collections import deque
+
+from sqlalchemy import update
+
+from app import app, db, socketio, Portafolio
+from archivos import agregar_referencias, almacen, claves_de
+import imagenes
+from tareas import ejecutar_bloqueante
+
+
+# Antes la original pendiente se guardaba con la extensión del archivo subido
+_EXTENSIONES_ANTERIORES = ('png', 'jpg', 'jpeg', 'gif', 'webp')
+
+
+def ruta_pendiente(item_id):
+    """Ruta fija de la original de un item mientras se procesa (Pillow detecta el formato por el contenido)."""
+    return os.path.join(app.config['PORTAFOLIO_PENDIENTES_FOLDER'], f"{item_id}.orig")
+
+
+def original_pendiente(item_id):
+    """Ruta de la original pendiente de un item, o None si no existe. No lista la carpeta."""
+    ruta = ruta_pendiente(item_id)
+    if os.path.exists(ruta):
+        return ruta
+    carpeta = app.config['PORTAFOLIO_PENDIENTES_FOLDER']
+    for extension in _EXTENSIONES_ANTERIORES:
+        ruta = os.path.join(carpeta, f"{item_id}.{extension}")
+        if os.path.exists(ruta):
+            return ruta
+    return None
+
+
+def procesar_foto(ruta):
+    """Genera y guarda las variantes de una foto. Retorna la lista para Portafolio.variantes."""
+    variantes = []
+    for v in imagenes.generar_variantes(ruta, app.config['PORTAFOLIO_ANCHOS'], app.config['PORTAFOLIO_CALIDAD']):
+        webp, _ = almacen.guardar(io.BytesIO(v["webp"]), 'webp')
+        jpeg, _ = almacen.guardar(io.BytesIO(v["jpeg"]), 'jpg')
+        variantes.append({"ancho": v["ancho"], "alto": v["alto"], "webp": webp, "jpeg": jpeg})
+    return variantes
+
+
+def guardar_resultado(item_id, variantes):
+    """
+    Registra el resultado de procesar_foto (o None si falló). Retorna False si
+    el item ya no está PROCESANDO (ej: se borró); sus archivos quedan sin
+    referencias y los borra limpiar_archivos.py.
+    """
+    if variantes:
+        valores = dict(estado='LISTO', variantes=variantes, imagen_url=almacen.url(variantes[-1]["jpeg"]))
+    else:
+        valores = dict(estado='FALLIDO')
+    resultado = db.session.execute(
+        update(Portafolio)
+        .where(Portafolio.id == item_id, Portafolio.estado == 'PROCESANDO')
+        .values(**valores)
+    )
+    if resultado.rowcount:
+        agregar_referencias(claves_de(variantes))
+    db.session.commit()
+    return bool(resultado.rowcount)
+
+
+class ColaImagenes:
+
+    def __init__(self, concurrencia=2, capacidad=200, al_terminar=None):
+        """al_terminar: callable(item_id, proveedor_id) que se llama (con app_context) después de guardar el resultado."""
+        self.concurrencia = concurrencia
+        self.capacidad = capacidad
+        self.al_terminar = al_terminar
+        self._pendientes = deque()
+        self._activos = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pendientes)
+
+    def encolar(self, item_id, proveedor_id, ruta):
+        """
+        Agrega una foto. Retorna False si la cola está llena; el item queda
+        PROCESANDO y lo recoge procesar_portafolio.py.
+        """
+        with self._lock:
+            if len(self._pendientes) >= self.capacidad:
+                print(f"[IMAGENES] Cola llena, portafolio {item_id} queda pendiente")
+                return False
+            self._pendientes.append((item_id, proveedor_id, ruta))
+            iniciar_trabajador = self._activos < self.concurrencia
+            if iniciar_trabajador:
+                self._activos += 1
+        if iniciar_trabajador:
+            socketio.start_background_task(self._trabajador)
+        return True
+
+    def _trabajador(self):
+        while True:
+            with self._lock:
+                if not self._pendientes:
+                    self._activos -= 1
+                    return
+                trabajo = self._pendientes.popleft()
+            try:
+                self._procesar(*trabajo)
+            except Exception as e:
+                print(f"[IMAGENES] Error procesando {trabajo}: {e}")
+
+    def _procesar(self, item_id, proveedor_id, ruta):
+        try:
+            variantes = ejecutar_bloqueante(procesar_foto, ruta)
+        except Exception as e:
+            print(f"[IMAGENES] No se pudo procesar la foto del portafolio {item_id}: {e}")
+            variantes = None
+
+        with app.app_context():
+            guardado = guardar_resultado(item_id, variantes)
+            imagenes.borrar_archivos([ruta])
+            if guardado and self.al_terminar:
+                self.al_terminar(item_id, proveedor_id)
@@ -0,0 +1,126 @@
+"""
+Cola de mensajes para Socket.IO con varios procesos.
+
+Con un solo proceso, socketio.emit(..., room=...) solo llega a los clientes
+conectados a ese proceso. Con una cola compartida cada emit se publica y todos
+los procesos lo reenvían a sus propios clientes; también permite emitir desde
+procesos externos (scripts, tareas) con emisor_externo().
+
+SOCKETIO_MESSAGE_QUEUE acepta:
+- redis://... o rediss://...  -> RedisManager de python-socketio (requiere el paquete redis)
+- amqp://...                  -> KombuManager (requiere el paquete kombu)
+- postgresql://...            -> LISTEN/NOTIFY de Postgres, sin infraestructura extra.
+  Usar una conexión directa (no el pooler de Neon: LISTEN no funciona en modo transacción).
+"""
+import json
+import select
+import threading
+import uuid
+
+import psycopg2
+import socketio
+
+# NOTIFY acepta hasta 8000 bytes; partimos los mensajes largos en trozos que
+# caben aunque todos los caracteres ocupen 4 bytes en UTF-8
+_CARACTERES_POR_TROZO = 1900
+
+
+class PostgresManager(socketio.PubSubManager):
+    """Gestor de clientes de Socket.IO sobre LISTEN/NOTIFY de Postgres."""
+
+    name = 'postgres'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.url = url
+        self._conexion_publicar = None
+        self._lock = threading.Lock()
+
+    def _publish(self, data):
+        mensaje = json.dumps(data)
+        if len(mensaje) <= _CARACTERES_POR_TROZO:
+            trozos = [mensaje]
+        else:
+            # Los NOTIFY de una transacción llegan juntos y en orden, así que
+            # basta con numerar los trozos para rearmarlos al otro lado
+            mensaje_id = uuid.uuid4().hex
+            partes = [mensaje[i:i + _CARACTERES_POR_TROZO] for i in range(0, len(mensaje), _CARACTERES_POR_TROZO)]
+            trozos = [f"{mensaje_id}:{i}:{len(partes)}:{parte}" for i, parte in enumerate(partes)]
+
+        with self._lock:
+            for intento in range(2):
+                try:
+                    if self._conexion_publicar is None or self._conexion_publicar.closed:
+                        self._conexion_publicar = psycopg2.connect(self.url)
+                    with self._conexion_publicar.cursor() as cur:
+                        for trozo in trozos:
+                            cur.execute("SELECT pg_notify(%s, %s)", (self.channel, trozo))
+                    self._conexion_publicar.commit()
+                    return
+                except psycopg2.OperationalError:
+                    # Conexión caída: reintentamos una vez con una nueva
+                    self._conexion_publicar = None
+                    if intento:
+                        raise
+
+    def _listen(self):
+        # Con eventlet hay que esperar con el select "verde" para no bloquear el proceso
+        espera = select
+        if self.server is not None and self.server.async_mode == 'eventlet':
+            from eventlet.green import select as espera
+
+        conexion = None
+        while conexion is None:
+            try:
+                conexion = psycopg2.connect(self.url)
+            except psycopg2.OperationalError as e:
+                self._get_logger().error(f"No se pudo conectar a la cola de Socket.IO: {e}")
+                self.server.sleep(2)
+        conexion.set_session(autocommit=True)
+        with conexion.cursor() as cur:
+            cur.execute(f'LISTEN "{self.channel}"')
+
+        pendientes = {}  # mensaje_id -> [trozos]
+        try:
+            while True:
+                espera.select([conexion], [], [], 5)
+                conexion.poll()
+                while conexion.notifies:
+                    payload = conexion.notifies.pop(0).payload
+                    if payload.startswith('{'):
+                        yield payload
+                        continue
+                    mensaje_id, i, total, parte = payload.split(':', 3)
+                    trozos = pendientes.setdefault(mensaje_id, [])
+                    trozos.append(parte)
+                    if int(i) == int(total) - 1:
+                        del pendientes[mensaje_id]
+                        if len(trozos) == int(total):
+                            yield ''.join(trozos)
+        finally:
+            conexion.close()
+
+
+def crear_gestor_clientes(url, write_only=False):
+    """Retorna el client_manager para la URL de cola dada, o None para un solo proceso."""
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.RedisManager(url, write_only=write_only)
+    if url.startswith('amqp://'):
+        return socketio.KombuManager(url, write_only=write_only)
+    if url.startswith(('postgresql://', 'postgres://')):
+        return PostgresManager(url, write_only=write_only)
+    raise RuntimeError(f"SOCKETIO_MESSAGE_QUEUE no soportada: {url}")
+
+
+def emisor_externo(url):
+    """
+    Gestor de solo escritura para emitir a las salas desde fuera del servidor:
+
+        emisor = emisor_externo(os.getenv("SOCKETIO_MESSAGE_QUEUE"))
+        emisor.emit("receive_message", datos, room="chat_1", namespace="/")
+    """
+    if not url:
+        raise RuntimeError("Para emitir desde otro proceso hay que configurar SOCKETIO_MESSAGE_QUEUE")
+    return crear_gestor_clientes(url, write_only=True)
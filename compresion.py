@@ -0,0 +1,90 @@
+"""
+Compresión negociada de respuestas (gzip o brotli) según Accept-Encoding.
+
+Se comprimen solo las respuestas de tipo texto (JSON, HTML, JS, CSS, SVG) de
+al menos COMPRESION_MIN_BYTES: por debajo de ~1 KB el ahorro no compensa el
+costo de CPU. Brotli se usa si el cliente lo acepta y está instalado el
+paquete brotli; si no, gzip. Los archivos servidos con send_file (estáticos,
+fotos) no pasan por aquí.
+
+El ETag de una respuesta comprimida lleva el sufijo de la codificación
+("abc-gzip"), porque el cuerpo enviado es otro; al revalidar con ese ETag se
+responde 304 sin volver a comprimir.
+"""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TIPOS_COMPRIMIBLES = ('application/json', 'text/', 'application/javascript', 'image/svg+xml')
+
+
+def _aceptadas(cabecera):
+    """Codificaciones aceptadas por el cliente (q > 0)."""
+    aceptadas = set()
+    for parte in cabecera.split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        q = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                q = float(parametros[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            aceptadas.add(nombre.strip().lower())
+    return aceptadas
+
+
+def elegir_codificacion(cabecera):
+    aceptadas = _aceptadas(cabecera or '')
+    if brotli is not None and 'br' in aceptadas:
+        return 'br'
+    if 'gzip' in aceptadas or '*' in aceptadas:
+        return 'gzip'
+    return None
+
+
+def comprimir(cuerpo, codificacion, nivel_gzip=6, calidad_brotli=4):
+    if codificacion == 'br':
+        return brotli.compress(cuerpo, quality=calidad_brotli)
+    # mtime=0 para que el mismo cuerpo comprima siempre a los mismos bytes
+    return gzip.compress(cuerpo, compresslevel=nivel_gzip, mtime=0)
+
+
+def registrar_compresion(app):
+    @app.after_request
+    def comprimir_respuesta(respuesta):
+        minimo = app.config['COMPRESION_MIN_BYTES']
+        if (not minimo or request.method == 'HEAD' or respuesta.status_code != 200
+                or respuesta.direct_passthrough or respuesta.is_streamed
+                or 'Content-Encoding' in respuesta.headers
+                or not (respuesta.mimetype or '').startswith(TIPOS_COMPRIMIBLES)):
+            return respuesta
+
+        # La respuesta varía según Accept-Encoding aunque esta vez no se comprima
+        respuesta.vary.add('Accept-Encoding')
+        if (respuesta.content_length or 0) < minimo:
+            return respuesta
+        codificacion = elegir_codificacion(request.headers.get('Accept-Encoding'))
+        if codificacion is None:
+            return respuesta
+
+        etag, debil = respuesta.get_etag()
+        if etag:
+            respuesta.set_etag(f"{etag}-{codificacion}", weak=debil)
+            respuesta.make_conditional(request)
+            if respuesta.status_code == 304:
+                return respuesta
+
+        respuesta.set_data(comprimir(respuesta.get_data(), codificacion,
+                                     app.config['COMPRESION_NIVEL_GZIP'],
+                                     app.config['COMPRESION_CALIDAD_BROTLI']))
+        respuesta.headers['Content-Encoding'] = codificacion
+        return respuesta
+
+    return comprimir_respuesta
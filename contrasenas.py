@@ -0,0 +1,45 @@
+"""
+Hash y verificación de contraseñas fuera del loop de eventos.
+
+scrypt y PBKDF2 cuestan decenas de milisegundos de CPU a propósito. Con
+eventlet, calcularlos dentro del request congela todos los sockets del proceso
+mientras duran, así que se mandan al pool de hilos. hashlib libera el GIL, por
+lo que corren en paralelo de verdad. Como mucho PASSWORD_CONCURRENCIA a la vez:
+scrypt usa ~32 MB por cálculo y el pool también lo usan otras tareas.
+
+Los hashes guardados con parámetros distintos de PASSWORD_HASH_METODO se
+recalculan en el siguiente login correcto (ver necesita_rehash).
+"""
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app import app
+from tareas import crear_semaforo, ejecutar_bloqueante
+
+_semaforo = crear_semaforo(app.config['PASSWORD_CONCURRENCIA'])
+_hash_ficticio = []
+
+
+def hashear(password):
+    with _semaforo:
+        return ejecutar_bloqueante(generate_password_hash, password, app.config['PASSWORD_HASH_METODO'])
+
+
+def verificar(password_hash, password):
+    with _semaforo:
+        return ejecutar_bloqueante(check_password_hash, password_hash, password)
+
+
+def verificar_sin_cuenta(password):
+    """
+    Hace el mismo trabajo que verificar() cuando el email no existe, para que
+    el tiempo de respuesta no revele qué emails están registrados.
+    """
+    if not _hash_ficticio:
+        _hash_ficticio.append(hashear("zerby-sin-cuenta"))
+    verificar(_hash_ficticio[0], password)
+    return False
+
+
+def necesita_rehash(password_hash):
+    """True si el hash no usa el método y parámetros actuales (ej: pbkdf2 antiguo)."""
+    return password_hash.split('$', 1)[0] != app.config['PASSWORD_HASH_METODO']
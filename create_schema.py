@@ -1,5 +1,8 @@
-from app import app, db
-
-with app.app_context():
-    db.create_all()
-    print("tablas creadas correctamente")
\ No newline at end of file
+from flask_migrate import upgrade
+from app import app
+
+# Aplica las migraciones pendientes (carpeta migrations/).
+# Si la BD se creó antes con db.create_all(), primero: flask --app app db stamp 0001
+with app.app_context():
+    upgrade()
+    print("esquema actualizado a la última migración")
@@ -0,0 +1,129 @@
+"""
+Motor de distancias vectorizado para rankear proveedores.
+
+Mantiene las coordenadas de los proveedores en arreglos contiguos de NumPy
+(ya convertidas a radianes) y calcula la distancia Haversine a todos los
+candidatos en una sola operación. El top-k se obtiene con argpartition en
+vez de ordenar la lista completa.
+
+Expone la misma interfaz que IndiceGeografico (reconstruir, actualizar,
+eliminar, cercanos), así que routes.py puede usar cualquiera de los dos.
+"""
+import threading
+import time
+
+import numpy as np
+
+from indice_geo import RADIO_TIERRA_KM
+
+
+class MatrizDistancias:
+    """Coordenadas de proveedores en arreglos NumPy con crecimiento amortizado."""
+
+    def __init__(self, capacidad_inicial=1024):
+        self._ids = np.empty(capacidad_inicial, dtype=np.int64)
+        self._lat = np.empty(capacidad_inicial, dtype=np.float64)      # radianes
+        self._lon = np.empty(capacidad_inicial, dtype=np.float64)      # radianes
+        self._cos_lat = np.empty(capacidad_inicial, dtype=np.float64)
+        self._n = 0
+        self._posicion = {}  # proveedor_id -> índice en los arreglos
+        self._lock = threading.RLock()
+        self.construido_en = None
+
+    def __len__(self):
+        return self._n
+
+    # --- ESCRITURA ---
+
+    def reconstruir(self, puntos):
+        """Reemplaza todo el contenido con un iterable de (id, lat, lon)."""
+        filas = [(pid, lat, lon) for pid, lat, lon in puntos if lat is not None and lon is not None]
+        n = len(filas)
+        ids = np.fromiter((f[0] for f in filas), dtype=np.int64, count=n)
+        lat = np.radians(np.fromiter((f[1] for f in filas), dtype=np.float64, count=n))
+        lon = np.radians(np.fromiter((f[2] for f in filas), dtype=np.float64, count=n))
+        with self._lock:
+            self._ids, self._lat, self._lon = ids, lat, lon
+            self._cos_lat = np.cos(lat)
+            self._n = n
+            self._posicion = {int(pid): i for i, pid in enumerate(ids)}
+            self.construido_en = time.time()
+
+    def actualizar(self, proveedor_id, lat, lon):
+        """Inserta o mueve un proveedor. Si no tiene coordenadas, lo elimina."""
+        if lat is None or lon is None:
+            self.eliminar(proveedor_id)
+            return
+        with self._lock:
+            i = self._posicion.get(proveedor_id)
+            if i is None:
+                if self._n == len(self._ids):
+                    self._crecer()
+                i = self._n
+                self._n += 1
+                self._posicion[proveedor_id] = i
+                self._ids[i] = proveedor_id
+            lat_rad, lon_rad = np.radians(lat), np.radians(lon)
+            self._lat[i], self._lon[i] = lat_rad, lon_rad
+            self._cos_lat[i] = np.cos(lat_rad)
+
+    def eliminar(self, proveedor_id):
+        with self._lock:
+            i = self._posicion.pop(proveedor_id, None)
+            if i is None:
+                return
+            # Movemos el último elemento al hueco para mantener los arreglos contiguos
+            ultimo = self._n - 1
+            if i != ultimo:
+                for arreglo in (self._ids, self._lat, self._lon, self._cos_lat):
+                    arreglo[i] = arreglo[ultimo]
+                self._posicion[int(self._ids[i])] = i
+            self._n = ultimo
+
+    def _crecer(self):
+        capacidad = max(1024, 2 * len(self._ids))
+        for nombre in ('_ids', '_lat', '_lon', '_cos_lat'):
+            viejo = getattr(self, nombre)
+            nuevo = np.empty(capacidad, dtype=viejo.dtype)
+            nuevo[:self._n] = viejo[:self._n]
+            setattr(self, nombre, nuevo)
+
+    # --- CONSULTAS ---
+
+    def distancias_km(self, lat, lon):
+        """Retorna (ids, distancias_km) para todos los proveedores cargados."""
+        with self._lock:
+            n = self._n
+            ids = self._ids[:n].copy()
+            lat_p, lon_p, cos_p = self._lat[:n], self._lon[:n], self._cos_lat[:n]
+            lat0, lon0 = np.radians(lat), np.radians(lon)
+            a = np.sin((lat_p - lat0) / 2) ** 2 + np.cos(lat0) * cos_p * np.sin((lon_p - lon0) / 2) ** 2
+        return ids, 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def cercanos(self, lat, lon, k, radio_km=None, despues_de=None):
+        """
+        Retorna los k proveedores más cercanos como [(distancia_km, id), ...],
+        con la misma semántica de radio_km y despues_de que IndiceGeografico.
+        """
+        if k <= 0 or self._n == 0:
+            return []
+        ids, dist = self.distancias_km(lat, lon)
+
+        mascara = None
+        if radio_km is not None:
+            mascara = dist <= radio_km
+        if despues_de is not None:
+            d_cursor, id_cursor = despues_de
+            posterior = (dist > d_cursor) | ((dist == d_cursor) & (ids > id_cursor))
+            mascara = posterior if mascara is None else mascara & posterior
+        if mascara is not None:
+            ids, dist = ids[mascara], dist[mascara]
+
+        if len(dist) > k:
+            # Nos quedamos con los k menores (más los empates con el k-ésimo)
+            umbral = dist[np.argpartition(dist, k - 1)[k - 1]]
+            seleccion = dist <= umbral
+            ids, dist = ids[seleccion], dist[seleccion]
+
+        orden = np.lexsort((ids, dist))[:k]
+        return [(float(dist[i]), int(ids[i])) for i in orden]
@@ -0,0 +1,87 @@
+"""
+Exportación de proveedores con sus agregados a CSV o NDJSON.
+
+Lee con un cursor del servidor (yield_per), de a --lote filas, así que la
+memoria no crece con el tamaño de la tabla. Los agregados salen en la misma
+consulta: calificaciones desde las columnas calif_* y los conteos de
+portafolio (fotos LISTO) y trabajos FINALIZADO desde subconsultas agrupadas
+unidas por LEFT JOIN (una pasada por tabla, no una subconsulta por fila).
+
+No incluye password_hash. Las columnas son las que entiende
+importar_proveedores.py, así que la salida se puede volver a importar.
+
+Uso:
+    python exportar_proveedores.py proveedores.csv
+    python exportar_proveedores.py - --formato ndjson | gzip > proveedores.ndjson.gz
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+from sqlalchemy import func, select
+
+from app import app, db, Proveedor, Portafolio, Trabajo
+
+COLUMNAS = ('id', 'nombre_completo', 'email', 'telefono', 'oficio', 'descripcion', 'direccion', 'horario',
+            'atiende_urgencias', 'lat', 'lon', 'geocode_estado', 'calif_promedio', 'calif_total')
+
+
+def consulta_exportacion():
+    fotos = (select(Portafolio.proveedor_id, func.count().label('n'))
+             .where(Portafolio.estado == 'LISTO')
+             .group_by(Portafolio.proveedor_id).subquery())
+    trabajos = (select(Trabajo.proveedor_id, func.count().label('n'))
+                .where(Trabajo.estado == 'FINALIZADO')
+                .group_by(Trabajo.proveedor_id).subquery())
+    return (
+        select(*[getattr(Proveedor, c) for c in COLUMNAS],
+               func.coalesce(fotos.c.n, 0).label('portafolio_fotos'),
+               func.coalesce(trabajos.c.n, 0).label('trabajos_finalizados'))
+        .outerjoin(fotos, fotos.c.proveedor_id == Proveedor.id)
+        .outerjoin(trabajos, trabajos.c.proveedor_id == Proveedor.id)
+        .order_by(Proveedor.id)
+    )
+
+
+def exportar(salida, formato, lote):
+    consulta = consulta_exportacion()
+    resultado = db.session.execute(consulta.execution_options(yield_per=lote))
+    if formato == 'csv':
+        escritor = csv.writer(salida)
+        escritor.writerow(resultado.keys())
+        escribir = escritor.writerow
+    else:
+        claves = list(resultado.keys())
+
+        def escribir(fila):
+            salida.write(json.dumps(dict(zip(claves, fila)), ensure_ascii=False) + "\n")
+
+    total, inicio = 0, time.time()
+    for fila in resultado:
+        escribir(fila)
+        total += 1
+        if total % 10000 == 0:
+            print(f"{total} proveedores exportados ({total / (time.time() - inicio):.0f} filas/s)", file=sys.stderr)
+    resultado.close()
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta proveedores con sus agregados a CSV o NDJSON.")
+    parser.add_argument("salida", help="Ruta del archivo, o - para la salida estándar")
+    parser.add_argument("--formato", choices=["csv", "ndjson"],
+                        help="Por defecto según la extensión; ndjson si la salida es -")
+    parser.add_argument("--lote", type=int, default=1000, help="Filas que se traen del servidor por vez")
+    args = parser.parse_args()
+
+    formato = args.formato or ('csv' if args.salida.lower().endswith('.csv') else 'ndjson')
+    salida = sys.stdout if args.salida == '-' else open(args.salida, 'w', newline='', encoding='utf-8')
+    try:
+        with app.app_context():
+            total = exportar(salida, formato, args.lote)
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+    print(f"Exportados: {total} proveedores.", file=sys.stderr)
@@ -0,0 +1,274 @@
+"""
+Geocodificación de direcciones con cache.
+
+Las direcciones se normalizan (minúsculas, sin tildes ni puntuación, con
+abreviaturas expandidas) para que variantes de una misma dirección compartan
+la misma clave. La cache tiene dos niveles:
+
+1. Un LRU en memoria del proceso (respuestas en microsegundos).
+2. La tabla geocodificacion_cache en la BD, compartida entre procesos y que
+   sobrevive a reinicios.
+
+Los resultados negativos (direcciones que Nominatim no encuentra) también se
+guardan, con un TTL más corto. Los errores de red no se cachean.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from geopy.geocoders import Nominatim
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app import app, db, GeocodificacionCache
+from metricas import geocodificador_segundos
+
+# Abreviaturas comunes en direcciones chilenas
+_ABREVIATURAS = {
+    "av": "avenida", "avda": "avenida",
+    "pje": "pasaje", "psje": "pasaje",
+    "dpto": "departamento", "depto": "departamento",
+    "gral": "general", "pob": "poblacion",
+    "stgo": "santiago", "n": "", "nro": "", "num": "",
+}
+
+
+def normalizar_direccion(direccion):
+    """Clave canónica de una dirección: 'Av. Grecia #1234' -> 'avenida grecia 1234'."""
+    texto = unicodedata.normalize("NFKD", direccion or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    palabras = re.findall(r"[a-z0-9]+", texto)
+    palabras = [_ABREVIATURAS.get(p, p) for p in palabras]
+    return " ".join(p for p in palabras if p)[:255]
+
+
+def _ahora():
+    # La columna es DateTime sin zona horaria: guardamos UTC "naive"
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class ErrorGeocodificacion(Exception):
+    """Falla transitoria del backend (red, timeout, límite excedido): reintentar más tarde."""
+
+
+class LimitadorTasa:
+    """Garantiza un intervalo mínimo entre consultas (ej: Nominatim pide 1 req/s)."""
+
+    def __init__(self, por_segundo=1.0):
+        self.intervalo = 1.0 / por_segundo if por_segundo > 0 else 0
+        self._siguiente = 0.0
+        self._lock = threading.Lock()
+
+    def esperar(self, dormir=time.sleep):
+        """Reserva el siguiente turno y duerme hasta que llegue (con la función `dormir` dada)."""
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self.intervalo
+        if turno > ahora:
+            dormir(turno - ahora)
+
+
+class GeocodificadorNominatim:
+    """Consulta OpenStreetMap. Reutiliza un único cliente para todas las llamadas."""
+
+    def __init__(self, user_agent="zerby_app_v2_client", timeout=10):
+        # Es importante poner un user_agent único para no ser bloqueado por Nominatim
+        self.cliente = Nominatim(user_agent=user_agent)
+        self.timeout = timeout
+
+    def geocodificar(self, direccion):
+        """Retorna (lat, lon), o (None, None) si no se encontró. Lanza excepción si falla la red."""
+        # Añadimos ", Chile" para acotar la búsqueda
+        location = self.cliente.geocode(direccion + ", Chile", timeout=self.timeout)
+        if location:
+            return location.latitude, location.longitude
+        return None, None
+
+
+class GeocodificadorLocal:
+    """
+    Geocodificador sin red para tests y desarrollo: asigna a cada dirección
+    un punto fijo (derivado de su hash) dentro de Santiago.
+    """
+
+    def geocodificar(self, direccion):
+        digest = hashlib.sha256(normalizar_direccion(direccion).encode()).digest()
+        lat = -33.65 + digest[0] / 255 * 0.3
+        lon = -70.80 + digest[1] / 255 * 0.3
+        return lat, lon
+
+
+GEOCODIFICADORES = {
+    'nominatim': GeocodificadorNominatim,
+    'local': GeocodificadorLocal,
+}
+
+
+def crear_geocodificador(nombre):
+    if nombre not in GEOCODIFICADORES:
+        raise RuntimeError(f"GEOCODER desconocido: {nombre}. Opciones: {', '.join(GEOCODIFICADORES)}")
+    return GEOCODIFICADORES[nombre]()
+
+
+class CacheGeocodificacion:
+    """LRU en memoria + tabla en BD delante de un geocodificador."""
+
+    def __init__(self, backend, max_items=10000, ttl=30 * 86400, ttl_negativo=86400):
+        self.backend = backend
+        self.max_items = max_items
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self._memoria = OrderedDict()  # clave -> (lat, lon, expira_en)
+        self._lock = threading.Lock()
+        self.contadores = {"hits_memoria": 0, "hits_bd": 0, "misses": 0, "errores": 0}
+
+    def estadisticas(self):
+        return dict(self.contadores, items_memoria=len(self._memoria))
+
+    def en_memoria(self, direccion):
+        """Retorna (lat, lon) si la dirección está en el LRU local, o None. Nunca hace I/O."""
+        valor = self._leer_memoria(normalizar_direccion(direccion))
+        if valor is not None:
+            self.contadores["hits_memoria"] += 1
+        return valor
+
+    def obtener(self, direccion):
+        """Retorna (lat, lon) para la dirección, o (None, None) si no se pudo geocodificar."""
+        if not normalizar_direccion(direccion):
+            return None, None
+        valor = self.en_cache(direccion)
+        if valor is not None:
+            return valor
+        try:
+            return self.consultar(direccion)
+        except ErrorGeocodificacion as e:
+            print(f"Error obteniendo coordenadas: {e}")
+            return None, None
+
+    def en_cache(self, direccion):
+        """
+        Retorna (lat, lon) desde la memoria o la BD, o None si hay que consultar
+        al backend. Sirve para aplicar el límite de tasa solo a las consultas reales.
+
+        Una dirección que queda vacía al normalizarla (ej: '', '###') retorna
+        (None, None), igual que un resultado negativo en cache: no hay nada que
+        consultar, así que no pasa por el límite de tasa ni llega al backend.
+        """
+        clave = normalizar_direccion(direccion)
+        if not clave:
+            return None, None
+
+        valor = self._leer_memoria(clave)
+        if valor is not None:
+            self.contadores["hits_memoria"] += 1
+            return valor
+
+        valor = self._leer_bd(clave)
+        if valor is not None:
+            self.contadores["hits_bd"] += 1
+        return valor
+
+    def consultar(self, direccion):
+        """
+        Consulta al backend y guarda el resultado, sin mirar la cache.
+        Retorna (lat, lon) o (None, None) si la dirección no existe; lanza
+        ErrorGeocodificacion si falló la red (ese caso no se cachea).
+        """
+        self.contadores["misses"] += 1
+        inicio = time.perf_counter()
+        try:
+            lat, lon = self.backend.geocodificar(direccion)
+        except Exception as e:
+            self.contadores["errores"] += 1
+            geocodificador_segundos.observar(time.perf_counter() - inicio, 'error')
+            raise ErrorGeocodificacion(str(e)) from e
+        geocodificador_segundos.observar(time.perf_counter() - inicio, 'ok' if lat is not None else 'sin_resultado')
+
+        self.guardar(normalizar_direccion(direccion), lat, lon)
+        return lat, lon
+
+    def guardar(self, clave, lat, lon):
+        """Guarda un resultado (positivo o negativo) en ambos niveles."""
+        self._escribir_memoria(clave, lat, lon)
+        try:
+            stmt = insert(GeocodificacionCache).values(clave=clave, lat=lat, lon=lon, actualizado=_ahora())
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[GeocodificacionCache.clave],
+                set_={"lat": stmt.excluded.lat, "lon": stmt.excluded.lon, "actualizado": stmt.excluded.actualizado}
+            )
+            # Conexión propia: no debe mezclarse con la transacción del request.
+            # El app_context permite llamarla también desde hilos de fondo.
+            with app.app_context(), db.engine.begin() as conn:
+                conn.execute(stmt)
+        except Exception as e:
+            print(f"No se pudo guardar en la cache de geocodificación: {e}")
+
+    def precalentar(self, direcciones, pausa=1.0):
+        """
+        Geocodifica las direcciones que aún no estén en cache. `pausa` son los
+        segundos de espera entre consultas al backend (Nominatim pide 1 req/s).
+        Retorna cuántas direcciones se consultaron al backend.
+        """
+        consultadas = 0
+        for direccion in direcciones:
+            misses_antes = self.contadores["misses"]
+            self.obtener(direccion)
+            if self.contadores["misses"] > misses_antes:
+                consultadas += 1
+                time.sleep(pausa)
+        return consultadas
+
+    # --- NIVELES DE CACHE ---
+
+    def _leer_memoria(self, clave):
+        with self._lock:
+            item = self._memoria.get(clave)
+            if item is None:
+                return None
+            lat, lon, expira_en = item
+            if expira_en < time.time():
+                del self._memoria[clave]
+                return None
+            self._memoria.move_to_end(clave)
+            return lat, lon
+
+    def _escribir_memoria(self, clave, lat, lon, edad=0):
+        ttl = self.ttl if lat is not None else self.ttl_negativo
+        with self._lock:
+            self._memoria[clave] = (lat, lon, time.time() + ttl - edad)
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_items:
+                self._memoria.popitem(last=False)
+
+    def _leer_bd(self, clave):
+        try:
+            with app.app_context(), db.engine.connect() as conn:
+                fila = conn.execute(
+                    select(GeocodificacionCache.lat, GeocodificacionCache.lon, GeocodificacionCache.actualizado)
+                    .where(GeocodificacionCache.clave == clave)
+                ).first()
+        except Exception as e:
+            print(f"No se pudo leer la cache de geocodificación: {e}")
+            return None
+        if fila is None:
+            return None
+
+        edad = (_ahora() - fila.actualizado).total_seconds()
+        ttl = self.ttl if fila.lat is not None else self.ttl_negativo
+        if edad > ttl:
+            return None
+        self._escribir_memoria(clave, fila.lat, fila.lon, edad=edad)
+        return fila.lat, fila.lon
+
+
+cache_geocodificacion = CacheGeocodificacion(
+    crear_geocodificador(app.config['GEOCODER']),
+    max_items=app.config['GEOCACHE_MAX_ITEMS'],
+    ttl=app.config['GEOCACHE_TTL'],
+    ttl_negativo=app.config['GEOCACHE_TTL_NEGATIVO']
+)
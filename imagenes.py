@@ -0,0 +1,112 @@
+"""
+Procesamiento de las fotos del portafolio con Pillow.
+
+De cada foto subida se generan varias variantes (una por ancho en
+PORTAFOLIO_ANCHOS, sin agrandar nunca la original), cada una en WebP y en JPEG:
+- Se aplica la orientación EXIF y luego se descartan todos los metadatos
+  (EXIF con ubicación GPS, modelo de cámara, miniaturas incrustadas).
+- Los colores se convierten a sRGB, el espacio que asumen los navegadores
+  cuando la imagen no trae perfil.
+- La variante más grande queda limitada al ancho máximo configurado.
+
+Son funciones puras y de CPU que retornan los bytes codificados (el
+almacenamiento los guarda por su hash, ver almacenamiento.py): la app las
+llama desde cola_imagenes.py, fuera del request y en el pool de hilos (Pillow
+libera el GIL al decodificar, redimensionar y codificar).
+"""
+import io
+import os
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+try:
+    from PIL import ImageCms
+except ImportError:  # Pillow compilado sin littlecms
+    ImageCms = None
+
+FORMATOS_PERMITIDOS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+
+class ImagenInvalida(Exception):
+    pass
+
+
+def validar(ruta, pixeles_max):
+    """Lee solo la cabecera: retorna (ancho, alto) o lanza ImagenInvalida."""
+    try:
+        with Image.open(ruta) as img:
+            formato, (ancho, alto) = img.format, img.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ImagenInvalida("El archivo no es una imagen válida")
+    if formato not in FORMATOS_PERMITIDOS:
+        raise ImagenInvalida(f"Formato de imagen no permitido: {formato}")
+    if ancho * alto > pixeles_max:
+        raise ImagenInvalida("La imagen tiene demasiados píxeles")
+    return ancho, alto
+
+
+def _a_srgb(img):
+    perfil = img.info.get('icc_profile')
+    if not perfil or ImageCms is None:
+        return img
+    try:
+        origen = ImageCms.ImageCmsProfile(io.BytesIO(perfil))
+        return ImageCms.profileToProfile(img, origen, ImageCms.createProfile('sRGB'), outputMode=img.mode)
+    except (ImageCms.PyCMSError, OSError, ValueError):
+        return img
+
+
+def _cargar(ruta, ancho_max):
+    with Image.open(ruta) as img:
+        # En JPEG decodifica directamente a una escala reducida (1/2, 1/4, 1/8)
+        # si la foto es mucho más grande de lo que necesitamos
+        img.draft('RGB', (ancho_max * 2, ancho_max * 2))
+        img = ImageOps.exif_transpose(img)
+        img = _a_srgb(img)
+        con_transparencia = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+        return img.convert('RGBA' if con_transparencia else 'RGB')
+
+
+def _sin_transparencia(img):
+    if img.mode != 'RGBA':
+        return img
+    fondo = Image.new('RGB', img.size, (255, 255, 255))
+    fondo.paste(img, mask=img.getchannel('A'))
+    return fondo
+
+
+def _codificar(img, formato, **opciones):
+    salida = io.BytesIO()
+    img.save(salida, formato, **opciones)
+    return salida.getvalue()
+
+
+def generar_variantes(ruta, anchos, calidad=80):
+    """Retorna [{"ancho", "alto", "webp": bytes, "jpeg": bytes}, ...] de menor a mayor."""
+    ancho_max = max(anchos)
+    img = _cargar(ruta, ancho_max)
+
+    # Anchos menores que la original, más la original limitada al máximo
+    objetivos = sorted({a for a in anchos if a < img.width} | {min(img.width, ancho_max)}, reverse=True)
+
+    variantes = []
+    actual = img
+    for ancho in objetivos:
+        # Cada variante sale de la anterior (más grande): menos píxeles que remuestrear
+        actual = actual.copy()
+        actual.thumbnail((ancho, ancho * 3), Image.LANCZOS, reducing_gap=3.0)
+        variantes.append({
+            "ancho": actual.width,
+            "alto": actual.height,
+            "webp": _codificar(actual, 'WEBP', quality=calidad, method=4),
+            "jpeg": _codificar(_sin_transparencia(actual), 'JPEG', quality=calidad, optimize=True, progressive=True),
+        })
+    return variantes[::-1]
+
+
+def borrar_archivos(rutas):
+    for ruta in rutas:
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
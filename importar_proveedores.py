@@ -0,0 +1,256 @@
+"""
+Importación masiva de proveedores desde CSV o NDJSON (una fila JSON por línea).
+
+El archivo se lee en streaming y se inserta por lotes: cada lote va con COPY
+a una tabla temporal y de ahí a proveedor con un INSERT ... SELECT ... ON
+CONFLICT (email) DO NOTHING RETURNING email, que dice qué emails ya estaban
+registrados sin abortar el lote. Un commit por lote. Cada fila se
+valida igual que en /registrar/proveedor más los largos de las columnas; las
+filas con error no detienen la importación y se reportan con su número de
+línea en --errores (CSV) o en la salida.
+
+Columnas: nombre_completo, email, telefono, oficio (obligatorias),
+descripcion, direccion, horario, atiende_urgencias, lat, lon, password.
+Las demás se ignoran, así que acepta lo que genera exportar_proveedores.py.
+
+- Sin lat/lon, las filas con dirección quedan PENDIENTE y se geocodifican
+  después en lote con backfill_coordenadas.py (respeta el límite de
+  Nominatim y se puede retomar), no una por una durante la importación.
+- Sin password, la cuenta queda sin contraseña válida (no puede iniciar
+  sesión hasta que se le asigne una). Las que traen password se hashean en
+  paralelo en --hilos hilos.
+
+Los servidores en marcha ven a los nuevos proveedores en la búsqueda por
+cercanía y el autocompletado al vencer GEO_INDICE_TTL y AUTOCOMPLETAR_TTL.
+
+Uso:
+    python importar_proveedores.py socios.csv [--errores errores.csv] [--lote 1000] [--simular]
+    cat socios.ndjson | python importar_proveedores.py - --formato ndjson
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
+
+from app import app, db, Proveedor
+
+OBLIGATORIAS = ('nombre_completo', 'email', 'telefono', 'oficio')
+OPCIONALES = ('descripcion', 'direccion', 'horario')
+COLUMNAS = OBLIGATORIAS + OPCIONALES + ('atiende_urgencias', 'lat', 'lon', 'geocode_estado', 'password_hash')
+# Hash que check_password_hash nunca acepta: cuenta sin contraseña
+SIN_PASSWORD = '!'
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+_VERDADERO = {'1', 'true', 'si', 'sí', 's', 'yes', 'x'}
+_FALSO = {'', '0', 'false', 'no', 'n'}
+
+
+class FilaInvalida(ValueError):
+    pass
+
+
+def leer_filas(archivo, formato):
+    """Genera (numero_de_linea, dict) sin cargar el archivo completo."""
+    if formato == 'csv':
+        lector = csv.DictReader(archivo)
+        for fila in lector:
+            yield lector.line_num, fila
+        return
+    for numero, linea in enumerate(archivo, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError as e:
+            yield numero, FilaInvalida(f"JSON inválido: {e}")
+            continue
+        yield numero, fila if isinstance(fila, dict) else FilaInvalida("La línea no es un objeto JSON")
+
+
+def _texto(fila, columna):
+    valor = fila.get(columna)
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    if not valor:
+        return None
+    largo = Proveedor.__table__.c[columna].type.length
+    if largo and len(valor) > largo:
+        raise FilaInvalida(f"{columna} supera {largo} caracteres")
+    return valor
+
+
+def _booleano(valor):
+    if isinstance(valor, bool) or valor is None:
+        return bool(valor)
+    texto = str(valor).strip().lower()
+    if texto in _VERDADERO:
+        return True
+    if texto in _FALSO:
+        return False
+    raise FilaInvalida(f"atiende_urgencias inválido: {valor!r}")
+
+
+def _coordenada(valor, minimo, maximo, nombre):
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        raise FilaInvalida(f"{nombre} inválida: {valor!r}")
+    if not math.isfinite(numero) or not minimo <= numero <= maximo:
+        raise FilaInvalida(f"{nombre} fuera de rango: {valor!r}")
+    return numero
+
+
+def validar(fila):
+    """Retorna (valores para Proveedor, password o None). Lanza FilaInvalida."""
+    valores = {}
+    for columna in OBLIGATORIAS:
+        valores[columna] = _texto(fila, columna)
+        if valores[columna] is None:
+            raise FilaInvalida(f"Falta {columna}")
+    if not _EMAIL.match(valores['email']):
+        raise FilaInvalida(f"Email inválido: {valores['email']}")
+    for columna in OPCIONALES:
+        valores[columna] = _texto(fila, columna)
+    valores['atiende_urgencias'] = _booleano(fila.get('atiende_urgencias'))
+
+    lat, lon = fila.get('lat'), fila.get('lon')
+    if lat not in (None, '') or lon not in (None, ''):
+        valores['lat'] = _coordenada(lat, -90, 90, 'lat')
+        valores['lon'] = _coordenada(lon, -180, 180, 'lon')
+        valores['geocode_estado'] = 'OK'
+    else:
+        valores['lat'] = valores['lon'] = None
+        valores['geocode_estado'] = 'PENDIENTE' if valores['direccion'] else None
+
+    password = fila.get('password')
+    return valores, (str(password) if password not in (None, '') else None)
+
+
+def _hashear(password):
+    if password is None:
+        return SIN_PASSWORD
+    return generate_password_hash(password, app.config['PASSWORD_HASH_METODO'])
+
+
+def _copiar_e_insertar(filas):
+    """COPY de las filas a la tabla temporal y paso a proveedor; retorna los emails insertados."""
+    columnas = ', '.join(COLUMNAS)
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for fila in filas:
+        escritor.writerow([fila[c] for c in COLUMNAS])  # None -> campo vacío sin comillas -> NULL
+    buffer.seek(0)
+
+    cursor = db.session.connection().connection.cursor()
+    cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS importacion_proveedor ON COMMIT DELETE ROWS "
+                   f"AS SELECT {columnas} FROM proveedor WITH NO DATA")
+    cursor.copy_expert(f"COPY importacion_proveedor ({columnas}) FROM STDIN WITH (FORMAT csv)", buffer)
+    cursor.execute(f"INSERT INTO proveedor ({columnas}) SELECT {columnas} FROM importacion_proveedor "
+                   f"ON CONFLICT (email) DO NOTHING RETURNING email")
+    return {email for email, in cursor.fetchall()}
+
+
+def insertar_lote(lote, pool, simular):
+    """Inserta [(linea, valores, password)]; retorna las líneas cuyo email ya estaba registrado."""
+    if simular:
+        existentes = set(db.session.execute(
+            select(Proveedor.email).where(Proveedor.email.in_([valores['email'] for _, valores, _ in lote]))
+        ).scalars())
+        db.session.rollback()
+    else:
+        filas = []
+        for (_, valores, _), password_hash in zip(lote, pool.map(_hashear, [p for _, _, p in lote])):
+            filas.append(dict(valores, password_hash=password_hash))
+        insertados = _copiar_e_insertar(filas)
+        db.session.commit()
+        existentes = {valores['email'] for _, valores, _ in lote} - insertados
+    return [(linea, valores['email']) for linea, valores, _ in lote if valores['email'] in existentes]
+
+
+def importar(archivo, formato, args, reportar_error):
+    lote, vistos = [], set()
+    resumen = {"insertados": 0, "errores": 0, "pendientes_geocodificar": 0}
+    inicio = time.time()
+
+    def vaciar():
+        repetidos = insertar_lote(lote, pool, args.simular)
+        for linea, email in repetidos:
+            reportar_error(linea, email, "El email ya está registrado")
+        resumen["errores"] += len(repetidos)
+        resumen["insertados"] += len(lote) - len(repetidos)
+        repetidos = {linea for linea, _ in repetidos}
+        resumen["pendientes_geocodificar"] += sum(
+            1 for linea, valores, _ in lote if linea not in repetidos and valores['geocode_estado'] == 'PENDIENTE')
+        lote.clear()
+        print(f"{resumen['insertados']} insertados, {resumen['errores']} con errores "
+              f"({resumen['insertados'] / max(time.time() - inicio, 1e-6):.0f} filas/s)", file=sys.stderr)
+
+    with ThreadPoolExecutor(max_workers=args.hilos) as pool:
+        for linea, fila in leer_filas(archivo, formato):
+            try:
+                if isinstance(fila, FilaInvalida):
+                    raise fila
+                valores, password = validar(fila)
+                if valores['email'] in vistos:
+                    raise FilaInvalida("Email repetido en el archivo")
+            except FilaInvalida as e:
+                email = fila.get('email') if isinstance(fila, dict) else None
+                reportar_error(linea, email, str(e))
+                resumen["errores"] += 1
+                continue
+            vistos.add(valores['email'])
+            lote.append((linea, valores, password))
+            if len(lote) >= args.lote:
+                vaciar()
+        if lote:
+            vaciar()
+    return resumen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa proveedores en lote desde CSV o NDJSON.")
+    parser.add_argument("archivo", help="Ruta del archivo, o - para leer de la entrada estándar")
+    parser.add_argument("--formato", choices=["csv", "ndjson"],
+                        help="Por defecto según la extensión (.csv, .ndjson o .jsonl)")
+    parser.add_argument("--lote", type=int, default=5000, help="Filas por COPY y commit")
+    parser.add_argument("--hilos", type=int, default=4, help="Hilos para hashear las contraseñas que vengan")
+    parser.add_argument("--errores", help="CSV donde escribir las filas con error (por defecto, la salida estándar)")
+    parser.add_argument("--simular", action="store_true", help="Solo validar, sin insertar")
+    args = parser.parse_args()
+    args.lote = max(1, args.lote)
+
+    formato = args.formato
+    if formato is None:
+        extension = args.archivo.rsplit('.', 1)[-1].lower()
+        formato = 'csv' if extension == 'csv' else 'ndjson' if extension in ('ndjson', 'jsonl') else None
+        if formato is None:
+            parser.error("No se pudo deducir el formato: usar --formato csv o --formato ndjson")
+
+    salida_errores = open(args.errores, 'w', newline='', encoding='utf-8') if args.errores else sys.stdout
+    escritor = csv.writer(salida_errores)
+    escritor.writerow(["linea", "email", "error"])
+
+    archivo = sys.stdin if args.archivo == '-' else open(args.archivo, newline='', encoding='utf-8-sig')
+    try:
+        with app.app_context():
+            resumen = importar(archivo, formato, args,
+                               lambda linea, email, error: escritor.writerow([linea, email or '', error]))
+    finally:
+        if archivo is not sys.stdin:
+            archivo.close()
+        if salida_errores is not sys.stdout:
+            salida_errores.close()
+
+    accion = "Se insertarían" if args.simular else "Insertados"
+    print(f"{accion}: {resumen['insertados']} proveedores, {resumen['errores']} filas con error.", file=sys.stderr)
+    if resumen["pendientes_geocodificar"] and not args.simular:
+        print(f"{resumen['pendientes_geocodificar']} quedaron PENDIENTE de geocodificar: "
+              f"python backfill_coordenadas.py --tablas proveedor", file=sys.stderr)
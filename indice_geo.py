@@ -0,0 +1,207 @@
+"""
+Índice espacial en memoria para ubicar proveedores cercanos.
+
+El mapa se divide en una grilla de celdas de tamaño fijo (en grados) y cada
+celda guarda los proveedores que caen dentro de ella. Las consultas de los k
+más cercanos recorren anillos de celdas alrededor del punto consultado y se
+detienen apenas ninguna celda más lejana puede mejorar el resultado, así que
+no es necesario calcular la distancia a todos los proveedores.
+
+No considera el cruce del antimeridiano (no aplica para Chile).
+"""
+import heapq
+import math
+import threading
+import time
+
+# Mismo radio medio que usa la librería haversine para kilómetros
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = RADIO_TIERRA_KM * math.pi / 180
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Distancia Haversine en kilómetros entre dos puntos (lat, lon) en grados."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class IndiceGeografico:
+    """Grilla de celdas con soporte para k-vecinos y búsqueda por radio."""
+
+    def __init__(self, tam_celda=0.05):
+        self.tam_celda = tam_celda  # En grados (~5.5 km de latitud)
+        self._celdas = {}       # (fila, col) -> {proveedor_id: (lat, lon)}
+        self._posiciones = {}   # proveedor_id -> (fila, col)
+        # (fila_min, fila_max, col_min, col_max) de las celdas ocupadas. Solo se amplía: tras
+        # quitar proveedores puede quedar más grande de lo necesario, y las celdas vacías se saltan
+        self._limites = None
+        self._lock = threading.RLock()
+        self.construido_en = None
+
+    def __len__(self):
+        return len(self._posiciones)
+
+    def _celda(self, lat, lon):
+        return (math.floor(lat / self.tam_celda), math.floor(lon / self.tam_celda))
+
+    # --- ESCRITURA ---
+
+    def reconstruir(self, puntos):
+        """Reemplaza todo el contenido con un iterable de (id, lat, lon)."""
+        celdas, posiciones = {}, {}
+        for proveedor_id, lat, lon in puntos:
+            if lat is None or lon is None:
+                continue
+            celda = self._celda(lat, lon)
+            celdas.setdefault(celda, {})[proveedor_id] = (lat, lon)
+            posiciones[proveedor_id] = celda
+        limites = None
+        if celdas:
+            filas = [c[0] for c in celdas]
+            cols = [c[1] for c in celdas]
+            limites = (min(filas), max(filas), min(cols), max(cols))
+        with self._lock:
+            self._celdas = celdas
+            self._posiciones = posiciones
+            self._limites = limites
+            self.construido_en = time.time()
+
+    def actualizar(self, proveedor_id, lat, lon):
+        """Inserta o mueve un proveedor. Si no tiene coordenadas, lo elimina."""
+        with self._lock:
+            self._quitar(proveedor_id)
+            if lat is None or lon is None:
+                return
+            celda = self._celda(lat, lon)
+            self._celdas.setdefault(celda, {})[proveedor_id] = (lat, lon)
+            self._posiciones[proveedor_id] = celda
+            fila, col = celda
+            if self._limites is None:
+                self._limites = (fila, fila, col, col)
+            else:
+                fila_min, fila_max, col_min, col_max = self._limites
+                self._limites = (min(fila_min, fila), max(fila_max, fila), min(col_min, col), max(col_max, col))
+
+    def eliminar(self, proveedor_id):
+        with self._lock:
+            self._quitar(proveedor_id)
+
+    def _quitar(self, proveedor_id):
+        celda = self._posiciones.pop(proveedor_id, None)
+        if celda is None:
+            return
+        contenido = self._celdas.get(celda)
+        if contenido is not None:
+            contenido.pop(proveedor_id, None)
+            if not contenido:
+                del self._celdas[celda]
+
+    # --- CONSULTAS ---
+
+    def en_radio(self, lat, lon, radio_km):
+        """Retorna [(distancia_km, id), ...] dentro del radio, ordenado por distancia."""
+        d_lat = radio_km / KM_POR_GRADO
+        lat_extrema = min(89.9, abs(lat) + d_lat)
+        d_lon = radio_km / (KM_POR_GRADO * math.cos(math.radians(lat_extrema)))
+        fila_min, col_min = self._celda(lat - d_lat, lon - d_lon)
+        fila_max, col_max = self._celda(lat + d_lat, lon + d_lon)
+
+        resultado = []
+        with self._lock:
+            for fila in range(fila_min, fila_max + 1):
+                for col in range(col_min, col_max + 1):
+                    contenido = self._celdas.get((fila, col))
+                    if not contenido:
+                        continue
+                    for proveedor_id, (p_lat, p_lon) in contenido.items():
+                        dist = distancia_km(lat, lon, p_lat, p_lon)
+                        if dist <= radio_km:
+                            resultado.append((dist, proveedor_id))
+        resultado.sort()
+        return resultado
+
+    def cercanos(self, lat, lon, k, radio_km=None, despues_de=None):
+        """
+        Retorna los k proveedores más cercanos como [(distancia_km, id), ...].
+
+        - radio_km: descarta los que estén más lejos que este radio.
+        - despues_de: tupla (distancia_km, id) para paginar; solo se consideran
+          los resultados estrictamente posteriores en el orden (distancia, id).
+        """
+        if k <= 0:
+            return []
+
+        with self._lock:
+            if not self._celdas:
+                return []
+            fila0, col0 = self._celda(lat, lon)
+            limites = self._limites
+            r_max = max(abs(fila0 - limites[0]), abs(limites[1] - fila0),
+                        abs(col0 - limites[2]), abs(limites[3] - col0))
+            total = len(self._posiciones)
+
+            # Max-heap de tamaño k sobre (distancia, id) usando valores negados
+            mejores = []
+            vistos = 0
+            for r in range(r_max + 1):
+                for celda in self._anillo(fila0, col0, r, limites):
+                    contenido = self._celdas.get(celda)
+                    if not contenido:
+                        continue
+                    vistos += len(contenido)
+                    for proveedor_id, (p_lat, p_lon) in contenido.items():
+                        dist = distancia_km(lat, lon, p_lat, p_lon)
+                        if radio_km is not None and dist > radio_km:
+                            continue
+                        if despues_de is not None and (dist, proveedor_id) <= despues_de:
+                            continue
+                        item = (-dist, -proveedor_id)
+                        if len(mejores) < k:
+                            heapq.heappush(mejores, item)
+                        elif item > mejores[0]:
+                            heapq.heapreplace(mejores, item)
+
+                # Con menos de k proveedores no hay que seguir abriendo anillos vacíos
+                if vistos >= total:
+                    break
+                # Cota inferior de la distancia a cualquier celda fuera del anillo r
+                cota = self._cota_fuera_de_anillo(lat, lon, fila0, col0, r)
+                if radio_km is not None and cota > radio_km:
+                    break
+                if len(mejores) == k and -mejores[0][0] < cota:
+                    break
+
+        return sorted((-d, -pid) for d, pid in mejores)
+
+    def _anillo(self, fila0, col0, r, limites):
+        """Celdas a distancia de Chebyshev exactamente r de (fila0, col0), recortadas a
+        limites = (fila_min, fila_max, col_min, col_max) de la grilla ocupada."""
+        fila_min, fila_max, col_min, col_max = limites
+        if r == 0:
+            yield (fila0, col0)
+            return
+        cols = range(max(col0 - r, col_min), min(col0 + r, col_max) + 1)
+        for fila in (fila0 - r, fila0 + r):
+            if fila_min <= fila <= fila_max:
+                for col in cols:
+                    yield (fila, col)
+        filas = range(max(fila0 - r + 1, fila_min), min(fila0 + r - 1, fila_max) + 1)
+        for col in (col0 - r, col0 + r):
+            if col_min <= col <= col_max:
+                for fila in filas:
+                    yield (fila, col)
+
+    def _cota_fuera_de_anillo(self, lat, lon, fila0, col0, r):
+        t = self.tam_celda
+        # Fuera del bloque por latitud: la distancia es al menos la diferencia de latitud
+        d_lat = min(lat - (fila0 - r) * t, (fila0 + r + 1) * t - lat)
+        cota_lat = d_lat * KM_POR_GRADO
+        # Dentro de las filas del bloque pero fuera por longitud
+        lat_extrema = min(89.9, max(abs((fila0 - r) * t), abs((fila0 + r + 1) * t)))
+        d_lon = min(lon - (col0 - r) * t, (col0 + r + 1) * t - lon)
+        seno = math.cos(math.radians(lat_extrema)) * math.sin(math.radians(min(d_lon, 180.0)) / 2)
+        cota_lon = 2 * RADIO_TIERRA_KM * math.asin(min(1.0, seno))
+        return min(cota_lat, cota_lon)
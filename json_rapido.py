@@ -0,0 +1,72 @@
+"""
+Proveedor JSON de la app (app.json), usado por jsonify() y request.get_json().
+
+Si está instalado orjson serializa con él (varias veces más rápido que el
+módulo json en listas grandes de dicts, ej: /api/buscar, /api/proveedores-cercanos)
+y arma el cuerpo de la respuesta directamente en bytes. Sin orjson, o con
+valores que orjson no acepta (ej: enteros de más de 64 bits), se usa el
+proveedor por defecto de Flask.
+
+La salida es la misma con o sin orjson (claves ordenadas, fechas en formato
+HTTP, Decimal como string), así que los ETags calculados sobre el cuerpo no
+dependen de qué serializador esté instalado. A diferencia del proveedor por
+defecto no escapa los caracteres no ASCII: "ñ" ocupa 2 bytes y no 6.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ProveedorJSONRapido(DefaultJSONProvider):
+
+    ensure_ascii = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.usa_orjson = orjson is not None
+
+    def _opciones(self, indentar=False):
+        # Las fechas pasan a default() para mantener el formato HTTP de Flask
+        opciones = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            opciones |= orjson.OPT_SORT_KEYS
+        if indentar:
+            opciones |= orjson.OPT_INDENT_2
+        return opciones
+
+    def _serializar(self, obj, indentar=False):
+        """Retorna bytes, o None si hay que usar el serializador estándar."""
+        if not self.usa_orjson:
+            return None
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._opciones(indentar))
+        except TypeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        cuerpo = self._serializar(obj)
+        if cuerpo is None:
+            return super().dumps(obj, separators=(",", ":"))
+        return cuerpo.decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs or not self.usa_orjson:
+            return super().loads(s, **kwargs)
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # Deja que json dé el mismo error (y acepte lo que orjson rechaza, ej: NaN)
+            return super().loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indentar = self.compact is False or (self.compact is None and self._app.debug)
+        cuerpo = self._serializar(obj, indentar)
+        if cuerpo is None:
+            return super().response(obj)
+        return self._app.response_class(cuerpo + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,26 @@
+"""
+Recolector de basura del almacén de archivos (ver archivos.py).
+
+Borra los archivos que llevan más de ARCHIVOS_GC_GRACIA_HORAS sin referencias
+en la BD y los que están en el almacén sin estar registrados. Pensado para
+correr periódicamente (ej: cron diario).
+
+Uso:
+    python limpiar_archivos.py [--simular] [--gracia-horas 24]
+"""
+import argparse
+
+from app import app
+from archivos import recolectar
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Borra los archivos subidos que ya no se usan.")
+    parser.add_argument("--gracia-horas", type=float, default=app.config['ARCHIVOS_GC_GRACIA_HORAS'],
+                        help="Solo borra archivos sin uso hace más de estas horas")
+    parser.add_argument("--simular", action="store_true", help="Solo contar lo que se borraría")
+    args = parser.parse_args()
+
+    with app.app_context():
+        resultado = recolectar(args.gracia_horas * 3600, simular=args.simular)
+    accion = "Se borrarían" if args.simular else "Borrados"
+    print(f"{accion}: {resultado['sin_referencias']} archivos sin referencias y {resultado['huerfanos']} huérfanos")
@@ -0,0 +1,290 @@
+"""
+Métricas en formato de texto de Prometheus, expuestas en /metrics.
+
+- Latencia por endpoint HTTP y por evento de Socket.IO (histogramas).
+- Consultas a la BD y tiempo en la BD por petición/evento (eventos del engine
+  de SQLAlchemy) y totales del proceso.
+- Conexiones y salas de Socket.IO, y las estadisticas() de las caches y colas
+  (se leen al momento de cada scrape, no cuestan nada entre scrapes).
+- Latencia de las llamadas reales al geocodificador.
+
+Con METRICAS_HABILITADAS apagado no se instala ningún hook ni la ruta
+/metrics: los observar() retornan de inmediato. Cada worker de servidor.py
+tiene sus propias métricas; Prometheus debe scrapear cada puerto.
+
+Si METRICAS_TOKEN está definido, /metrics exige "Authorization: Bearer <token>".
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+import hmac
+import threading
+import time
+
+from flask import abort, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+# [consultas, segundos] de la petición o evento en curso (None fuera de ellos)
+_consultas_actuales = ContextVar('consultas_actuales', default=None)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(nombres, valores, extra=""):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+class Registro:
+    """Conjunto de métricas de un proceso. Nada se registra hasta habilitarlo."""
+
+    def __init__(self):
+        self.habilitado = False
+        self._metricas = []
+        self._estadisticas = []  # (nombre, ayuda, callable() -> dict)
+
+    def agregar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def estadisticas(self, nombre, ayuda, funcion):
+        """
+        Publica los valores numéricos del dict que retorna funcion() (ej:
+        cache.estadisticas) como un gauge con la etiqueta dato="<clave>".
+        """
+        self._estadisticas.append((nombre, ayuda, funcion))
+
+    def exportar(self):
+        lineas = []
+        for metrica in self._metricas:
+            metrica.exportar(lineas)
+        for nombre, ayuda, funcion in self._estadisticas:
+            try:
+                datos = funcion()
+            except Exception as e:
+                print(f"[METRICAS] Error leyendo {nombre}: {e}")
+                continue
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} gauge")
+            for clave, valor in sorted(datos.items()):
+                if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                    lineas.append(f'{nombre}{{dato="{_escapar(clave)}"}} {_numero(valor)}')
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+
+class Contador:
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, cantidad=1, *valores):
+        if not registro.habilitado:
+            return
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def exportar(self, lineas):
+        lineas.append(f"# HELP {self.nombre} {self.ayuda}")
+        lineas.append(f"# TYPE {self.nombre} counter")
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for etiquetas, valor in valores:
+            lineas.append(f"{self.nombre}{_formatear_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}")
+
+
+class Medidor:
+    """Gauge cuyo valor se calcula al exportar con funcion()."""
+
+    def __init__(self, nombre, ayuda, funcion):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+
+    def exportar(self, lineas):
+        try:
+            valor = self.funcion()
+        except Exception as e:
+            print(f"[METRICAS] Error leyendo {self.nombre}: {e}")
+            return
+        lineas.append(f"# HELP {self.nombre} {self.ayuda}")
+        lineas.append(f"# TYPE {self.nombre} gauge")
+        lineas.append(f"{self.nombre} {_numero(valor)}")
+
+
+class Histograma:
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {}  # etiquetas -> [conteos por bucket (+Inf al final), suma]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores):
+        if not registro.habilitado:
+            return
+        # bisect_left: el primer bucket con límite >= valor (semántica "le")
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    def exportar(self, lineas):
+        lineas.append(f"# HELP {self.nombre} {self.ayuda}")
+        lineas.append(f"# TYPE {self.nombre} histogram")
+        with self._lock:
+            series = sorted((etiquetas, (list(conteos), suma)) for etiquetas, (conteos, suma) in self._series.items())
+        for etiquetas, (conteos, suma) in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float('inf'),), conteos):
+                acumulado += conteo
+                le = f'le="{_numero(float(limite))}"'
+                lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(self.etiquetas, etiquetas, le)} {acumulado}")
+            sufijo = _formatear_etiquetas(self.etiquetas, etiquetas)
+            lineas.append(f"{self.nombre}_sum{sufijo} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{sufijo} {acumulado}")
+
+
+http_segundos = registro.agregar(Histograma(
+    'zerby_http_peticion_segundos', 'Duracion de las peticiones HTTP por endpoint.',
+    ('endpoint', 'metodo', 'estado')))
+socketio_segundos = registro.agregar(Histograma(
+    'zerby_socketio_evento_segundos', 'Duracion de los handlers de eventos de Socket.IO.', ('evento',)))
+consultas_por_peticion = registro.agregar(Histograma(
+    'zerby_bd_consultas_por_peticion', 'Consultas a la BD por peticion HTTP o evento de Socket.IO.',
+    ('endpoint',), buckets=BUCKETS_CONSULTAS))
+bd_segundos_por_peticion = registro.agregar(Histograma(
+    'zerby_bd_segundos_por_peticion', 'Tiempo en la BD por peticion HTTP o evento de Socket.IO.', ('endpoint',)))
+consultas_total = registro.agregar(Contador(
+    'zerby_bd_consultas_total', 'Consultas a la BD del proceso (incluye tareas en segundo plano).'))
+bd_segundos_total = registro.agregar(Contador(
+    'zerby_bd_segundos_total', 'Tiempo total en la BD del proceso.'))
+geocodificador_segundos = registro.agregar(Histograma(
+    'zerby_geocodificador_segundos', 'Duracion de las llamadas al geocodificador (sin cache).', ('resultado',)))
+
+
+def _antes_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metricas_inicio', []).append(time.perf_counter())
+
+
+def _despues_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    duracion = time.perf_counter() - conn.info['metricas_inicio'].pop()
+    consultas_total.incrementar()
+    bd_segundos_total.incrementar(duracion)
+    actuales = _consultas_actuales.get()
+    if actuales is not None:
+        actuales[0] += 1
+        actuales[1] += duracion
+
+
+def _observar_consultas(endpoint, actuales):
+    consultas_por_peticion.observar(actuales[0], endpoint)
+    bd_segundos_por_peticion.observar(actuales[1], endpoint)
+
+
+def _conexiones_socketio(socketio):
+    return len(socketio.server.eio.sockets)
+
+
+def _salas_socketio(socketio):
+    """Salas con nombre (conversaciones, salas personales) de este proceso, sin las salas por sid."""
+    salas = socketio.server.manager.rooms.get('/', {})
+    sids = salas.get(None, {})
+    return sum(1 for sala in salas if sala is not None and sala not in sids)
+
+
+def _instrumentar_eventos(socketio):
+    """
+    Mide todos los handlers envolviendo el despacho de Flask-SocketIO, que los
+    ejecuta uno por uno (incluidos connect/disconnect) sin ningún hook propio.
+    """
+    despachar = socketio._handle_event
+
+    def _handle_event(handler, message, namespace, sid, *args):
+        actuales = [0, 0.0]
+        token = _consultas_actuales.set(actuales)
+        inicio = time.perf_counter()
+        try:
+            return despachar(handler, message, namespace, sid, *args)
+        finally:
+            socketio_segundos.observar(time.perf_counter() - inicio, message)
+            _observar_consultas(f"socketio:{message}", actuales)
+            _consultas_actuales.reset(token)
+
+    socketio._handle_event = _handle_event
+
+
+def registrar_metricas(app, socketio):
+    """Instala los hooks y la ruta /metrics si METRICAS_HABILITADAS está activo."""
+    if not app.config['METRICAS_HABILITADAS']:
+        return
+    registro.habilitado = True
+
+    event.listen(Engine, 'before_cursor_execute', _antes_de_consulta)
+    event.listen(Engine, 'after_cursor_execute', _despues_de_consulta)
+    _instrumentar_eventos(socketio)
+    registro.agregar(Medidor('zerby_socketio_conexiones', 'Clientes de Socket.IO conectados a este proceso.',
+                             lambda: _conexiones_socketio(socketio)))
+    registro.agregar(Medidor('zerby_socketio_salas', 'Salas de Socket.IO con al menos un cliente en este proceso.',
+                             lambda: _salas_socketio(socketio)))
+
+    @app.before_request
+    def _iniciar_medicion():
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_consultas = [0, 0.0]
+        g.metricas_token = _consultas_actuales.set(g.metricas_consultas)
+
+    @app.after_request
+    def _guardar_estado(respuesta):
+        g.metricas_estado = respuesta.status_code
+        return respuesta
+
+    # En teardown y no en after_request: así se incluye el tiempo de los demás
+    # after_request (ej: la compresión) y también las peticiones que fallan
+    @app.teardown_request
+    def _terminar_medicion(error):
+        inicio = g.pop('metricas_inicio', None)
+        if inicio is None:
+            return
+        endpoint = request.endpoint or 'sin_ruta'
+        estado = g.pop('metricas_estado', 500)
+        http_segundos.observar(time.perf_counter() - inicio, endpoint, request.method, str(estado))
+        _observar_consultas(endpoint, g.metricas_consultas)
+        _consultas_actuales.reset(g.metricas_token)
+
+    @app.route('/metrics')
+    def metricas():
+        token = app.config['METRICAS_TOKEN']
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            abort(401)
+        respuesta = app.response_class(registro.exportar(), mimetype='text/plain')
+        respuesta.headers['Content-Type'] = TIPO_CONTENIDO
+        respuesta.headers['Cache-Control'] = 'no-store'
+        return respuesta
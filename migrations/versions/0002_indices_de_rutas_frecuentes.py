@@ -0,0 +1,41 @@
+"""indices de rutas frecuentes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 22:34:33.715894
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+INDICES = [
+    ('ix_calificacion_proveedor_timestamp', 'calificacion', ['proveedor_id', 'timestamp']),
+    ('ix_conversacion_proveedor', 'conversacion', ['proveedor_id']),
+    ('ix_conversacion_usuario_proveedor', 'conversacion', ['usuario_id', 'proveedor_id']),
+    ('ix_mensaje_conversacion_timestamp', 'mensaje', ['conversacion_id', 'timestamp', 'id']),
+    ('ix_portafolio_proveedor_timestamp', 'portafolio', ['proveedor_id', 'timestamp']),
+    ('ix_trabajo_conversacion_timestamp', 'trabajo', ['conversacion_id', 'timestamp_creacion', 'id']),
+]
+
+
+def upgrade():
+    # CONCURRENTLY no bloquea las escrituras en tablas grandes (mensaje), pero
+    # no puede correr dentro de una transacción
+    with op.get_context().autocommit_block():
+        for nombre, tabla, columnas in INDICES:
+            op.create_index(nombre, tabla, columnas, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for nombre, tabla, _ in reversed(INDICES):
+            op.drop_index(nombre, table_name=tabla, postgresql_concurrently=True, if_exists=True)
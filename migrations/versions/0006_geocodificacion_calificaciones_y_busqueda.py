@@ -0,0 +1,123 @@
+"""geocodificacion, calificaciones y busqueda
+
+Columnas, tablas e índices que se agregaron al modelo antes de usar
+migraciones y que no están en el esquema inicial (0001):
+
+- índice ix_proveedor_lat_lon (búsqueda de cercanos en SQL)
+- tabla geocodificacion_cache y columnas geocode_estado
+- agregados calif_suma/calif_total/calif_promedio, calculados aquí a partir
+  de calificacion (igual que recalcular_calificaciones.py)
+- configuración zerby_es, f_unaccent, columna busqueda e índices de texto
+  y de trigramas (extensiones unaccent y pg_trgm)
+
+Va al final de la serie para que también la reciban las BD que ya se
+marcaron en 0001 y se actualizaron. Todo es IF NOT EXISTS: en una BD que
+ya tiene estas columnas no cambia nada.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 10:12:31.204518
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+# Copia de SQL_BUSQUEDA_TEXTO / SQL_INDICE_TRIGRAMAS de app.py al momento de esta revisión
+SQL_BUSQUEDA_TEXTO = """
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'zerby_es') THEN
+        CREATE TEXT SEARCH CONFIGURATION zerby_es (COPY = spanish);
+        ALTER TEXT SEARCH CONFIGURATION zerby_es
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    END IF;
+END
+$$;
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent', $1) $$;
+"""
+SQL_INDICE_TRIGRAMAS = """
+CREATE INDEX IF NOT EXISTS ix_proveedor_oficio_trgm
+    ON proveedor USING gin (f_unaccent(lower(oficio)) gin_trgm_ops);
+"""
+
+SQL_COLUMNAS = """
+CREATE TABLE IF NOT EXISTS geocodificacion_cache (
+    clave VARCHAR(255) NOT NULL PRIMARY KEY,
+    lat FLOAT,
+    lon FLOAT,
+    actualizado TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+ALTER TABLE usuario ADD COLUMN IF NOT EXISTS geocode_estado VARCHAR(20);
+ALTER TABLE proveedor
+    ADD COLUMN IF NOT EXISTS geocode_estado VARCHAR(20),
+    ADD COLUMN IF NOT EXISTS calif_suma INTEGER DEFAULT '0' NOT NULL,
+    ADD COLUMN IF NOT EXISTS calif_total INTEGER DEFAULT '0' NOT NULL,
+    ADD COLUMN IF NOT EXISTS calif_promedio FLOAT DEFAULT '0' NOT NULL,
+    ADD COLUMN IF NOT EXISTS busqueda TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('zerby_es', coalesce(oficio, '')), 'A') ||
+        setweight(to_tsvector('zerby_es', coalesce(descripcion, '')), 'B') ||
+        setweight(to_tsvector('zerby_es', coalesce(direccion, '')), 'C')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS ix_proveedor_lat_lon ON proveedor (lat, lon);
+CREATE INDEX IF NOT EXISTS ix_proveedor_busqueda ON proveedor USING gin (busqueda);
+"""
+
+# Las direcciones ya geocodificadas (de forma síncrona) quedan OK; las que no
+# tienen coordenadas quedan PENDIENTE para backfill_coordenadas.py
+SQL_ESTADO_GEOCODIFICACION = """
+UPDATE {tabla} SET geocode_estado = CASE WHEN lat IS NOT NULL AND lon IS NOT NULL THEN 'OK' ELSE 'PENDIENTE' END
+WHERE geocode_estado IS NULL AND direccion IS NOT NULL AND direccion <> '';
+"""
+
+# Mismo cálculo que recalcular_calificaciones.py
+SQL_AGREGADOS_CALIFICACIONES = """
+UPDATE proveedor p
+SET calif_suma = a.suma, calif_total = a.total, calif_promedio = a.suma * 1.0 / a.total
+FROM (
+    SELECT proveedor_id, sum(puntuacion) AS suma, count(id) AS total
+    FROM calificacion GROUP BY proveedor_id
+) a
+WHERE p.id = a.proveedor_id AND (p.calif_suma <> a.suma OR p.calif_total <> a.total);
+
+UPDATE proveedor SET calif_suma = 0, calif_total = 0, calif_promedio = 0
+WHERE id NOT IN (SELECT proveedor_id FROM calificacion) AND (calif_total <> 0 OR calif_suma <> 0);
+"""
+
+
+def upgrade():
+    # La columna proveedor.busqueda depende de la configuración zerby_es
+    op.execute(SQL_BUSQUEDA_TEXTO)
+    op.execute(SQL_COLUMNAS)
+    op.execute(SQL_INDICE_TRIGRAMAS)
+    for tabla in ('usuario', 'proveedor'):
+        op.execute(SQL_ESTADO_GEOCODIFICACION.format(tabla=tabla))
+    op.execute(SQL_AGREGADOS_CALIFICACIONES)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_proveedor_oficio_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_proveedor_busqueda")
+    op.execute("DROP INDEX IF EXISTS ix_proveedor_lat_lon")
+    op.execute("""
+        ALTER TABLE proveedor
+            DROP COLUMN IF EXISTS busqueda,
+            DROP COLUMN IF EXISTS calif_promedio,
+            DROP COLUMN IF EXISTS calif_total,
+            DROP COLUMN IF EXISTS calif_suma,
+            DROP COLUMN IF EXISTS geocode_estado
+    """)
+    op.execute("ALTER TABLE usuario DROP COLUMN IF EXISTS geocode_estado")
+    op.execute("DROP TABLE IF EXISTS geocodificacion_cache")
+    op.execute("DROP FUNCTION IF EXISTS f_unaccent(text)")
+    op.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS zerby_es")
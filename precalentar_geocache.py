@@ -0,0 +1,35 @@
+import argparse
+import sys
+from app import app, db, Usuario, Proveedor
+from geocodificacion import cache_geocodificacion
+
+def direcciones_desde_bd():
+    """Direcciones distintas de usuarios y proveedores."""
+    consulta = db.session.query(Usuario.direccion).filter(Usuario.direccion.isnot(None))\
+        .union(db.session.query(Proveedor.direccion).filter(Proveedor.direccion.isnot(None)))
+    for (direccion,) in consulta.yield_per(1000):
+        yield direccion
+
+def direcciones_desde_archivo(ruta):
+    """Una dirección por línea; se ignoran las líneas vacías."""
+    with open(ruta, encoding="utf-8") as archivo:
+        for linea in archivo:
+            if linea.strip():
+                yield linea.strip()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precalienta la cache de geocodificación sin pasar por la web.")
+    parser.add_argument("archivo", nargs="?", help="Archivo de texto con una dirección por línea")
+    parser.add_argument("--desde-bd", action="store_true", help="Usar las direcciones ya registradas en la BD")
+    parser.add_argument("--pausa", type=float, default=1.0, help="Segundos entre consultas a Nominatim")
+    args = parser.parse_args()
+
+    if not args.archivo and not args.desde_bd:
+        parser.print_help()
+        sys.exit(1)
+
+    with app.app_context():
+        direcciones = direcciones_desde_bd() if args.desde_bd else direcciones_desde_archivo(args.archivo)
+        consultadas = cache_geocodificacion.precalentar(direcciones, pausa=args.pausa)
+        print(f"Direcciones consultadas a Nominatim: {consultadas}")
+        print(f"Estadísticas: {cache_geocodificacion.estadisticas()}")
@@ -0,0 +1,99 @@
+"""
+Presupuesto de consultas SQL por ruta y detección de N+1.
+
+Cada ruta puede declarar cuántas sentencias SQL ejecuta como máximo:
+
+    @app.route('/api/conversaciones')
+    @presupuesto_consultas(2)
+    def api_get_conversaciones(): ...
+
+Las rutas sin decorador usan PRESUPUESTO_CONSULTAS_DEFECTO. Además, una misma
+sentencia ejecutada PRESUPUESTO_REPETICIONES veces o más en una petición se
+reporta como posible N+1 (típicamente una relación lazy leída dentro de un
+for), con el archivo y la línea del código de la app que la disparó.
+
+PRESUPUESTO_CONSULTAS_MODO:
+- vacío (por defecto): no se instala nada, costo cero en producción.
+- 'aviso': imprime cada exceso al terminar la petición.
+- 'error': la petición falla con PresupuestoExcedido (para verificar_consultas.py
+  y pruebas). Guardar la pila de cada consulta es caro: solo para desarrollo.
+"""
+from collections import Counter
+import os
+import traceback
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_ESTE_ARCHIVO = os.path.abspath(__file__)
+_CARPETA_APP = os.path.dirname(_ESTE_ARCHIVO)
+
+
+class PresupuestoExcedido(AssertionError):
+    pass
+
+
+def presupuesto_consultas(maximo):
+    """Declara el máximo de sentencias SQL de la vista (va debajo de @app.route)."""
+    def decorador(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return decorador
+
+
+def _lugar_en_la_app():
+    """Primer frame (desde el más interno) que pertenece al código de la app y no a este módulo."""
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(_CARPETA_APP) and frame.filename != _ESTE_ARCHIVO \
+                and 'site-packages' not in frame.filename:
+            return f"{os.path.relpath(frame.filename, _CARPETA_APP)}:{frame.lineno} en {frame.name}"
+    return "?"
+
+
+def _al_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    consultas = g.get('presupuesto_sentencias') if has_request_context() else None
+    if consultas is None:
+        return
+    consultas.append(statement)
+    if statement not in g.presupuesto_lugares:
+        g.presupuesto_lugares[statement] = _lugar_en_la_app()
+
+
+def problemas(sentencias, lugares, maximo, repeticiones):
+    """Lista de textos describiendo el exceso de presupuesto y las sentencias repetidas."""
+    encontrados = []
+    if maximo is not None and len(sentencias) > maximo:
+        encontrados.append(f"{len(sentencias)} consultas, presupuesto {maximo}")
+    for sentencia, veces in Counter(sentencias).most_common():
+        if veces < repeticiones:
+            break
+        encontrados.append(f"posible N+1: {veces} veces desde {lugares.get(sentencia, '?')}: {' '.join(sentencia.split())}")
+    return encontrados
+
+
+def registrar_presupuesto_consultas(app):
+    modo = app.config['PRESUPUESTO_CONSULTAS_MODO']
+    if not modo:
+        return
+    event.listen(Engine, 'before_cursor_execute', _al_ejecutar)
+
+    @app.before_request
+    def _iniciar_presupuesto():
+        g.presupuesto_sentencias = []
+        g.presupuesto_lugares = {}
+
+    @app.after_request
+    def _verificar_presupuesto(respuesta):
+        sentencias = g.pop('presupuesto_sentencias', None)
+        if sentencias is None:
+            return respuesta
+        vista = app.view_functions.get(request.endpoint)
+        maximo = getattr(vista, 'presupuesto_consultas', app.config['PRESUPUESTO_CONSULTAS_DEFECTO'])
+        encontrados = problemas(sentencias, g.presupuesto_lugares, maximo, app.config['PRESUPUESTO_REPETICIONES'])
+        if encontrados:
+            texto = f"{request.method} {request.path} ({request.endpoint}): " + "; ".join(encontrados)
+            if modo == 'error':
+                raise PresupuestoExcedido(texto)
+            print(f"[PRESUPUESTO] {texto}")
+        return respuesta
@@ -0,0 +1,102 @@
+"""
+Genera las variantes de las fotos del portafolio fuera del servidor.
+
+- Items PROCESANDO cuya original quedó en PORTAFOLIO_PENDIENTES_FOLDER (cola
+  llena o proceso reiniciado antes de terminar).
+- Con --antiguas: fotos subidas antes del procesamiento (sin variantes), leyendo
+  la original de static/uploads. Con --borrar-originales se borra además esa
+  original pública, que conserva sus metadatos (EXIF, GPS).
+
+Uso:
+    python procesar_portafolio.py [--antiguas [--borrar-originales]] [--concurrencia 4]
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import update
+
+from app import app, db, Portafolio
+from cache_respuestas import crear_backend_compartido
+from archivos import agregar_referencias, almacen, claves_de
+from cola_imagenes import guardar_resultado, original_pendiente, procesar_foto
+import imagenes
+
+
+def _procesar(item_id, ruta):
+    try:
+        return procesar_foto(ruta)
+    except Exception as e:
+        print(f"Portafolio {item_id}: no se pudo procesar {ruta}: {e}")
+        return None
+
+
+def procesar_pendientes(pool):
+    items = Portafolio.query.filter_by(estado='PROCESANDO').order_by(Portafolio.id).all()
+    db.session.rollback()
+    rutas = {item.id: original_pendiente(item.id) for item in items}
+    trabajos = {item_id: pool.submit(_procesar, item_id, ruta) for item_id, ruta in rutas.items() if ruta}
+
+    listos = 0
+    for item_id, ruta in rutas.items():
+        variantes = trabajos[item_id].result() if ruta else None
+        if guardar_resultado(item_id, variantes):
+            listos += bool(variantes)
+        if ruta:
+            imagenes.borrar_archivos([ruta])
+    print(f"Pendientes: {listos} de {len(rutas)} procesadas")
+    return len(rutas)
+
+
+def procesar_antiguas(pool, borrar_originales):
+    prefijo_uploads = f"{app.static_url_path}/uploads/"
+    items = Portafolio.query.filter(Portafolio.estado == 'LISTO', Portafolio.variantes.is_(None))\
+        .order_by(Portafolio.id).all()
+    db.session.rollback()
+    rutas = {
+        item.id: os.path.join(app.config['UPLOAD_FOLDER'], item.imagen_url[len(prefijo_uploads):])
+        for item in items if item.imagen_url.startswith(prefijo_uploads)
+    }
+    trabajos = {item_id: pool.submit(_procesar, item_id, ruta) for item_id, ruta in rutas.items()
+                if os.path.exists(ruta)}
+
+    listos = 0
+    for item_id, trabajo in trabajos.items():
+        variantes = trabajo.result()
+        if not variantes:
+            continue
+        # Solo si nadie lo procesó o borró mientras tanto (si no, los archivos quedan para limpiar_archivos.py)
+        resultado = db.session.execute(
+            update(Portafolio)
+            .where(Portafolio.id == item_id, Portafolio.variantes.is_(None))
+            .values(variantes=variantes, imagen_url=almacen.url(variantes[-1]["jpeg"]))
+        )
+        if not resultado.rowcount:
+            db.session.rollback()
+            continue
+        agregar_referencias(claves_de(variantes))
+        db.session.commit()
+        listos += 1
+        if borrar_originales:
+            imagenes.borrar_archivos([rutas[item_id]])
+    print(f"Antiguas: {listos} de {len(items)} procesadas ({len(items) - len(trabajos)} sin archivo original)")
+    return listos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera las variantes de las fotos del portafolio pendientes.")
+    parser.add_argument("--antiguas", action="store_true", help="Procesar también las fotos subidas sin variantes")
+    parser.add_argument("--borrar-originales", action="store_true",
+                        help="Con --antiguas, borrar la original de static/uploads una vez procesada")
+    parser.add_argument("--concurrencia", type=int, default=os.cpu_count() or 2, help="Fotos procesadas en paralelo")
+    args = parser.parse_args()
+
+    with app.app_context(), ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+        cambios = procesar_pendientes(pool)
+        if args.antiguas:
+            cambios += procesar_antiguas(pool, args.borrar_originales)
+        # Los perfiles cacheados listan el portafolio: limpiamos la cache compartida
+        # (las copias en memoria de cada proceso vencen solas en RESPUESTAS_CACHE_TTL_LOCAL)
+        compartida = crear_backend_compartido(app.config['RESPUESTAS_CACHE_URL'])
+        if cambios and compartida is not None:
+            compartida.limpiar()
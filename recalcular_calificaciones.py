@@ -0,0 +1,53 @@
+from sqlalchemy import func, select, update
+from app import app, db, Proveedor, Calificacion
+from cache_respuestas import crear_backend_compartido
+
+def recalcular_calificaciones():
+    """
+    Recalcula calif_suma, calif_total y calif_promedio de todos los proveedores
+    a partir de la tabla Calificacion. Solo escribe las filas que no cuadran y
+    retorna cuántas se corrigieron.
+    """
+    agregados = select(
+        Calificacion.proveedor_id,
+        func.sum(Calificacion.puntuacion).label('suma'),
+        func.count(Calificacion.id).label('total')
+    ).group_by(Calificacion.proveedor_id).subquery()
+
+    # 1. Proveedores con calificaciones
+    con_calificaciones = db.session.execute(
+        update(Proveedor)
+        .where(Proveedor.id == agregados.c.proveedor_id)
+        .where(
+            (Proveedor.calif_suma != agregados.c.suma) |
+            (Proveedor.calif_total != agregados.c.total)
+        )
+        .values(
+            calif_suma=agregados.c.suma,
+            calif_total=agregados.c.total,
+            calif_promedio=agregados.c.suma * 1.0 / agregados.c.total
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+
+    # 2. Proveedores sin calificaciones que tienen agregados distintos de cero
+    sin_calificaciones = db.session.execute(
+        update(Proveedor)
+        .where(~Proveedor.id.in_(select(Calificacion.proveedor_id)))
+        .where((Proveedor.calif_total != 0) | (Proveedor.calif_suma != 0))
+        .values(calif_suma=0, calif_total=0, calif_promedio=0)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    db.session.commit()
+    return con_calificaciones + sin_calificaciones
+
+if __name__ == "__main__":
+    with app.app_context():
+        print("Recalculando agregados de calificaciones...")
+        corregidos = recalcular_calificaciones()
+        print(f"Listo. Proveedores corregidos: {corregidos}")
+        # Los perfiles cacheados muestran los agregados: limpiamos la cache compartida
+        # (las copias en memoria de cada proceso vencen solas en RESPUESTAS_CACHE_TTL_LOCAL)
+        compartida = crear_backend_compartido(app.config['RESPUESTAS_CACHE_URL'])
+        if corregidos and compartida is not None:
+            compartida.limpiar()
@@ -1,14 +1,30 @@
-from flask import request, jsonify, render_template, session, redirect, url_for, abort
-from sqlalchemy import func
+from flask import request, jsonify, render_template, session, redirect, url_for, abort, send_from_directory
+from sqlalchemy import func, literal, select, tuple_, update
 from datetime import datetime, timezone
-from flask_socketio import emit, join_room
+from functools import lru_cache
+from flask_socketio import emit, join_room, rooms
+import base64
+import json
+import math
 import os
+import secrets
 import time
-from werkzeug.utils import secure_filename
 
 # --- IMPORTACIONES NUEVAS PARA GEOLOCALIZACIÓN ---
-from geopy.geocoders import Nominatim
-from haversine import haversine, Unit
+from geocodificacion import cache_geocodificacion, LimitadorTasa
+from cola_geocodificacion import ColaGeocodificacion
+from indice_geo import IndiceGeografico, KM_POR_GRADO, RADIO_TIERRA_KM
+from distancias import MatrizDistancias
+from autocompletar import TrieAutocompletado, palabras_normalizadas
+from buffer_mensajes import BufferMensajes
+from cache_respuestas import CacheRespuestas, crear_backend_compartido
+from cola_imagenes import ColaImagenes, original_pendiente, ruta_pendiente
+from almacenamiento import AlmacenLocal, es_clave, guardar_con_hash
+from archivos import agregar_referencias, almacen, claves_de, liberar_referencias
+import imagenes
+from contrasenas import hashear, necesita_rehash, verificar, verificar_sin_cuenta
+from metricas import Medidor, registro
+from presupuesto_consultas import presupuesto_consultas
 
 # Importamos la instancia de app, db, socketio y los modelos
 from app import app, db, socketio, Usuario, Proveedor, Conversacion, Mensaje, Calificacion, Portafolio, Trabajo
@@ -17,39 +33,293 @@ from app import app, db, socketio, Usuario, Proveedor, Conversacion, Mensaje, Ca
 
 def obtener_coordenadas(direccion):
     """
-    Recibe una dirección en texto, la consulta en OpenStreetMap
-    y retorna (latitud, longitud). Si falla, retorna (None, None).
+    Recibe una dirección en texto y retorna (latitud, longitud) usando la
+    cache de geocodificación (memoria -> BD -> OpenStreetMap).
+    Si falla, retorna (None, None).
     """
     if not direccion:
         return None, None
-    
-    # Es importante poner un user_agent único para no ser bloqueado por Nominatim
-    geolocator = Nominatim(user_agent="zerby_app_v2_client")
-    try:
-        # Añadimos ", Chile" para acotar la búsqueda
-        location = geolocator.geocode(direccion + ", Chile", timeout=10)
-        if location:
-            return location.latitude, location.longitude
-    except Exception as e:
-        print(f"Error obteniendo coordenadas: {e}")
-    
-    return None, None
+    return cache_geocodificacion.obtener(direccion)
+
+def _asignar_direccion(entidad, direccion):
+    """
+    Guarda la nueva dirección en un Usuario/Proveedor. Si las coordenadas ya
+    están en la cache en memoria (o la geocodificación es síncrona) se asignan
+    de inmediato. Si no, la entidad queda PENDIENTE con sus coordenadas
+    anteriores. Retorna True si hay que encolarla después del commit.
+    """
+    entidad.direccion = direccion
+    if not direccion:
+        entidad.lat, entidad.lon, entidad.geocode_estado = None, None, None
+        return False
+
+    coords = cache_geocodificacion.en_memoria(direccion)
+    if coords is None and not app.config['GEOCODING_ASINCRONO']:
+        coords = obtener_coordenadas(direccion)
+    if coords is None:
+        entidad.geocode_estado = 'PENDIENTE'
+        return True
+
+    entidad.lat, entidad.lon = coords
+    entidad.geocode_estado = 'OK' if coords[0] is not None else 'FALLIDO'
+    return False
+
+def _sala_personal(tipo, entidad_id):
+    """Sala de Socket.IO propia de cada usuario/proveedor (avisos fuera de los chats)."""
+    return f"{tipo}_{entidad_id}"
+
+def _sala_chat(conv_id):
+    """Sala de Socket.IO de una conversación; conv_id siempre como int."""
+    return f"chat_{int(conv_id)}"
 
 def _get_base_query_proveedores_con_calif():
-    """Consulta base para obtener proveedores con su promedio de notas."""
-    calif_subquery = db.session.query(
-        Calificacion.proveedor_id,
-        func.avg(Calificacion.puntuacion).label('calif_promedio'),
-        func.count(Calificacion.id).label('calif_total')
-    ).group_by(Calificacion.proveedor_id).subquery()
-
-    return db.session.query(
-        Proveedor, 
-        calif_subquery.c.calif_promedio, 
-        calif_subquery.c.calif_total
-    ).outerjoin(
-        calif_subquery, Proveedor.id == calif_subquery.c.proveedor_id
+    """
+    Consulta base para obtener proveedores con su promedio de notas.
+    Los agregados están guardados en Proveedor, así que no hay JOIN con Calificacion.
+    """
+    return db.session.query(Proveedor, Proveedor.calif_promedio, Proveedor.calif_total)
+
+def _ajustar_agregados_calificacion(proveedor_id, delta_suma, delta_total):
+    """
+    Actualiza suma/total/promedio de un proveedor con un UPDATE atómico en la
+    misma transacción que la calificación (el lado derecho usa los valores
+    anteriores de la fila, así que no hay carreras entre requests).
+    """
+    db.session.execute(
+        update(Proveedor).where(Proveedor.id == proveedor_id).values(
+            calif_suma=Proveedor.calif_suma + delta_suma,
+            calif_total=Proveedor.calif_total + delta_total,
+            calif_promedio=func.coalesce(
+                (Proveedor.calif_suma + delta_suma) * 1.0 / func.nullif(Proveedor.calif_total + delta_total, 0), 0
+            )
+        ).execution_options(synchronize_session=False)
+    )
+
+# Estructuras en memoria con las coordenadas de los proveedores:
+# grilla espacial (indice_geo.py) y arreglos NumPy (distancias.py)
+indice_proveedores = IndiceGeografico()
+matriz_proveedores = MatrizDistancias()
+
+# Trie de oficios y términos de descripción para /api/autocompletar (ver autocompletar.py)
+trie_oficios = TrieAutocompletado()
+
+def _obtener_estructura_geo(estructura):
+    """
+    Retorna la estructura en memoria indicada, construyéndola desde la BD la
+    primera vez. Se reconstruye cada GEO_INDICE_TTL segundos para recoger
+    cambios hechos por otros procesos.
+    """
+    construido_en = estructura.construido_en
+    if construido_en is None or time.time() - construido_en > app.config['GEO_INDICE_TTL']:
+        puntos = db.session.query(Proveedor.id, Proveedor.lat, Proveedor.lon)\
+            .filter(Proveedor.lat.isnot(None), Proveedor.lon.isnot(None)).all()
+        estructura.reconstruir(puntos)
+    return estructura
+
+def _sincronizar_coordenadas(proveedor_id, lat, lon):
+    indice_proveedores.actualizar(proveedor_id, lat, lon)
+    matriz_proveedores.actualizar(proveedor_id, lat, lon)
+
+def _obtener_trie_oficios():
+    """Igual que _obtener_estructura_geo, pero para el trie de autocompletado."""
+    construido_en = trie_oficios.construido_en
+    if construido_en is None or time.time() - construido_en > app.config['AUTOCOMPLETAR_TTL']:
+        trie_oficios.reconstruir(
+            db.session.query(Proveedor.id, Proveedor.oficio, Proveedor.descripcion).yield_per(1000)
+        )
+    return trie_oficios
+
+def _sincronizar_proveedor(proveedor):
+    """Actualiza las estructuras en memoria después de guardar un proveedor."""
+    _sincronizar_coordenadas(proveedor.id, proveedor.lat, proveedor.lon)
+    trie_oficios.actualizar(proveedor.id, proveedor.oficio, proveedor.descripcion)
+
+def _geocodificacion_terminada(tipo, entidad_id, lat, lon):
+    """La cola ya guardó las coordenadas: actualizamos índices y avisamos al cliente."""
+    if tipo == 'proveedor':
+        _sincronizar_coordenadas(entidad_id, lat, lon)
+    payload = {"lat": lat, "lon": lon, "geocode_estado": 'OK' if lat is not None else 'FALLIDO'}
+    socketio.emit("geocodificacion_lista", payload, room=_sala_personal(tipo, entidad_id))
+
+cola_geocodificacion = ColaGeocodificacion(
+    cache_geocodificacion,
+    LimitadorTasa(app.config['GEOCODING_POR_SEGUNDO']),
+    concurrencia=app.config['GEOCODING_CONCURRENCIA'],
+    al_terminar=_geocodificacion_terminada
+)
+
+cache_respuestas = CacheRespuestas(
+    max_items=app.config['RESPUESTAS_CACHE_MAX_ITEMS'],
+    ttl=app.config['RESPUESTAS_CACHE_TTL'],
+    compartido=crear_backend_compartido(app.config['RESPUESTAS_CACHE_URL']),
+    ttl_local=app.config['RESPUESTAS_CACHE_TTL_LOCAL']
+)
+
+def _clave_perfil_proveedor(proveedor_id):
+    return f"perfil_proveedor:{proveedor_id}"
+
+def _serializar_portafolio(item):
+    """
+    imagen_url es la variante JPEG más grande (o la foto original en items
+    antiguos); con `variantes` el cliente arma srcset y el navegador baja la
+    más chica que le sirve para el tamaño en pantalla.
+    """
+    datos = {"id": item.id, "imagen_url": item.imagen_url, "descripcion": item.descripcion, "estado": item.estado}
+    if item.variantes:
+        datos["variantes"] = [
+            {"ancho": v["ancho"], "alto": v["alto"], "webp": almacen.url(v["webp"]), "jpeg": almacen.url(v["jpeg"])}
+            for v in item.variantes
+        ]
+    return datos
+
+def _foto_portafolio_procesada(item_id, proveedor_id):
+    """La cola de imágenes terminó: el perfil público cambia y avisamos al proveedor."""
+    cache_respuestas.invalidar(_clave_perfil_proveedor(proveedor_id))
+    item = db.session.get(Portafolio, item_id)
+    if item is not None:
+        socketio.emit("portafolio_actualizado", _serializar_portafolio(item), room=_sala_personal('proveedor', proveedor_id))
+
+cola_imagenes = ColaImagenes(
+    concurrencia=app.config['PORTAFOLIO_CONCURRENCIA'],
+    al_terminar=_foto_portafolio_procesada
+)
+
+def _respuesta_json_cacheada(cuerpo, etag):
+    """Respuesta con ETag fuerte; si coincide con If-None-Match se convierte en 304."""
+    respuesta = app.response_class(cuerpo, mimetype='application/json')
+    respuesta.set_etag(etag)
+    # no-cache: el navegador guarda la respuesta pero siempre revalida con el ETag
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta.make_conditional(request)
+
+buffer_mensajes = None
+if app.config['MENSAJES_WRITE_BEHIND']:
+    buffer_mensajes = BufferMensajes(
+        intervalo_ms=app.config['MENSAJES_FLUSH_MS'],
+        max_lote=app.config['MENSAJES_LOTE_MAX'],
+        capacidad=app.config['MENSAJES_BUFFER_CAPACIDAD']
+    )
+    buffer_mensajes.instalar_cierre()
+
+# Estado de caches y colas en /metrics (se lee solo al scrapear)
+registro.estadisticas('zerby_geocache', 'Estadisticas de la cache de geocodificacion.', cache_geocodificacion.estadisticas)
+registro.estadisticas('zerby_cache_respuestas', 'Estadisticas de la cache de respuestas.', cache_respuestas.estadisticas)
+if buffer_mensajes is not None:
+    registro.estadisticas('zerby_buffer_mensajes', 'Estadisticas del buffer de mensajes.', buffer_mensajes.estadisticas)
+registro.agregar(Medidor('zerby_cola_geocodificacion_pendientes', 'Direcciones esperando geocodificacion.',
+                         lambda: len(cola_geocodificacion)))
+registro.agregar(Medidor('zerby_cola_imagenes_pendientes', 'Fotos del portafolio esperando procesamiento.',
+                         lambda: len(cola_imagenes)))
+
+def _codificar_cursor(*valores):
+    """Cursor opaco para paginación keyset (base64 de una lista JSON)."""
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+
+def _decodificar_cursor(texto):
+    """Inverso de _codificar_cursor. Lanza ValueError si el cursor no es válido."""
+    try:
+        relleno = '=' * (-len(texto) % 4)
+        return tuple(json.loads(base64.urlsafe_b64decode(texto + relleno)))
+    except Exception:
+        raise ValueError("cursor inválido")
+
+def _query_proveedores_cercanos_sql(lat, lon, radio_km, limite, despues_de=None):
+    """
+    Proveedores a menos de radio_km de (lat, lon), ordenados por distancia.
+    El filtro por rectángulo (lat/lon) aprovecha el índice ix_proveedor_lat_lon
+    y la distancia exacta (Haversine) se calcula solo para esos candidatos.
+    Con radio_km=None no hay rectángulo: calcula la distancia a todos.
+    Retorna filas (Proveedor, promedio, total, distancia_km).
+    """
+    a = func.power(func.sin(func.radians(Proveedor.lat - lat) / 2), 2) + \
+        math.cos(math.radians(lat)) * func.cos(func.radians(Proveedor.lat)) * \
+        func.power(func.sin(func.radians(Proveedor.lon - lon) / 2), 2)
+    distancia = (2 * RADIO_TIERRA_KM * func.asin(func.least(1.0, func.sqrt(a)))).label('distancia_km')
+
+    query = _get_base_query_proveedores_con_calif().add_columns(distancia)
+    if radio_km is None:
+        query = query.filter(Proveedor.lat.isnot(None), Proveedor.lon.isnot(None))
+    else:
+        d_lat = radio_km / KM_POR_GRADO
+        lat_extrema = min(89.9, abs(lat) + d_lat)
+        d_lon = radio_km / (KM_POR_GRADO * math.cos(math.radians(lat_extrema)))
+        query = query.filter(
+            Proveedor.lat.between(lat - d_lat, lat + d_lat),
+            Proveedor.lon.between(lon - d_lon, lon + d_lon),
+            distancia <= radio_km
+        )
+    if despues_de is not None:
+        query = query.filter(tuple_(distancia, Proveedor.id) > tuple_(*despues_de))
+    return query.order_by(distancia, Proveedor.id).limit(limite).all()
+
+def _buscar_proveedores_cercanos(lat, lon, radio_km, limite, despues_de=None):
+    """
+    Retorna [(Proveedor, promedio, total, distancia_km), ...] ordenado por
+    (distancia, id) usando el motor configurado en CERCANOS_BACKEND.
+    Con radio_km=None retorna los `limite` más cercanos sin tope de distancia.
+    """
+    backend = app.config['CERCANOS_BACKEND']
+    if backend == 'sql':
+        if radio_km is not None:
+            return _query_proveedores_cercanos_sql(lat, lon, radio_km, limite, despues_de)
+        # Si un radio ya trae `limite` filas, son las más cercanas: lo que quedó
+        # fuera del rectángulo está más lejos. Si no, se agranda el radio.
+        for radio in (app.config['CERCANOS_RADIO_KM'], app.config['CERCANOS_RADIO_MAX_KM']):
+            filas = _query_proveedores_cercanos_sql(lat, lon, radio, limite, despues_de)
+            if len(filas) == limite:
+                return filas
+        return _query_proveedores_cercanos_sql(lat, lon, None, limite, despues_de)
+
+    estructura = matriz_proveedores if backend == 'numpy' else indice_proveedores
+    vecinos = _obtener_estructura_geo(estructura).cercanos(lat, lon, limite, radio_km=radio_km, despues_de=despues_de)
+    if not vecinos:
+        return []
+    distancias = {proveedor_id: dist for dist, proveedor_id in vecinos}
+    filas = _get_base_query_proveedores_con_calif()\
+        .filter(Proveedor.id.in_(list(distancias))).all()
+    filas = [(p, prom, total, distancias[p.id]) for p, prom, total in filas]
+    filas.sort(key=lambda fila: (fila[3], fila[0].id))
+    return filas
+
+def _terminos_busqueda(texto):
+    """Palabras en minúscula y sin tildes: 'Gasfíter Ñuñoa' -> ['gasfiter', 'nunoa']."""
+    return palabras_normalizadas(texto)
+
+def _query_busqueda_texto(texto):
+    """
+    Búsqueda de proveedores con el índice de texto (tsvector, GIN) más
+    similitud de trigramas sobre el oficio para tolerar errores de tipeo.
+    Retorna (query, rank): filas (Proveedor, promedio, total, rank).
+    Cada palabra se busca como prefijo, para el buscador mientras se escribe.
+    """
+    terminos = _terminos_busqueda(texto)
+    tsquery = " & ".join(f"{t}:*" for t in terminos)
+    consulta_ts = func.to_tsquery('zerby_es', tsquery)
+    texto_normalizado = " ".join(terminos)
+    oficio_normalizado = func.f_unaccent(func.lower(Proveedor.oficio))
+
+    rank = (
+        func.ts_rank_cd(Proveedor.busqueda, consulta_ts) +
+        func.word_similarity(texto_normalizado, oficio_normalizado)
+    ).label('rank')
+    query = _get_base_query_proveedores_con_calif().add_columns(rank).filter(
+        Proveedor.busqueda.op('@@')(consulta_ts) |
+        db.literal(texto_normalizado).op('<%')(oficio_normalizado)
     )
+    return query, rank
+
+def _estimar_filas(query):
+    """
+    Cantidad aproximada de filas de una consulta según el planificador de
+    Postgres (EXPLAIN), sin ejecutar un COUNT(*) sobre todas las coincidencias.
+    """
+    compilada = query.statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + str(compilada), compilada.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
 
 def _serializar_proveedor(p, promedio, total, distancia_km=None):
     """Convierte objeto Proveedor a JSON, incluyendo distancia si existe."""
@@ -102,20 +372,52 @@ def dashboard():
 
 # --- RUTAS DE AUTENTICACIÓN Y PERFIL ---
 
+MODELOS_CUENTA = {'usuario': Usuario, 'proveedor': Proveedor}
+
+def _cuentas_por_email(email):
+    """Usuario y/o proveedor con ese email en una sola consulta (ambos emails tienen índice único)."""
+    consulta = select(literal('usuario').label('tipo'), Usuario.id, Usuario.password_hash)\
+        .where(Usuario.email == email)\
+        .union_all(select(literal('proveedor'), Proveedor.id, Proveedor.password_hash)
+                   .where(Proveedor.email == email))
+    # Como antes, si el email existe en ambas tablas se prueba primero como usuario
+    return sorted(db.session.execute(consulta).all(), key=lambda c: c.tipo != 'usuario')
+
+def _rehashear_password(tipo, cuenta_id, hash_anterior, password):
+    """Tarea de fondo: guarda el hash con los parámetros actuales (si la contraseña no cambió entretanto)."""
+    nuevo_hash = hashear(password)
+    modelo = MODELOS_CUENTA[tipo]
+    with app.app_context():
+        db.session.execute(
+            update(modelo)
+            .where(modelo.id == cuenta_id, modelo.password_hash == hash_anterior)
+            .values(password_hash=nuevo_hash)
+        )
+        db.session.commit()
+
 @app.route('/api/login', methods=['POST'])
+@presupuesto_consultas(1)
 def api_login():
     datos = request.json
-    usuario = Usuario.query.filter_by(email=datos.get('email')).first()
-    if usuario and usuario.check_password(datos.get('password')):
-        session['user_id'] = usuario.id
-        session['user_type'] = 'usuario'
-        return jsonify({"mensaje": "Inicio de sesión exitoso"}), 200
-
-    proveedor = Proveedor.query.filter_by(email=datos.get('email')).first()
-    if proveedor and proveedor.check_password(datos.get('password')):
-        session['user_id'] = proveedor.id
-        session['user_type'] = 'proveedor'
-        return jsonify({"mensaje": "Inicio de sesión exitoso"}), 200
+    email, password = datos.get('email'), datos.get('password')
+    if not email or not password:
+        return jsonify({"mensaje": "Email o contraseña incorrectos"}), 401
+
+    cuentas = _cuentas_por_email(email)
+    # Terminamos la transacción: la conexión vuelve al pool mientras se verifica la contraseña
+    db.session.rollback()
+    if not cuentas:
+        verificar_sin_cuenta(password)
+
+    for cuenta in cuentas:
+        # El hash corre en el pool de hilos: los sockets del proceso siguen atendiéndose
+        if verificar(cuenta.password_hash, password):
+            session['user_id'] = cuenta.id
+            session['user_type'] = cuenta.tipo
+            if necesita_rehash(cuenta.password_hash):
+                socketio.start_background_task(_rehashear_password, cuenta.tipo, cuenta.id,
+                                               cuenta.password_hash, password)
+            return jsonify({"mensaje": "Inicio de sesión exitoso"}), 200
 
     return jsonify({"mensaje": "Email o contraseña incorrectos"}), 401
 
@@ -126,6 +428,7 @@ def api_logout():
     return redirect(url_for('login_page'))
 
 @app.route('/api/get_profile')
+@presupuesto_consultas(1)
 def get_profile():
     if 'user_id' not in session: return jsonify({"error": "No autorizado"}), 401
     
@@ -142,7 +445,8 @@ def get_profile():
             "tipo": user_type,
             "direccion": user.direccion,
             "lat": user.lat,
-            "lon": user.lon
+            "lon": user.lon,
+            "geocode_estado": user.geocode_estado
         }
     else:
         user = Proveedor.query.get(user_id)
@@ -152,7 +456,8 @@ def get_profile():
             "email": user.email,
             "tipo": user_type,
             "oficio": user.oficio,
-            "direccion": user.direccion
+            "direccion": user.direccion,
+            "geocode_estado": user.geocode_estado
         }
         
     return jsonify(profile_data)
@@ -165,26 +470,22 @@ def registrar_usuario():
     if Usuario.query.filter_by(email=datos['email']).first():
         return jsonify({"mensaje": "El email ya está registrado"}), 400
 
-    # 1. Calcular Coordenadas
-    lat, lon = None, None
-    if 'direccion' in datos and datos['direccion']:
-        lat, lon = obtener_coordenadas(datos['direccion'])
-
     nuevo_usuario = Usuario(
         nombre_completo=datos['nombre_completo'],
         email=datos['email'],
-        telefono=datos.get('telefono'),
-        direccion=datos.get('direccion'), # Guardamos dirección
-        lat=lat, # Guardamos Lat
-        lon=lon  # Guardamos Lon
+        telefono=datos.get('telefono')
     )
-    nuevo_usuario.set_password(datos['password'])
+    # 1. Dirección (las coordenadas se calculan en segundo plano si no están en cache)
+    pendiente = _asignar_direccion(nuevo_usuario, datos.get('direccion'))
+    nuevo_usuario.password_hash = hashear(datos['password'])
     db.session.add(nuevo_usuario)
     db.session.commit()
+    if pendiente:
+        cola_geocodificacion.encolar('usuario', nuevo_usuario.id, nuevo_usuario.direccion)
     session['user_id'] = nuevo_usuario.id
     session['user_type'] = 'usuario'
     
-    return jsonify({"mensaje": "Usuario registrado"}), 201
+    return jsonify({"mensaje": "Usuario registrado", "geocode_estado": nuevo_usuario.geocode_estado}), 201
 
 @app.route('/registrar/proveedor', methods=['POST'])
 def registrar_proveedor():
@@ -192,30 +493,27 @@ def registrar_proveedor():
     if Proveedor.query.filter_by(email=datos['email']).first():
         return jsonify({"mensaje": "El email ya está registrado"}), 400
 
-    # 1. Calcular Coordenadas
-    lat, lon = None, None
-    if 'direccion' in datos and datos['direccion']:
-        lat, lon = obtener_coordenadas(datos['direccion'])
-
     nuevo_proveedor = Proveedor(
         nombre_completo=datos['nombre_completo'],
         email=datos['email'],
         telefono=datos['telefono'],
         oficio=datos['oficio'],
         descripcion=datos.get('descripcion'),
-        direccion=datos.get('direccion'), # Usamos direccion en vez de comuna
         horario=datos.get('horario'),
-        atiende_urgencias=datos.get('atiende_urgencias', False),
-        lat=lat,
-        lon=lon
+        atiende_urgencias=datos.get('atiende_urgencias', False)
     )
-    nuevo_proveedor.set_password(datos['password'])
+    # 1. Dirección (las coordenadas se calculan en segundo plano si no están en cache)
+    pendiente = _asignar_direccion(nuevo_proveedor, datos.get('direccion'))
+    nuevo_proveedor.password_hash = hashear(datos['password'])
     db.session.add(nuevo_proveedor)
     db.session.commit()
+    _sincronizar_proveedor(nuevo_proveedor)
+    if pendiente:
+        cola_geocodificacion.encolar('proveedor', nuevo_proveedor.id, nuevo_proveedor.direccion)
     session['user_id'] = nuevo_proveedor.id
     session['user_type'] = 'proveedor'
     
-    return jsonify({"mensaje": "Proveedor registrado con éxito"}), 201
+    return jsonify({"mensaje": "Proveedor registrado con éxito", "geocode_estado": nuevo_proveedor.geocode_estado}), 201
 
 @app.route('/api/proveedor/actualizar_perfil', methods=['POST'])
 def api_actualizar_proveedor():
@@ -226,6 +524,7 @@ def api_actualizar_proveedor():
     proveedor = Proveedor.query.get(session['user_id'])
     datos = request.json
     
+    pendiente = False
     try:
         if 'telefono' in datos:
             proveedor.telefono = datos['telefono']
@@ -233,13 +532,14 @@ def api_actualizar_proveedor():
         if 'direccion' in datos:
             nueva_direccion = datos['direccion']
             if nueva_direccion != proveedor.direccion: # Solo si cambió
-                lat, lon = obtener_coordenadas(nueva_direccion)
-                proveedor.direccion = nueva_direccion
-                proveedor.lat = lat
-                proveedor.lon = lon
+                pendiente = _asignar_direccion(proveedor, nueva_direccion)
             
         db.session.commit()
-        return jsonify({"mensaje": "Perfil actualizado correctamente"}), 200
+        _sincronizar_proveedor(proveedor)
+        cache_respuestas.invalidar(_clave_perfil_proveedor(proveedor.id))
+        if pendiente:
+            cola_geocodificacion.encolar('proveedor', proveedor.id, proveedor.direccion)
+        return jsonify({"mensaje": "Perfil actualizado correctamente", "geocode_estado": proveedor.geocode_estado}), 200
 
     except Exception as e:
         db.session.rollback()
@@ -254,6 +554,7 @@ def api_actualizar_usuario():
     usuario = Usuario.query.get(user_id)
     datos = request.json
     
+    pendiente = False
     try:
         if 'telefono' in datos:
             usuario.telefono = datos['telefono']
@@ -261,15 +562,14 @@ def api_actualizar_usuario():
         # Lógica de geolocalización al actualizar
         if 'direccion' in datos:
             nueva_direccion = datos['direccion']
-            # Solo llamamos a la API de mapas si la dirección cambió
+            # Solo geocodificamos si la dirección cambió
             if nueva_direccion != usuario.direccion:
-                lat, lon = obtener_coordenadas(nueva_direccion)
-                usuario.direccion = nueva_direccion
-                usuario.lat = lat
-                usuario.lon = lon
+                pendiente = _asignar_direccion(usuario, nueva_direccion)
             
         db.session.commit()
-        return jsonify({"mensaje": "Perfil actualizado correctamente"}), 200
+        if pendiente:
+            cola_geocodificacion.encolar('usuario', usuario.id, usuario.direccion)
+        return jsonify({"mensaje": "Perfil actualizado correctamente", "geocode_estado": usuario.geocode_estado}), 200
 
     except Exception as e:
         db.session.rollback()
@@ -278,17 +578,37 @@ def api_actualizar_usuario():
 # --- RUTAS DE BÚSQUEDA GEOGRÁFICA (SISTEMA NUEVO) ---
 
 @app.route('/api/proveedores/cercanos')
+@presupuesto_consultas(4)
 def api_proveedores_cercanos():
     """
     Algoritmo:
     1. Obtener lat/lon del usuario actual.
-    2. Obtener todos los proveedores.
-    3. Calcular distancia Haversine con cada uno.
-    4. Ordenar y devolver los más cercanos.
+    2. Buscar los proveedores más cercanos, ordenados por distancia (en SQL
+       o con el índice en memoria, según CERCANOS_BACKEND). Con `radio_km`
+       solo los que estén dentro de ese radio; sin él, sin tope de distancia.
+    3. Devolver a lo más `limit` resultados. Si hay más, el header
+       X-Next-Cursor trae el cursor para pedir la siguiente página.
     """
     if 'user_id' not in session or session['user_type'] != 'usuario':
         return jsonify({"error": "No autorizado"}), 401
 
+    radio_km = request.args.get('radio_km', type=float)
+    limite = request.args.get('limit', 20, type=int)
+    radio_invalido = 'radio_km' in request.args and (radio_km is None or radio_km <= 0)
+    if radio_invalido or limite is None or limite <= 0:
+        return jsonify({"error": "Parámetros radio_km/limit inválidos"}), 400
+    if radio_km is not None:
+        radio_km = min(radio_km, app.config['CERCANOS_RADIO_MAX_KM'])
+    limite = min(limite, app.config['CERCANOS_LIMITE_MAX'])
+
+    despues_de = None
+    if request.args.get('cursor'):
+        try:
+            dist_cursor, id_cursor = _decodificar_cursor(request.args['cursor'])
+            despues_de = (float(dist_cursor), int(id_cursor))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Cursor inválido"}), 400
+
     try:
         usuario = Usuario.query.get(session['user_id'])
         
@@ -301,33 +621,18 @@ def api_proveedores_cercanos():
                 resultados.append(_serializar_proveedor(p, prom, total, distancia_km=None))
             return jsonify(resultados)
 
-        # Caso B: Usuario con ubicación -> Calcular distancias
-        user_coords = (usuario.lat, usuario.lon)
-        todos_proveedores = _get_base_query_proveedores_con_calif().all()
-        
-        lista_con_distancia = []
-        for p, prom, total in todos_proveedores:
-            # Solo calculamos si el proveedor también tiene coordenadas
-            if p.lat and p.lon:
-                prov_coords = (p.lat, p.lon)
-                distancia = haversine(user_coords, prov_coords) # Devuelve KM por defecto
-                lista_con_distancia.append({
-                    "obj": p, "prom": prom, "total": total, "dist": distancia
-                })
-        
-        # Ordenamos por distancia (menor a mayor)
-        lista_con_distancia.sort(key=lambda x: x['dist'])
-        
-        # Tomamos los 20 más cercanos
-        top_cercanos = lista_con_distancia[:20]
+        # Caso B: Usuario con ubicación -> Buscar por distancia
+        top_cercanos = _buscar_proveedores_cercanos(usuario.lat, usuario.lon, radio_km, limite, despues_de)
         
         json_response = []
-        for item in top_cercanos:
-            json_response.append(_serializar_proveedor(
-                item['obj'], item['prom'], item['total'], item['dist']
-            ))
+        for p, prom, total, dist in top_cercanos:
+            json_response.append(_serializar_proveedor(p, prom, total, dist))
             
-        return jsonify(json_response)
+        respuesta = jsonify(json_response)
+        if len(top_cercanos) == limite:
+            ultimo = top_cercanos[-1]
+            respuesta.headers['X-Next-Cursor'] = _codificar_cursor(ultimo[3], ultimo[0].id)
+        return respuesta
 
     except Exception as e:
         print(f"!!! ERROR en /api/proveedores/cercanos: {e}") 
@@ -335,40 +640,75 @@ def api_proveedores_cercanos():
 
 
 @app.route('/api/buscar')
+@presupuesto_consultas(2)
 def api_buscar():
     if 'user_id' not in session or session['user_type'] != 'usuario':
         return jsonify({"error": "No autorizado"}), 401
 
     query = request.args.get('q', '')
+    limite = request.args.get('limit', 20, type=int)
+    if limite is None or limite <= 0:
+        return jsonify({"error": "Parámetro limit inválido"}), 400
+    limite = min(limite, app.config['BUSCAR_LIMITE_MAX'])
+
+    despues_de = None
+    if request.args.get('cursor'):
+        try:
+            rank_cursor, calif_cursor, id_cursor = _decodificar_cursor(request.args['cursor'])
+            despues_de = (float(rank_cursor), float(calif_cursor), int(id_cursor))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Cursor inválido"}), 400
     
     try:
-        base_query = _get_base_query_proveedores_con_calif() 
-        
-        if query:
-            termino_busqueda = f"%{query}%"
-            # Buscamos en Oficio, Descripción y ahora DIRECCIÓN
-            base_query = base_query.filter(
-                (Proveedor.oficio.ilike(termino_busqueda)) |
-                (Proveedor.descripcion.ilike(termino_busqueda)) |
-                (Proveedor.direccion.ilike(termino_busqueda))
+        if _terminos_busqueda(query):
+            # Buscamos en Oficio, Descripción y Dirección, ordenado por relevancia
+            base_query, rank = _query_busqueda_texto(query)
+        else:
+            rank = db.literal(0.0).label('rank')
+            base_query = _get_base_query_proveedores_con_calif().add_columns(rank)
+
+        # Orden estable: relevancia desc, calificación desc, id asc.
+        # Keyset: negamos las columnas descendentes para comparar la tupla completa.
+        pagina = base_query
+        if despues_de is not None:
+            rank_cursor, calif_cursor, id_cursor = despues_de
+            pagina = pagina.filter(
+                tuple_(-rank, -Proveedor.calif_promedio, Proveedor.id) > tuple_(-rank_cursor, -calif_cursor, id_cursor)
             )
-
-        proveedores_con_calif = base_query.all()
+        proveedores_con_calif = pagina.order_by(rank.desc(), Proveedor.calif_promedio.desc(), Proveedor.id)\
+            .limit(limite).all()
         
         # Serializamos (en este endpoint de búsqueda por texto no calculamos distancia obligatoriamente)
         lista_proveedores = []
-        for p, prom, total in proveedores_con_calif:
+        for p, prom, total, _rank in proveedores_con_calif:
             lista_proveedores.append(_serializar_proveedor(p, prom, total))
             
-        return jsonify(lista_proveedores)
+        respuesta = jsonify(lista_proveedores)
+        if len(proveedores_con_calif) == limite:
+            p, prom, _total, ultimo_rank = proveedores_con_calif[-1]
+            respuesta.headers['X-Next-Cursor'] = _codificar_cursor(float(ultimo_rank), float(prom), p.id)
+        if despues_de is None:
+            respuesta.headers['X-Total-Estimate'] = str(_estimar_filas(base_query))
+        return respuesta
     
     except Exception as e:
         print(f"!!! ERROR en /api/buscar: {e}") 
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/autocompletar')
+@presupuesto_consultas(1)
+def api_autocompletar():
+    """Sugerencias para el buscador desde el trie en memoria (sin ir a la BD)."""
+    if 'user_id' not in session or session['user_type'] != 'usuario':
+        return jsonify({"error": "No autorizado"}), 401
+
+    limite = request.args.get('limit', 8, type=int)
+    return jsonify(_obtener_trie_oficios().sugerir(request.args.get('q', ''), limite))
+
 # --- RUTAS DE CHAT Y MENSAJERÍA ---
     
 @app.route('/api/iniciar_chat/<int:proveedor_id>', methods=['POST'])
+@presupuesto_consultas(2)
 def api_iniciar_chat(proveedor_id):
     if 'user_id' not in session or session['user_type'] != 'usuario':
         return jsonify({"error": "No autorizado"}), 401
@@ -411,93 +751,308 @@ def vista_conversacion(conv_id):
         return abort(403) 
     return render_template('conversacion.html', conv_id=conv_id, user_tipo_actual=user_type)
 
+# Conversaciones sin mensajes ni trabajos quedan al final de la bandeja
+_SIN_ACTIVIDAD = datetime(1970, 1, 1)
+
+def _marca_lectura(user_type):
+    """Columnas (timestamp, id) del último mensaje leído por el participante."""
+    if user_type == 'usuario':
+        return Conversacion.leido_usuario_ts, Conversacion.leido_usuario_id
+    return Conversacion.leido_proveedor_ts, Conversacion.leido_proveedor_id
+
+def _query_bandeja(user_id, user_type):
+    """
+    Conversaciones del usuario con su último mensaje, cantidad de no leídos y
+    trabajo abierto, en una sola consulta (dos LATERAL y un conteo correlacionado).
+    Retorna (query, actividad) para ordenar/paginar por actividad.
+    """
+    ultimo = db.select(Mensaje.contenido, Mensaje.remitente_tipo, Mensaje.timestamp)\
+        .where(Mensaje.conversacion_id == Conversacion.id)\
+        .order_by(Mensaje.timestamp.desc(), Mensaje.id.desc()).limit(1).lateral('ultimo')
+    trabajo = db.select(Trabajo.id, Trabajo.estado, Trabajo.monto, Trabajo.timestamp_creacion)\
+        .where(Trabajo.conversacion_id == Conversacion.id, Trabajo.estado != 'FINALIZADO')\
+        .order_by(Trabajo.timestamp_creacion.desc(), Trabajo.id.desc()).limit(1).lateral('trabajo')
+
+    if user_type == 'usuario':
+        otro, filtro, detalle = Proveedor, Conversacion.usuario_id == user_id, Proveedor.oficio
+    else:
+        otro, filtro, detalle = Usuario, Conversacion.proveedor_id == user_id, db.literal('Cliente')
+    no_leidos = db.select(func.count()).where(
+        Mensaje.conversacion_id == Conversacion.id,
+        tuple_(Mensaje.timestamp, Mensaje.id) > tuple_(*_marca_lectura(user_type)),
+        Mensaje.remitente_tipo != user_type
+    ).scalar_subquery()
+    # greatest() ignora los NULL: la última actividad es el último mensaje o la cotización abierta
+    actividad = func.coalesce(func.greatest(ultimo.c.timestamp, trabajo.c.timestamp_creacion), _SIN_ACTIVIDAD)
+
+    query = db.select(
+        Conversacion.id,
+        otro.nombre_completo.label('otro_participante'),
+        detalle.label('detalle'),
+        ultimo.c.contenido, ultimo.c.remitente_tipo, ultimo.c.timestamp,
+        no_leidos.label('no_leidos'),
+        trabajo.c.id.label('trabajo_id'), trabajo.c.estado.label('trabajo_estado'), trabajo.c.monto.label('trabajo_monto'),
+        actividad.label('actividad')
+    ).select_from(Conversacion)\
+        .join(otro, otro.id == (Conversacion.proveedor_id if user_type == 'usuario' else Conversacion.usuario_id))\
+        .outerjoin(ultimo, db.true())\
+        .outerjoin(trabajo, db.true())\
+        .where(filtro)
+    return query, actividad
+
+def _resumen_mensaje(contenido, remitente_tipo, timestamp):
+    return {
+        "contenido": contenido[:120],
+        "remitente_tipo": remitente_tipo,
+        "timestamp": timestamp.strftime("%d/%m %H:%M")
+    }
+
+def _resumen_trabajo(trabajo_id, estado, monto):
+    """Trabajo abierto de la conversación (None si no hay o ya terminó)."""
+    if trabajo_id is None or estado == 'FINALIZADO':
+        return None
+    return {"id": trabajo_id, "estado": estado, "monto": monto}
+
+def _serializar_conversacion_bandeja(fila):
+    return {
+        "id": fila.id,
+        "otro_participante": fila.otro_participante,
+        "detalle": fila.detalle,
+        "ultimo_mensaje": _resumen_mensaje(fila.contenido, fila.remitente_tipo, fila.timestamp) if fila.timestamp else None,
+        "actividad": fila.actividad.strftime("%d/%m %H:%M") if fila.actividad != _SIN_ACTIVIDAD else None,
+        "no_leidos": fila.no_leidos,
+        "trabajo": _resumen_trabajo(fila.trabajo_id, fila.trabajo_estado, fila.trabajo_monto)
+    }
+
 @app.route('/api/conversaciones')
+@presupuesto_consultas(1)
 def api_get_conversaciones():
+    """
+    Bandeja de entrada ordenada por actividad reciente, paginada con
+    ?cursor= (el siguiente va en X-Next-Cursor). ?conv_id= trae solo esa conversación.
+    """
     if 'user_id' not in session: return jsonify({"error": "No autorizado"}), 401
     user_id = session['user_id']
     user_type = session['user_type']
-    lista_convos = []
-    if user_type == 'usuario':
-        conversaciones = db.session.query(Conversacion, Proveedor.nombre_completo, Proveedor.oficio)\
-            .join(Proveedor, Conversacion.proveedor_id == Proveedor.id)\
-            .filter(Conversacion.usuario_id == user_id).all()
-        for conv, nombre, oficio in conversaciones:
-            lista_convos.append({"id": conv.id, "otro_participante": nombre, "detalle": oficio})
-    else:
-        conversaciones = db.session.query(Conversacion, Usuario.nombre_completo)\
-            .join(Usuario, Conversacion.usuario_id == Usuario.id)\
-            .filter(Conversacion.proveedor_id == user_id).all()
-        for conv, nombre in conversaciones:
-             lista_convos.append({"id": conv.id, "otro_participante": nombre, "detalle": "Cliente"})
-    return jsonify(lista_convos)
 
-# En routes.py
+    limite = request.args.get('limit', app.config['BANDEJA_PAGINA'], type=int)
+    if limite is None or limite <= 0:
+        return jsonify({"error": "Parámetro limit inválido"}), 400
+    limite = min(limite, app.config['BANDEJA_LIMITE_MAX'])
+
+    query, actividad = _query_bandeja(user_id, user_type)
+    if request.args.get('conv_id', type=int):
+        query = query.where(Conversacion.id == request.args.get('conv_id', type=int))
+    if request.args.get('cursor'):
+        try:
+            actividad_cursor, id_cursor = _decodificar_cursor(request.args['cursor'])
+            despues_de = (datetime.fromisoformat(actividad_cursor), int(id_cursor))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Cursor inválido"}), 400
+        query = query.where(tuple_(actividad, Conversacion.id) < tuple_(*despues_de))
+
+    filas = db.session.execute(query.order_by(actividad.desc(), Conversacion.id.desc()).limit(limite)).all()
+    respuesta = jsonify([_serializar_conversacion_bandeja(fila) for fila in filas])
+    if len(filas) == limite:
+        respuesta.headers['X-Next-Cursor'] = _codificar_cursor(filas[-1].actividad.isoformat(), filas[-1].id)
+    return respuesta
+
+@lru_cache(maxsize=10000)
+def _participantes_conversacion(conv_id):
+    """(usuario_id, proveedor_id) de una conversación; no cambian, así que se guardan en memoria."""
+    fila = db.session.query(Conversacion.usuario_id, Conversacion.proveedor_id).filter_by(id=conv_id).one()
+    return fila.usuario_id, fila.proveedor_id
+
+def _emitir_bandeja(conv_id, cambios, no_leido_para=None):
+    """
+    Envía a la sala personal de ambos participantes los cambios de una
+    conversación para su bandeja (evento inbox_update). no_leido_para: el
+    tipo ('usuario' o 'proveedor') al que se le suma un mensaje no leído.
+    """
+    usuario_id, proveedor_id = _participantes_conversacion(conv_id)
+    for tipo, entidad_id in (('usuario', usuario_id), ('proveedor', proveedor_id)):
+        payload = dict(cambios, conv_id=conv_id, no_leidos_incremento=1 if tipo == no_leido_para else 0)
+        socketio.emit("inbox_update", payload, room=_sala_personal(tipo, entidad_id))
+
+def _marcar_leido(conv_id, user_type, user_id, hasta=None):
+    """
+    Avanza la marca de lectura del participante hasta la posición (timestamp, id)
+    de un mensaje, o hasta el último mensaje guardado si hasta es None. La marca
+    nunca retrocede.
+    """
+    marca_ts, marca_id = _marca_lectura(user_type)
+    if hasta is None:
+        ultimo = db.select(Mensaje.timestamp, Mensaje.id).where(Mensaje.conversacion_id == conv_id)\
+            .order_by(Mensaje.timestamp.desc(), Mensaje.id.desc()).limit(1).subquery()
+        hasta = (ultimo.c.timestamp, ultimo.c.id)
+    db.session.execute(
+        update(Conversacion)
+        .where(Conversacion.id == conv_id, tuple_(marca_ts, marca_id) < tuple_(*hasta))
+        .values({marca_ts: hasta[0], marca_id: hasta[1]})
+    )
+    db.session.commit()
+    # Las otras pestañas del mismo usuario ponen el contador en cero
+    socketio.emit("inbox_update", {"conv_id": conv_id, "no_leidos": 0}, room=_sala_personal(user_type, user_id))
+
+def _es_participante(conv):
+    """True si el usuario de la sesión es el cliente o el proveedor de la conversación."""
+    user_id = session['user_id']
+    user_type = session['user_type']
+    return (user_type == 'usuario' and conv.usuario_id == user_id) or \
+           (user_type == 'proveedor' and conv.proveedor_id == user_id)
+
+def _cursor_historial(timestamp, tipo, item_id):
+    """Posición de un elemento del historial en el orden (timestamp, tipo, id)."""
+    return _codificar_cursor(timestamp.isoformat(), tipo, item_id)
+
+def _historial_conversacion(conv_id, limite, antes_de=None, desde=None):
+    """
+    Mensajes y trabajos de una conversación mezclados en SQL (UNION ALL),
+    en orden cronológico (timestamp, tipo, id).
+
+    - Sin cursores: los últimos `limite` elementos.
+    - antes_de: los `limite` elementos anteriores a ese cursor (scroll hacia arriba).
+    - desde: los `limite` elementos posteriores a ese cursor (reconexión).
+
+    Retorna (items, cursor_anterior, cursor_ultimo, hay_mas).
+    """
+    mensajes = db.select(
+        db.literal('mensaje').label('tipo'),
+        Mensaje.id.label('id'),
+        Mensaje.timestamp.label('ts'),
+        Mensaje.contenido.label('contenido'),
+        Mensaje.remitente_tipo.label('remitente_tipo'),
+        db.cast(db.null(), db.Integer).label('monto'),
+        db.cast(db.null(), db.String).label('estado')
+    ).where(Mensaje.conversacion_id == conv_id)
+    trabajos = db.select(
+        db.literal('sistema_trabajo'),
+        Trabajo.id,
+        Trabajo.timestamp_creacion,
+        Trabajo.descripcion,
+        db.cast(db.null(), db.String),
+        Trabajo.monto,
+        Trabajo.estado
+    ).where(Trabajo.conversacion_id == conv_id)
+    historial = db.union_all(mensajes, trabajos).subquery()
+    posicion = tuple_(historial.c.ts, historial.c.tipo, historial.c.id)
+
+    query = db.select(historial)
+    if desde is not None:
+        query = query.where(posicion > tuple_(*desde))\
+            .order_by(historial.c.ts, historial.c.tipo, historial.c.id)
+    else:
+        if antes_de is not None:
+            query = query.where(posicion < tuple_(*antes_de))
+        query = query.order_by(historial.c.ts.desc(), historial.c.tipo.desc(), historial.c.id.desc())
+    # Pedimos uno extra para saber si quedan más
+    filas = db.session.execute(query.limit(limite + 1)).all()
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    if desde is None:
+        filas.reverse()
+
+    items = []
+    for fila in filas:
+        item = {"tipo": fila.tipo, "timestamp": fila.ts.strftime("%d/%m %H:%M")}
+        if fila.tipo == 'mensaje':
+            item.update({"id": fila.id, "contenido": fila.contenido, "remitente_tipo": fila.remitente_tipo})
+        else:
+            # Definimos el subtipo para que el JS sepa qué color usar
+            subtipo = "cotizacion"
+            if fila.estado == 'PAGADO': subtipo = "pago_confirmado"
+            elif fila.estado == 'FINALIZADO': subtipo = "trabajo_finalizado"
+            item.update({
+                "trabajo_id": fila.id,
+                "estado": fila.estado,
+                "subtipo": subtipo,
+                "monto": fila.monto,
+                "descripcion": fila.contenido,
+                "mensaje": fila.contenido # Fallback
+            })
+        items.append(item)
+
+    cursor_anterior = cursor_ultimo = None
+    if filas:
+        cursor_anterior = _cursor_historial(filas[0].ts, filas[0].tipo, filas[0].id)
+        cursor_ultimo = _cursor_historial(filas[-1].ts, filas[-1].tipo, filas[-1].id)
+    elif desde is not None:
+        cursor_ultimo = _codificar_cursor(desde[0].isoformat(), desde[1], desde[2])
+    return items, cursor_anterior, cursor_ultimo, hay_mas
+
+def _decodificar_cursor_historial(texto):
+    ts, tipo, item_id = _decodificar_cursor(texto)
+    return datetime.fromisoformat(ts), str(tipo), int(item_id)
 
 @app.route('/api/conversacion/<int:conv_id>/detalles')
+@presupuesto_consultas(3)
 def api_get_detalles_conv(conv_id):
+    """Datos de la conversación más la última página del historial."""
     if 'user_id' not in session: return jsonify({"error": "No autorizado"}), 401
     
-    conv = Conversacion.query.get_or_404(conv_id)
-    user_id = session['user_id']
     user_type = session['user_type']
+    # El nombre del otro participante en la misma consulta (sin cargar conv.proveedor/conv.usuario aparte)
+    otro = Proveedor if user_type == 'usuario' else Usuario
+    otro_id = Conversacion.proveedor_id if user_type == 'usuario' else Conversacion.usuario_id
+    fila = db.session.execute(
+        select(Conversacion, otro.nombre_completo).join(otro, otro.id == otro_id).where(Conversacion.id == conv_id)
+    ).first()
+    if fila is None:
+        abort(404)
+    conv, otro_nombre = fila
     
     # Verificación de seguridad
-    if (user_type == 'usuario' and conv.usuario_id != user_id) or \
-       (user_type == 'proveedor' and conv.proveedor_id != user_id):
+    if not _es_participante(conv):
         return jsonify({"error": "No autorizado"}), 403
 
-    otro_nombre = conv.proveedor.nombre_completo if user_type == 'usuario' else conv.usuario.nombre_completo
+    # Antes del commit de _marcar_leido, que expira conv
+    proveedor_id = conv.proveedor_id
+    historial, cursor_anterior, cursor_ultimo, hay_mas = _historial_conversacion(conv_id, app.config['HISTORIAL_PAGINA'])
+    _marcar_leido(conv_id, user_type, session['user_id'])
     
-    lista_historial = []
-
-    # 1. Obtener MENSAJES de texto
-    mensajes_db = Mensaje.query.filter_by(conversacion_id=conv_id).all()
-    for msg in mensajes_db:
-        lista_historial.append({
-            "tipo": "mensaje",
-            "contenido": msg.contenido,
-            "remitente_tipo": msg.remitente_tipo,
-            "timestamp_dt": msg.timestamp,
-            "timestamp": msg.timestamp.strftime("%d/%m %H:%M") 
-        })
-
-    # 2. Obtener TRABAJOS (Cotizaciones) - AQUÍ ESTABA EL ERROR
-    trabajos_db = Trabajo.query.filter_by(conversacion_id=conv_id).all()
-    
-    for job in trabajos_db:
-        # Definimos el subtipo para que el JS sepa qué color usar
-        subtipo = "cotizacion"
-        if job.estado == 'PAGADO': subtipo = "pago_confirmado"
-        elif job.estado == 'FINALIZADO': subtipo = "trabajo_finalizado"
+    return jsonify({
+        "otro_nombre": otro_nombre,
+        "historial": historial,
+        "cursor_anterior": cursor_anterior if hay_mas else None,
+        "cursor_ultimo": cursor_ultimo,
+        "proveedor_id": proveedor_id if user_type == 'usuario' else None
+    })
 
-        lista_historial.append({
-            "tipo": "sistema_trabajo",
-            "trabajo_id": job.id,
-            "estado": job.estado,
-            "subtipo": subtipo,
-            # --- DATOS CLAVE QUE FALTABAN ---
-            "monto": job.monto,          
-            "descripcion": job.descripcion,
-            "mensaje": job.descripcion, # Fallback
-            # -------------------------------
-            "timestamp_dt": job.timestamp_creacion,
-            "timestamp": job.timestamp_creacion.strftime("%d/%m %H:%M")
-        })
+@app.route('/api/conversacion/<int:conv_id>/historial')
+@presupuesto_consultas(2)
+def api_get_historial_conv(conv_id):
+    """
+    Historial paginado. ?before=<cursor> trae elementos más antiguos (scroll
+    infinito); ?since=<cursor> trae los que llegaron después (reconexión).
+    """
+    if 'user_id' not in session: return jsonify({"error": "No autorizado"}), 401
+    conv = Conversacion.query.get_or_404(conv_id)
+    if not _es_participante(conv):
+        return jsonify({"error": "No autorizado"}), 403
 
-    # 3. Ordenar por fecha (mezclando mensajes y trabajos)
-    lista_historial.sort(key=lambda x: x['timestamp_dt'])
+    limite = request.args.get('limit', app.config['HISTORIAL_PAGINA'], type=int)
+    if limite is None or limite <= 0:
+        return jsonify({"error": "Parámetro limit inválido"}), 400
+    limite = min(limite, app.config['HISTORIAL_LIMITE_MAX'])
 
-    # 4. Limpieza final (borrar el objeto datetime que no es serializable)
-    for item in lista_historial:
-        del item['timestamp_dt']
-    
+    try:
+        antes_de = _decodificar_cursor_historial(request.args['before']) if request.args.get('before') else None
+        desde = _decodificar_cursor_historial(request.args['since']) if request.args.get('since') else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "Cursor inválido"}), 400
+    if antes_de is not None and desde is not None:
+        return jsonify({"error": "Use before o since, no ambos"}), 400
+
+    historial, cursor_anterior, cursor_ultimo, hay_mas = _historial_conversacion(conv_id, limite, antes_de, desde)
     return jsonify({
-        "otro_nombre": otro_nombre,
-        "historial": lista_historial,
-        "proveedor_id": conv.proveedor_id if user_type == 'usuario' else None
+        "historial": historial,
+        "cursor_anterior": cursor_anterior if (hay_mas and desde is None) else None,
+        "cursor_ultimo": cursor_ultimo,
+        "hay_mas": hay_mas
     })
 
 @app.route('/api/conversacion/<int:conv_id>/enviar', methods=['POST'])
+@presupuesto_consultas(3)
 def api_enviar_mensaje(conv_id):
     if 'user_id' not in session: return jsonify({"error": "No autorizado"}), 401
     conv = Conversacion.query.get_or_404(conv_id)
@@ -510,24 +1065,47 @@ def api_enviar_mensaje(conv_id):
     contenido = datos.get('contenido', '').strip()
     if not contenido: return jsonify({"error": "Mensaje vacío"}), 400
     try:
-        nuevo_mensaje = Mensaje(conversacion_id=conv_id, remitente_id=user_id, remitente_tipo=user_type, contenido=contenido)
-        db.session.add(nuevo_mensaje)
-        db.session.commit()
-        payload = {
-            "contenido": nuevo_mensaje.contenido,
-            "remitente_tipo": nuevo_mensaje.remitente_tipo,
-            "timestamp": nuevo_mensaje.timestamp.strftime("%d/%m %H:%M")
-        }
-        room = f"chat_{conv_id}"
-        socketio.emit("receive_message", payload, room=room)
+        _guardar_y_emitir_mensaje(conv_id, user_id, user_type, contenido)
         return jsonify({"mensaje": "Enviado"}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+def _guardar_y_emitir_mensaje(conv_id, remitente_id, remitente_tipo, contenido):
+    """Guarda el mensaje, lo emite a la sala del chat y retorna el payload emitido."""
+    # Con write-behind se escribe después en lote; si el buffer está lleno, se guarda aquí
+    nuevo_mensaje = None
+    if buffer_mensajes is not None:
+        fila = buffer_mensajes.agregar(conv_id, remitente_id, remitente_tipo, contenido)
+        if fila is not None:
+            nuevo_mensaje = Mensaje(**fila)
+    if nuevo_mensaje is None:
+        # timestamp UTC sin zona, igual que el buffer: es el valor que queda en la columna
+        nuevo_mensaje = Mensaje(conversacion_id=conv_id, remitente_id=remitente_id, remitente_tipo=remitente_tipo,
+                                contenido=contenido, timestamp=datetime.now(timezone.utc).replace(tzinfo=None))
+        db.session.add(nuevo_mensaje)
+        db.session.flush()
+    # Antes del commit: después los atributos quedan expirados y leerlos haría otro SELECT
+    payload = {
+        "id": nuevo_mensaje.id,
+        "contenido": nuevo_mensaje.contenido,
+        "remitente_tipo": nuevo_mensaje.remitente_tipo,
+        "timestamp": nuevo_mensaje.timestamp.strftime("%d/%m %H:%M"),
+        "cursor": _cursor_historial(nuevo_mensaje.timestamp, 'mensaje', nuevo_mensaje.id)
+    }
+    timestamp = nuevo_mensaje.timestamp
+    db.session.commit()
+    socketio.emit("receive_message", payload, room=_sala_chat(conv_id))
+    _emitir_bandeja(conv_id, {
+        "ultimo_mensaje": _resumen_mensaje(contenido, remitente_tipo, timestamp),
+        "actividad": payload["timestamp"]
+    }, no_leido_para='proveedor' if remitente_tipo == 'usuario' else 'usuario')
+    return payload
+
 # --- RUTAS DE CALIFICACIÓN Y PERFIL PÚBLICO ---
 
 @app.route('/api/calificar/<int:proveedor_id>', methods=['POST'])
+@presupuesto_consultas(4)
 def api_calificar(proveedor_id):
     if 'user_id' not in session or session['user_type'] != 'usuario':
         return jsonify({"error": "No autorizado"}), 401
@@ -541,18 +1119,25 @@ def api_calificar(proveedor_id):
         return jsonify({"error": "Puntuación debe ser un número entero entre 1 y 5"}), 400
     proveedor = Proveedor.query.get(proveedor_id)
     if not proveedor: return jsonify({"error": "Proveedor no encontrado"}), 404
-    calificacion_existente = Calificacion.query.filter_by(usuario_id=usuario_id, proveedor_id=proveedor_id).first()
     try:
+        # Bloqueamos la fila para que el delta se calcule sobre la nota vigente
+        calificacion_existente = Calificacion.query.filter_by(usuario_id=usuario_id, proveedor_id=proveedor_id)\
+            .with_for_update().first()
         if calificacion_existente:
+            delta = puntuacion - calificacion_existente.puntuacion
             calificacion_existente.puntuacion = puntuacion
             calificacion_existente.comentario = comentario
             calificacion_existente.timestamp = datetime.now(timezone.utc)
+            _ajustar_agregados_calificacion(proveedor_id, delta, 0)
             db.session.commit()
+            cache_respuestas.invalidar(_clave_perfil_proveedor(proveedor_id))
             return jsonify({"mensaje": "Calificación actualizada"}), 200
         else:
             nueva_calificacion = Calificacion(usuario_id=usuario_id, proveedor_id=proveedor_id, puntuacion=puntuacion, comentario=comentario)
             db.session.add(nueva_calificacion)
+            _ajustar_agregados_calificacion(proveedor_id, puntuacion, 1)
             db.session.commit()
+            cache_respuestas.invalidar(_clave_perfil_proveedor(proveedor_id))
             return jsonify({"mensaje": "Calificación enviada"}), 201
     except Exception as e:
         db.session.rollback()
@@ -573,7 +1158,14 @@ def perfil_proveedor(proveedor_id):
     return render_template('perfil_proveedor.html', proveedor_id=proveedor.id, proveedor_nombre=proveedor.nombre_completo)
 
 @app.route('/api/perfil/proveedor/<int:proveedor_id>')
+@presupuesto_consultas(3)
 def api_get_perfil_proveedor(proveedor_id):
+    clave = _clave_perfil_proveedor(proveedor_id)
+    en_cache = cache_respuestas.obtener(clave)
+    if en_cache is not None:
+        return _respuesta_json_cacheada(*en_cache)
+
+    version = cache_respuestas.version(clave)
     proveedor = Proveedor.query.get_or_404(proveedor_id)
     calificaciones_db = db.session.query(Calificacion, Usuario.nombre_completo)\
         .join(Usuario, Calificacion.usuario_id == Usuario.id)\
@@ -584,10 +1176,9 @@ def api_get_perfil_proveedor(proveedor_id):
         "nombre_usuario": u_nombre,
         "timestamp": c.timestamp.strftime("%d/%m/%Y")
     } for c, u_nombre in calificaciones_db]
-    portafolio_db = Portafolio.query.filter_by(proveedor_id=proveedor_id).order_by(Portafolio.timestamp.desc()).all()
-    portafolio_json = [{"id": i.id, "imagen_url": i.imagen_url, "descripcion": i.descripcion} for i in portafolio_db]
-    stats = db.session.query(func.avg(Calificacion.puntuacion).label('promedio'), func.count(Calificacion.id).label('total'))\
-        .filter(Calificacion.proveedor_id == proveedor_id).first()
+    portafolio_db = Portafolio.query.filter_by(proveedor_id=proveedor_id, estado='LISTO')\
+        .order_by(Portafolio.timestamp.desc()).all()
+    portafolio_json = [_serializar_portafolio(i) for i in portafolio_db]
     perfil_data = {
         "nombre": proveedor.nombre_completo,
         "oficio": proveedor.oficio,
@@ -595,18 +1186,20 @@ def api_get_perfil_proveedor(proveedor_id):
         "direccion": proveedor.direccion, # Usamos direccion
         "horario": proveedor.horario,
         "atiende_urgencias": proveedor.atiende_urgencias,
-        "calif_promedio": round(float(stats.promedio), 1) if stats.promedio else 0,
-        "calif_total": int(stats.total) if stats.total else 0,
+        "calif_promedio": round(float(proveedor.calif_promedio), 1) if proveedor.calif_promedio else 0,
+        "calif_total": proveedor.calif_total or 0,
         "calificaciones": calificaciones_json,
         "portafolio": portafolio_json,
         "telefono": proveedor.telefono
     }
-    return jsonify(perfil_data)
+    cuerpo = jsonify(perfil_data).get_data()
+    etag = cache_respuestas.guardar(clave, cuerpo, version)
+    return _respuesta_json_cacheada(cuerpo, etag)
 
 # --- RUTAS DE PORTAFOLIO (CON UPLOAD DE IMAGEN) ---
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 @app.route('/api/trabajo/crear', methods=['POST'])
 def api_crear_trabajo():
@@ -649,7 +1242,11 @@ def api_crear_trabajo():
             "estado": "COTIZADO",
             "mensaje": f"Se ha generado una cotización por ${monto}"
         }
-        socketio.emit("receive_message", payload, room=f"chat_{conv_id}")
+        socketio.emit("receive_message", payload, room=_sala_chat(conv_id))
+        _emitir_bandeja(conv_id, {
+            "trabajo": _resumen_trabajo(nuevo_trabajo.id, 'COTIZADO', monto),
+            "actividad": nuevo_trabajo.timestamp_creacion.strftime("%d/%m %H:%M")
+        })
 
         return jsonify({"mensaje": "Cotización enviada", "trabajo_id": nuevo_trabajo.id}), 201
 
@@ -701,7 +1298,8 @@ def api_pagar_trabajo(trabajo_id):
             "estado": "PAGADO",
             "mensaje": "¡Pago confirmado! El proveedor puede comenzar el trabajo."
         }
-        socketio.emit("receive_message", payload, room=f"chat_{trabajo.conversacion_id}")
+        socketio.emit("receive_message", payload, room=_sala_chat(trabajo.conversacion_id))
+        _emitir_bandeja(trabajo.conversacion_id, {"trabajo": _resumen_trabajo(trabajo.id, 'PAGADO', trabajo.monto)})
 
         return jsonify({"mensaje": "Pago exitoso"}), 200
 
@@ -739,7 +1337,8 @@ def api_terminar_trabajo(trabajo_id):
             "estado": "FINALIZADO",
             "mensaje": "Trabajo finalizado. ¡Por favor califica el servicio!"
         }
-        socketio.emit("receive_message", payload, room=f"chat_{trabajo.conversacion_id}")
+        socketio.emit("receive_message", payload, room=_sala_chat(trabajo.conversacion_id))
+        _emitir_bandeja(trabajo.conversacion_id, {"trabajo": None})
 
         return jsonify({"mensaje": "Trabajo finalizado"}), 200
 
@@ -762,31 +1361,86 @@ def api_add_portafolio():
         return jsonify({"error": "Nombre de archivo vacío"}), 400
 
     if file and allowed_file(file.filename):
+        # La original (con sus metadatos) queda en la carpeta privada hasta que
+        # la cola de imágenes genere las variantes públicas
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        carpeta = app.config['PORTAFOLIO_PENDIENTES_FOLDER']
+        temporal = os.path.join(carpeta, f"subida_{secrets.token_hex(8)}.{extension}")
+        ruta = None
+        igual = None
         try:
-            filename = secure_filename(file.filename)
-            unique_filename = f"{int(time.time())}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(filepath)
-            
-            imagen_url = url_for('static', filename=f'uploads/{unique_filename}')
+            # El hash se calcula mientras se escribe a disco, sin volver a leer el archivo
+            sha256, _ = guardar_con_hash(file.stream, temporal)
+            imagenes.validar(temporal, app.config['PORTAFOLIO_PIXELES_MAX'])
+
             proveedor_id = session['user_id']
-            nuevo_item = Portafolio(proveedor_id=proveedor_id, imagen_url=imagen_url, descripcion=descripcion)
+            # Si esta misma foto ya se procesó, reutilizamos sus variantes (sin copiar archivos)
+            igual = Portafolio.query.filter(
+                Portafolio.original_sha256 == sha256, Portafolio.estado == 'LISTO', Portafolio.variantes.isnot(None)
+            ).first()
+            nuevo_item = Portafolio(proveedor_id=proveedor_id, descripcion=descripcion, original_sha256=sha256,
+                                    imagen_url=igual.imagen_url if igual else '',
+                                    variantes=igual.variantes if igual else None,
+                                    estado='LISTO' if igual else 'PROCESANDO')
             db.session.add(nuevo_item)
+            if igual:
+                agregar_referencias(claves_de(igual.variantes))
+            else:
+                db.session.flush()
+                ruta = ruta_pendiente(nuevo_item.id)
+                os.replace(temporal, ruta)
             db.session.commit()
 
-            return jsonify({
-                "mensaje": "Trabajo subido con éxito", 
-                "item": {"id": nuevo_item.id, "imagen_url": nuevo_item.imagen_url, "descripcion": nuevo_item.descripcion}
-            }), 201
-
+        except imagenes.ImagenInvalida as e:
+            imagenes.borrar_archivos([temporal])
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             db.session.rollback()
+            imagenes.borrar_archivos([temporal] + ([ruta] if ruta else []))
             print(f"Error subiendo imagen: {e}")
             return jsonify({"error": "Error al guardar la imagen"}), 500
+
+        if igual:
+            imagenes.borrar_archivos([temporal])
+            cache_respuestas.invalidar(_clave_perfil_proveedor(proveedor_id))
+            return jsonify({"mensaje": "Trabajo subido con éxito", "item": _serializar_portafolio(nuevo_item)}), 201
+
+        # No aparece en el perfil público hasta quedar LISTO (aviso "portafolio_actualizado")
+        cola_imagenes.encolar(nuevo_item.id, proveedor_id, ruta)
+        return jsonify({
+            "mensaje": "Trabajo subido, procesando la imagen",
+            "item": _serializar_portafolio(nuevo_item)
+        }), 202
     else:
         return jsonify({"error": "Tipo de archivo no permitido"}), 400
 
+@app.route('/media/<clave>')
+def media(clave):
+    """
+    Archivos del almacén local. La URL incluye el hash del contenido, así que
+    nunca cambia: caché de un año sin revalidar. En producción conviene que el
+    servidor web sirva MEDIA_FOLDER directamente.
+    """
+    if not es_clave(clave) or not isinstance(almacen, AlmacenLocal):
+        abort(404)
+    respuesta = send_from_directory(os.path.dirname(almacen.ruta(clave)), clave,
+                                    etag=clave.split('.')[0], max_age=365 * 86400)
+    respuesta.cache_control.public = True
+    respuesta.cache_control.immutable = True
+    return respuesta
+
+@app.route('/api/portafolio/mio')
+@presupuesto_consultas(1)
+def api_mi_portafolio():
+    """Portafolio del proveedor en sesión, incluyendo fotos en proceso o fallidas."""
+    if 'user_id' not in session or session['user_type'] != 'proveedor':
+        return jsonify({"error": "No autorizado"}), 401
+    items = Portafolio.query.filter_by(proveedor_id=session['user_id'])\
+        .order_by(Portafolio.timestamp.desc()).all()
+    return jsonify([_serializar_portafolio(i) for i in items])
+
 @app.route('/api/portafolio/delete/<int:item_id>', methods=['DELETE'])
+@presupuesto_consultas(3)
 def api_delete_portafolio(item_id):
     if 'user_id' not in session or session['user_type'] != 'proveedor':
         return jsonify({"error": "No autorizado"}), 401
@@ -795,8 +1449,14 @@ def api_delete_portafolio(item_id):
     if item.proveedor_id != proveedor_id:
         return jsonify({"error": "No autorizado"}), 403 
     try:
+        # Los archivos los borra limpiar_archivos.py cuando ningún item los usa
+        liberar_referencias(claves_de(item.variantes))
+        pendiente = original_pendiente(item.id) if item.estado == 'PROCESANDO' else None
         db.session.delete(item)
         db.session.commit()
+        if pendiente:
+            imagenes.borrar_archivos([pendiente])
+        cache_respuestas.invalidar(_clave_perfil_proveedor(proveedor_id))
         return jsonify({"mensaje": "Trabajo eliminado"}), 200
     except Exception as e:
         db.session.rollback()
@@ -804,9 +1464,23 @@ def api_delete_portafolio(item_id):
 
 # --- SOCKET.IO HANDLERS ---
 
+def _conv_id_socket(data):
+    """
+    conv_id de un evento como int (None si falta o no es válido). La sala se
+    arma con este valor, así "05", "5" y 5 son siempre la misma sala.
+    """
+    conv_id = data.get("conv_id") if isinstance(data, dict) else None
+    if isinstance(conv_id, bool):
+        return None
+    try:
+        conv_id = int(conv_id)
+    except (TypeError, ValueError):
+        return None
+    return conv_id if conv_id > 0 else None
+
 @socketio.on("join")
 def handle_join(data):
-    conv_id = data.get("conv_id")
+    conv_id = _conv_id_socket(data)
     if not conv_id: return emit("error", {"message": "conv_id requerido"})
     if 'user_id' not in session: return emit("error", {"message": "No autorizado"})
     conv = Conversacion.query.get(conv_id)
@@ -816,14 +1490,58 @@ def handle_join(data):
     autorizado = (user_type == 'usuario' and conv.usuario_id == user_id) or \
                  (user_type == 'proveedor' and conv.proveedor_id == user_id)
     if not autorizado: return emit("error", {"message": "No autorizado"})
-    room = f"chat_{conv_id}"
+    room = _sala_chat(conv_id)
     join_room(room)
     print(f"[JOIN] user={user_id} tipo={user_type} -> room={room}")
     emit("joined", {"conv_id": conv_id})
 
+@socketio.on("send_message")
+def handle_send_message(data):
+    """
+    Envío de mensajes por el socket ya abierto (sin POST HTTP). El valor
+    retornado es el ack para el remitente: {"id", "timestamp", "cursor"} o {"error"}.
+    """
+    if 'user_id' not in session: return {"error": "No autorizado"}
+    conv_id = _conv_id_socket(data)
+    # Solo handle_join agrega el socket a la sala, después de validar que es participante
+    if not conv_id or _sala_chat(conv_id) not in rooms(): return {"error": "No autorizado"}
+    contenido = (data.get("contenido") or "").strip()
+    if not contenido: return {"error": "Mensaje vacío"}
+    try:
+        payload = _guardar_y_emitir_mensaje(conv_id, session['user_id'], session['user_type'], contenido)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error guardando mensaje por socket: {e}")
+        return {"error": "No se pudo guardar el mensaje"}
+    return {"id": payload["id"], "timestamp": payload["timestamp"], "cursor": payload["cursor"]}
+
+@socketio.on("marcar_leido")
+def handle_marcar_leido(data):
+    """
+    El chat abierto avisa hasta qué mensaje leyó (mensajes recibidos en vivo),
+    con el cursor del mensaje. No se compara con los mensajes ya guardados: con
+    write-behind el mensaje puede estar todavía en el buffer.
+    """
+    if 'user_id' not in session: return {"error": "No autorizado"}
+    conv_id = _conv_id_socket(data)
+    if not conv_id or _sala_chat(conv_id) not in rooms(): return {"error": "No autorizado"}
+    try:
+        timestamp, tipo, mensaje_id = _decodificar_cursor_historial(data.get("hasta"))
+    except (TypeError, ValueError):
+        return {"error": "hasta inválido"}
+    if tipo != 'mensaje':
+        return {"error": "hasta inválido"}
+    # No marcar como leídos mensajes futuros
+    timestamp = min(timestamp, datetime.now(timezone.utc).replace(tzinfo=None))
+    _marcar_leido(conv_id, session['user_type'], session['user_id'], (timestamp, mensaje_id))
+    return {"ok": True}
+
 @socketio.on("connect")
 def on_connect():
     print("Usuario conectado al socket:", request.sid)
+    # Sala personal para avisos que no son de un chat (ej: geocodificación lista)
+    if 'user_id' in session:
+        join_room(_sala_personal(session['user_type'], session['user_id']))
 
 @socketio.on("disconnect")
 def on_disconnect():
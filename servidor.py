@@ -0,0 +1,91 @@
+"""
+Punto de entrada con varios procesos (workers).
+
+Cada worker es un servidor Socket.IO (eventlet) completo escuchando en su
+propio puerto: --puerto, --puerto + 1, ... Los emits entre procesos viajan por
+SOCKETIO_MESSAGE_QUEUE (ver cola_socketio.py), que es obligatoria con más de
+un worker.
+
+Delante debe ir un balanceador con sesiones pegajosas (ej: nginx con ip_hash),
+porque el long-polling de Socket.IO exige que todas las peticiones de un mismo
+cliente lleguen al mismo proceso:
+
+    upstream zerby { ip_hash; server 127.0.0.1:5000; server 127.0.0.1:5001; }
+
+Uso:
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 python servidor.py --workers 2
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+
+def correr_worker(host, puerto):
+    from app import app, socketio
+    import routes  # noqa: F401  (registra las rutas y eventos)
+    print(f"[worker {os.getpid()}] escuchando en {host}:{puerto}")
+    socketio.run(app, host=host, port=puerto, debug=False, use_reloader=False, log_output=False)
+
+
+def correr_workers(args):
+    if args.workers > 1 and not os.getenv("SOCKETIO_MESSAGE_QUEUE"):
+        sys.exit("Con más de un worker hay que configurar SOCKETIO_MESSAGE_QUEUE "
+                 "(redis://..., amqp://... o postgresql://...)")
+
+    procesos = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker",
+                          "--host", args.host, "--puerto", str(args.puerto + i)])
+        for i in range(args.workers)
+    ]
+
+    deteniendo_desde = []
+
+    def terminar(*_):
+        # SIGTERM una sola vez: cada worker vacía su buffer de mensajes y sale
+        if deteniendo_desde:
+            return
+        deteniendo_desde.append(time.monotonic())
+        for proceso in procesos:
+            if proceso.poll() is None:
+                proceso.terminate()
+
+    signal.signal(signal.SIGTERM, terminar)
+    signal.signal(signal.SIGINT, terminar)
+
+    # Si un worker muere, bajamos todos: que el supervisor (systemd, docker) reinicie el conjunto
+    codigo, forzados = 0, []
+    while procesos:
+        for proceso in list(procesos):
+            resultado = proceso.poll()
+            if resultado is not None:
+                procesos.remove(proceso)
+                if resultado != 0 and codigo == 0 and not deteniendo_desde:
+                    codigo = resultado
+                    print(f"Worker {proceso.pid} terminó con código {resultado}; deteniendo el resto")
+                terminar()
+            elif deteniendo_desde and time.monotonic() - deteniendo_desde[0] > args.gracia \
+                    and proceso not in forzados:
+                forzados.append(proceso)
+                print(f"Worker {proceso.pid} no terminó en {args.gracia} s; se fuerza el cierre")
+                proceso.kill()
+        time.sleep(0.5)
+    return codigo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Levanta varios workers de la app, uno por puerto.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", 2)))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=5000, help="Puerto del primer worker")
+    parser.add_argument("--gracia", type=float, default=float(os.getenv("GRACIA_CIERRE", 15)),
+                        help="Segundos que tiene cada worker para vaciar sus buffers al detenerse antes de matarlo")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        correr_worker(args.host, args.puerto)
+    else:
+        sys.exit(correr_workers(args))
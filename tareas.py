@@ -0,0 +1,27 @@
+"""
+Utilidades para ejecutar trabajo fuera del request.
+
+Con eventlet (el modo por defecto de Flask-SocketIO aquí) todo corre en un
+solo hilo del sistema operativo: una llamada bloqueante (red, CPU) detiene a
+todos los sockets del proceso. ejecutar_bloqueante() manda esas llamadas al
+pool de hilos reales de eventlet (tpool) y en otros modos las llama directo.
+"""
+import threading
+
+from app import socketio
+
+
+def ejecutar_bloqueante(funcion, *args, **kwargs):
+    """Ejecuta funcion(*args, **kwargs) sin bloquear el loop de eventos y retorna su resultado."""
+    if socketio.async_mode == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(funcion, *args, **kwargs)
+    return funcion(*args, **kwargs)
+
+
+def crear_semaforo(cantidad):
+    """Semáforo para acotar trabajo concurrente; con eventlet espera sin bloquear el loop."""
+    if socketio.async_mode == 'eventlet':
+        from eventlet.semaphore import Semaphore
+        return Semaphore(cantidad)
+    return threading.BoundedSemaphore(cantidad)
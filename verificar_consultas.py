@@ -0,0 +1,116 @@
+"""
+Verifica el presupuesto de consultas SQL de las rutas frecuentes.
+
+Crea datos de prueba con varias filas por relación (conversaciones, mensajes,
+trabajos, calificaciones y fotos), para que una relación lazy leída en un for
+se note como sentencias repetidas, y llama a las rutas con el cliente de
+pruebas de Flask en PRESUPUESTO_CONSULTAS_MODO=error (ver
+presupuesto_consultas.py). Falla (código de salida 1) si alguna ruta excede
+el presupuesto declarado con @presupuesto_consultas o repite una sentencia.
+Los datos de prueba se borran al terminar.
+
+Uso (contra una BD de desarrollo ya migrada):
+    python verificar_consultas.py
+"""
+import os
+import sys
+
+os.environ['PRESUPUESTO_CONSULTAS_MODO'] = 'error'
+
+from app import app, db, Usuario, Proveedor, Conversacion, Mensaje, Trabajo, Calificacion, Portafolio  # noqa: E402
+from presupuesto_consultas import PresupuestoExcedido  # noqa: E402
+import routes  # noqa: E402,F401  (registra las rutas)
+
+MARCA = 'verificar-consultas'
+FILAS = 5
+
+
+def crear_datos():
+    usuarios = [Usuario(nombre_completo=f'{MARCA}-{i}', email=f'{MARCA}-u{i}@zerby.test', password_hash='-',
+                        lat=-33.45, lon=-70.66)
+                for i in range(FILAS)]
+    proveedores = [Proveedor(nombre_completo=f'{MARCA}-{i}', email=f'{MARCA}-p{i}@zerby.test', password_hash='-',
+                             telefono='0', oficio=MARCA, lat=-33.45 + i / 1000, lon=-70.66)
+                   for i in range(FILAS)]
+    db.session.add_all(usuarios + proveedores)
+    db.session.flush()
+    cliente, proveedor = usuarios[0], proveedores[0]
+
+    convs = [Conversacion(usuario_id=cliente.id, proveedor_id=p.id) for p in proveedores]
+    db.session.add_all(convs)
+    db.session.flush()
+    for conv in convs:
+        db.session.add_all([
+            Mensaje(conversacion_id=conv.id, remitente_id=cliente.id, remitente_tipo='usuario', contenido=str(i))
+            for i in range(FILAS)
+        ])
+        db.session.add_all([
+            Trabajo(conversacion_id=conv.id, proveedor_id=conv.proveedor_id, usuario_id=cliente.id,
+                    monto=1, descripcion=MARCA)
+            for _ in range(2)
+        ])
+    db.session.add_all([Calificacion(usuario_id=u.id, proveedor_id=proveedor.id, puntuacion=5) for u in usuarios])
+    db.session.add_all([Portafolio(proveedor_id=proveedor.id, imagen_url='-') for _ in range(FILAS)])
+    db.session.commit()
+    return [u.id for u in usuarios], [p.id for p in proveedores], convs[0].id
+
+
+def borrar_datos(usuario_ids, proveedor_ids):
+    db.session.rollback()
+    convs = [c.id for c in Conversacion.query.filter(Conversacion.usuario_id.in_(usuario_ids))]
+    Mensaje.query.filter(Mensaje.conversacion_id.in_(convs)).delete()
+    Trabajo.query.filter(Trabajo.conversacion_id.in_(convs)).delete()
+    Calificacion.query.filter(Calificacion.proveedor_id.in_(proveedor_ids)).delete()
+    Portafolio.query.filter(Portafolio.proveedor_id.in_(proveedor_ids)).delete()
+    Conversacion.query.filter(Conversacion.id.in_(convs)).delete()
+    Proveedor.query.filter(Proveedor.id.in_(proveedor_ids)).delete()
+    Usuario.query.filter(Usuario.id.in_(usuario_ids)).delete()
+    db.session.commit()
+
+
+def main():
+    app.testing = True  # PresupuestoExcedido llega hasta aquí en vez de ser un 500
+    fallas = 0
+    with app.app_context():
+        usuario_ids, proveedor_ids, conv_id = crear_datos()
+        try:
+            cliente, proveedor = app.test_client(), app.test_client()
+            with cliente.session_transaction() as s:
+                s['user_id'], s['user_type'] = usuario_ids[0], 'usuario'
+            with proveedor.session_transaction() as s:
+                s['user_id'], s['user_type'] = proveedor_ids[0], 'proveedor'
+
+            llamadas = [
+                ('GET /api/get_profile', lambda: cliente.get('/api/get_profile')),
+                ('GET /api/conversaciones (usuario)', lambda: cliente.get('/api/conversaciones')),
+                ('GET /api/conversaciones (proveedor)', lambda: proveedor.get('/api/conversaciones')),
+                ('POST /api/iniciar_chat', lambda: cliente.post(f'/api/iniciar_chat/{proveedor_ids[0]}')),
+                ('GET /api/conversacion/detalles', lambda: cliente.get(f'/api/conversacion/{conv_id}/detalles')),
+                ('GET /api/conversacion/historial', lambda: proveedor.get(f'/api/conversacion/{conv_id}/historial')),
+                ('POST /api/conversacion/enviar',
+                 lambda: cliente.post(f'/api/conversacion/{conv_id}/enviar', json={'contenido': MARCA})),
+                ('GET /api/proveedores/cercanos', lambda: cliente.get('/api/proveedores/cercanos')),
+                ('GET /api/buscar', lambda: cliente.get('/api/buscar', query_string={'q': MARCA})),
+                ('GET /api/autocompletar', lambda: cliente.get('/api/autocompletar', query_string={'q': 'ver'})),
+                ('POST /api/calificar', lambda: cliente.post(f'/api/calificar/{proveedor_ids[0]}', json={'puntuacion': 4})),
+                ('GET /api/perfil/proveedor', lambda: cliente.get(f'/api/perfil/proveedor/{proveedor_ids[0]}')),
+                ('GET /api/portafolio/mio', lambda: proveedor.get('/api/portafolio/mio')),
+            ]
+            for ruta, llamada in llamadas:
+                try:
+                    respuesta = llamada()
+                except PresupuestoExcedido as e:
+                    fallas += 1
+                    print(f"FALLA {e}")
+                    continue
+                if respuesta.status_code >= 400:
+                    raise RuntimeError(f"{ruta} respondió {respuesta.status_code}")
+        finally:
+            borrar_datos(usuario_ids, proveedor_ids)
+
+    print(f"{len(llamadas)} rutas revisadas, {fallas} sobre el presupuesto.")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Verifica que los emits crucen entre procesos a través de la cola de Socket.IO.
+
+Levanta dos workers con servidor.py, conecta un cliente websocket al worker A
+(unido a la sala del chat), envía un mensaje por HTTP al worker B y comprueba
+que el cliente lo recibe. Luego emite a la misma sala desde este proceso con
+emisor_externo() y comprueba que también llega. Crea un cliente, un proveedor
+y una conversación de prueba que se borran al terminar.
+
+Si SOCKETIO_MESSAGE_QUEUE no está configurada usa la propia BD (LISTEN/NOTIFY).
+
+Uso:
+    python verificar_multiproceso.py [--puerto 5600]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import simple_websocket
+
+os.environ.setdefault("SOCKETIO_MESSAGE_QUEUE", os.getenv("DATABASE_URL", ""))
+
+from app import app, db, Usuario, Proveedor, Conversacion, Mensaje  # noqa: E402
+from cola_socketio import emisor_externo  # noqa: E402
+
+MARCA = 'verificar-multiproceso'
+PASSWORD = 'clave-de-prueba'
+
+
+def crear_datos():
+    usuario = Usuario(nombre_completo=MARCA, email=f'{MARCA}-u@zerby.test')
+    usuario.set_password(PASSWORD)
+    proveedor = Proveedor(nombre_completo=MARCA, email=f'{MARCA}-p@zerby.test', telefono='0', oficio=MARCA)
+    proveedor.set_password(PASSWORD)
+    db.session.add_all([usuario, proveedor])
+    db.session.flush()
+    conv = Conversacion(usuario_id=usuario.id, proveedor_id=proveedor.id)
+    db.session.add(conv)
+    db.session.commit()
+    return usuario.id, proveedor.id, conv.id
+
+
+def borrar_datos(usuario_id, proveedor_id, conv_id):
+    db.session.rollback()
+    Mensaje.query.filter_by(conversacion_id=conv_id).delete()
+    Conversacion.query.filter_by(id=conv_id).delete()
+    Proveedor.query.filter_by(id=proveedor_id).delete()
+    Usuario.query.filter_by(id=usuario_id).delete()
+    db.session.commit()
+
+
+def esperar_worker(puerto, timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{puerto}/login", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.3)
+    raise RuntimeError(f"El worker del puerto {puerto} no respondió")
+
+
+def login(puerto, email):
+    peticion = urllib.request.Request(
+        f"http://127.0.0.1:{puerto}/api/login", method="POST",
+        data=json.dumps({"email": email, "password": PASSWORD}).encode(),
+        headers={"Content-Type": "application/json"})
+    respuesta = urllib.request.urlopen(peticion)
+    return respuesta.headers["Set-Cookie"].split(";")[0]
+
+
+def enviar_mensaje(puerto, cookie, conv_id, contenido):
+    peticion = urllib.request.Request(
+        f"http://127.0.0.1:{puerto}/api/conversacion/{conv_id}/enviar", method="POST",
+        data=json.dumps({"contenido": contenido}).encode(),
+        headers={"Content-Type": "application/json", "Cookie": cookie})
+    urllib.request.urlopen(peticion)
+
+
+class ClienteSocket:
+    """Cliente Socket.IO mínimo sobre websocket (protocolo Engine.IO v4)."""
+
+    def __init__(self, puerto, cookie):
+        self.ws = simple_websocket.Client(
+            f"ws://127.0.0.1:{puerto}/socket.io/?EIO=4&transport=websocket", headers={"Cookie": cookie})
+        self.ws.receive(timeout=5)  # Paquete "open" de Engine.IO
+        self.ws.send("40")
+        self.esperar_evento(None)
+
+    def emitir(self, evento, datos):
+        self.ws.send("42" + json.dumps([evento, datos]))
+
+    def esperar_evento(self, evento, timeout=10):
+        """Espera el evento dado (o la confirmación de conexión si es None) y retorna sus datos."""
+        limite = time.time() + timeout
+        while time.time() < limite:
+            paquete = self.ws.receive(timeout=max(0.1, limite - time.time()))
+            if paquete is None:
+                continue
+            if paquete == "2":
+                self.ws.send("3")  # ping -> pong
+            elif evento is None and paquete.startswith("40"):
+                return json.loads(paquete[2:] or "{}")
+            elif paquete.startswith("42"):
+                nombre, *datos = json.loads(paquete[2:])
+                if nombre == evento:
+                    return datos[0] if datos else None
+        raise TimeoutError(f"No llegó el evento {evento or 'connect'}")
+
+    def cerrar(self):
+        self.ws.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--puerto", type=int, default=5600)
+    args = parser.parse_args()
+    puerto_a, puerto_b = args.puerto, args.puerto + 1
+
+    with app.app_context():
+        usuario_id, proveedor_id, conv_id = crear_datos()
+    servidor = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "servidor.py"),
+         "--workers", "2", "--puerto", str(puerto_a)])
+    cliente = None
+    try:
+        esperar_worker(puerto_a)
+        esperar_worker(puerto_b)
+
+        cliente = ClienteSocket(puerto_a, login(puerto_a, f'{MARCA}-u@zerby.test'))
+        cliente.emitir("join", {"conv_id": conv_id})
+        cliente.esperar_evento("joined")
+
+        # 1. Mensaje HTTP en el worker B -> cliente conectado al worker A
+        enviar_mensaje(puerto_b, login(puerto_b, f'{MARCA}-p@zerby.test'), conv_id, "hola desde B")
+        recibido = cliente.esperar_evento("receive_message")
+        assert recibido["contenido"] == "hola desde B", recibido
+        print("OK: mensaje enviado al worker B llegó al cliente del worker A")
+
+        # 2. Emit desde un proceso externo (este script) -> cliente del worker A
+        emisor_externo(os.environ["SOCKETIO_MESSAGE_QUEUE"]).emit(
+            "receive_message", {"contenido": "x" * 5000}, room=f"chat_{conv_id}", namespace="/")
+        recibido = cliente.esperar_evento("receive_message")
+        assert recibido["contenido"] == "x" * 5000
+        print("OK: emit externo (mensaje largo) llegó al cliente del worker A")
+        return 0
+    finally:
+        if cliente is not None:
+            cliente.cerrar()
+        servidor.terminate()
+        servidor.wait(timeout=10)
+        with app.app_context():
+            borrar_datos(usuario_id, proveedor_id, conv_id)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
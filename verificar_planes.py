@@ -0,0 +1,152 @@
+"""
+Verifica que las consultas de las rutas frecuentes usen índices.
+
+Crea un cliente, un proveedor y una conversación de prueba, llama a las rutas
+con el cliente de pruebas de Flask capturando el SQL que ejecutan y corre
+EXPLAIN sobre cada consulta con enable_seqscan desactivado. Falla (código de
+salida 1) si alguna tabla de RUTAS_CALIENTES termina en un Seq Scan o en un
+recorrido completo de índice (sin Index Cond), lo que indica que falta el
+índice correspondiente. Los datos de prueba se borran al terminar.
+
+Uso (contra una BD de desarrollo ya migrada):
+    python verificar_planes.py
+"""
+import json
+import sys
+
+from sqlalchemy import event
+
+from app import app, db, Usuario, Proveedor, Conversacion, Mensaje, Trabajo, Calificacion, Portafolio
+import routes  # noqa: F401  (registra las rutas)
+
+# Tablas que no deben recorrerse completas en las rutas frecuentes
+TABLAS_CALIENTES = {'mensaje', 'trabajo', 'conversacion', 'calificacion', 'portafolio'}
+
+MARCA = 'verificar-planes'
+
+
+def crear_datos():
+    usuario = Usuario(nombre_completo=MARCA, email=f'{MARCA}-u@zerby.test')
+    usuario.password_hash = '-'
+    proveedor = Proveedor(nombre_completo=MARCA, email=f'{MARCA}-p@zerby.test', telefono='0', oficio=MARCA)
+    proveedor.password_hash = '-'
+    db.session.add_all([usuario, proveedor])
+    db.session.flush()
+    conv = Conversacion(usuario_id=usuario.id, proveedor_id=proveedor.id)
+    db.session.add(conv)
+    db.session.flush()
+    db.session.add_all([
+        Mensaje(conversacion_id=conv.id, remitente_id=usuario.id, remitente_tipo='usuario', contenido=str(i))
+        for i in range(5)
+    ])
+    db.session.add(Trabajo(conversacion_id=conv.id, proveedor_id=proveedor.id, usuario_id=usuario.id,
+                           monto=1, descripcion=MARCA))
+    db.session.add(Calificacion(usuario_id=usuario.id, proveedor_id=proveedor.id, puntuacion=5))
+    db.session.add(Portafolio(proveedor_id=proveedor.id, imagen_url='-'))
+    db.session.commit()
+    return usuario.id, proveedor.id, conv.id
+
+
+def borrar_datos(usuario_id, proveedor_id):
+    db.session.rollback()
+    convs = [c.id for c in Conversacion.query.filter_by(usuario_id=usuario_id)]
+    Mensaje.query.filter(Mensaje.conversacion_id.in_(convs)).delete()
+    Trabajo.query.filter(Trabajo.conversacion_id.in_(convs)).delete()
+    Calificacion.query.filter_by(proveedor_id=proveedor_id).delete()
+    Portafolio.query.filter_by(proveedor_id=proveedor_id).delete()
+    Conversacion.query.filter(Conversacion.id.in_(convs)).delete()
+    Proveedor.query.filter_by(id=proveedor_id).delete()
+    Usuario.query.filter_by(id=usuario_id).delete()
+    db.session.commit()
+
+
+def capturar_consultas(llamadas):
+    """Ejecuta las llamadas y retorna [(ruta, sql, parametros), ...] de los SELECT emitidos."""
+    consultas, ruta_actual = [], [None]
+
+    def al_ejecutar(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            consultas.append((ruta_actual[0], statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', al_ejecutar)
+    try:
+        for ruta, llamada in llamadas:
+            ruta_actual[0] = ruta
+            respuesta = llamada()
+            if respuesta.status_code >= 400:
+                raise RuntimeError(f"{ruta} respondió {respuesta.status_code}")
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', al_ejecutar)
+    return consultas
+
+
+def nodos(plan):
+    yield plan
+    for hijo in plan.get('Plans', []):
+        yield from nodos(hijo)
+
+
+def problemas_del_plan(plan):
+    """Retorna los recorridos completos sobre TABLAS_CALIENTES en un plan EXPLAIN (JSON)."""
+    encontrados = []
+    for nodo in nodos(plan):
+        tabla = nodo.get('Relation Name')
+        if tabla not in TABLAS_CALIENTES:
+            continue
+        tipo = nodo['Node Type']
+        if tipo == 'Seq Scan':
+            encontrados.append(f"Seq Scan en {tabla}")
+        elif tipo in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in nodo:
+            encontrados.append(f"recorrido completo de {nodo.get('Index Name')} en {tabla}")
+    return encontrados
+
+
+def verificar(consultas):
+    fallas = 0
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        for ruta, sql, parametros in consultas:
+            plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql, parametros).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            problemas = problemas_del_plan(plan[0]['Plan'])
+            if problemas:
+                fallas += 1
+                print(f"FALLA {ruta}: {', '.join(problemas)}\n    {' '.join(sql.split())}")
+        conn.rollback()
+    return fallas
+
+
+def main():
+    with app.app_context():
+        usuario_id, proveedor_id, conv_id = crear_datos()
+        try:
+            cliente, proveedor = app.test_client(), app.test_client()
+            with cliente.session_transaction() as s:
+                s['user_id'], s['user_type'] = usuario_id, 'usuario'
+            with proveedor.session_transaction() as s:
+                s['user_id'], s['user_type'] = proveedor_id, 'proveedor'
+
+            cursor = cliente.get(f'/api/conversacion/{conv_id}/detalles').get_json()['cursor_ultimo']
+            llamadas = [
+                ('GET /api/conversaciones (usuario)', lambda: cliente.get('/api/conversaciones')),
+                ('GET /api/conversaciones (proveedor)', lambda: proveedor.get('/api/conversaciones')),
+                ('POST /api/iniciar_chat', lambda: cliente.post(f'/api/iniciar_chat/{proveedor_id}')),
+                ('GET /api/conversacion/detalles', lambda: cliente.get(f'/api/conversacion/{conv_id}/detalles')),
+                ('GET /api/conversacion/historial?before',
+                 lambda: cliente.get(f'/api/conversacion/{conv_id}/historial', query_string={'before': cursor})),
+                ('GET /api/conversacion/historial?since',
+                 lambda: proveedor.get(f'/api/conversacion/{conv_id}/historial', query_string={'since': cursor})),
+                ('GET /api/perfil/proveedor', lambda: cliente.get(f'/api/perfil/proveedor/{proveedor_id}')),
+            ]
+            consultas = capturar_consultas(llamadas)
+            fallas = verificar(consultas)
+        finally:
+            borrar_datos(usuario_id, proveedor_id)
+
+    print(f"{len(consultas)} consultas revisadas, {fallas} con recorridos completos.")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())